@@ -14,15 +14,32 @@ import os
 NYT_api_key = os.environ.get('NYT_API_KEY')
 
 # PostgreSQL
-DB_NAME = 'nyt'
-DB_USER = 'postgres'
+DB_NAME = os.environ.get('DB_NAME', 'nyt')
+DB_USER = os.environ.get('DB_USER', 'postgres')
 DB_PASS = os.environ.get('DB_PASS')
-DB_HOST = 'postgres-service'
-DB_PORT = '5432'
+DB_HOST = os.environ.get('DB_HOST', 'postgres-service')
+DB_PORT = os.environ.get('DB_PORT', '5432')
 DB_ENGINE='postgresql://'+DB_USER+':'+DB_PASS+'@'+DB_HOST+':'+DB_PORT+'/'+DB_NAME
+DB_ASYNC_ENGINE='postgresql+asyncpg://'+DB_USER+':'+DB_PASS+'@'+DB_HOST+':'+DB_PORT+'/'+DB_NAME
+
+# PostgreSQL connection pool, shared by the connections of a process (see src/database.py)
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '5'))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', '10'))
+DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', '30'))  # seconds to wait for a free connection
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', '1800'))  # seconds after which a connection is replaced
+DB_STATEMENT_TIMEOUT = int(os.environ.get('DB_STATEMENT_TIMEOUT', '30000'))  # milliseconds, for the API and dashboard engines only (the pipeline and bulk loading engines have none), 0 for no timeout
+DB_PREPARED_STATEMENT_CACHE_SIZE = int(os.environ.get('DB_PREPARED_STATEMENT_CACHE_SIZE', '100'))  # prepared statements kept per asyncpg connection, 0 to disable
 
 # Data paths
 BASE_DIR = os.path.dirname(os.path.realpath(__file__))
 PARENT_DIR = os.path.abspath(os.path.join(BASE_DIR, os.pardir, os.pardir))
 RAW_DATA_ABS_PATH = os.path.join(PARENT_DIR, 'data', 'raw_data', '')
 PROC_DATA_ABS_PATH = os.path.join(PARENT_DIR, 'data', 'processed_data', '')
+# Identity index of the books (see src/data_ingestion/identity_index.py), kept between the runs of the single-book pipeline
+IDENTITY_INDEX_JSON = os.path.join(PROC_DATA_ABS_PATH, 'identity_index.json')
+# Whether the single-book pipeline also saves its processed tables as files (book.json, rank.csv, review.csv), as an audit trail
+SAVE_PROCESSED_FILES = os.environ.get('SAVE_PROCESSED_FILES', 'true').lower() in ('1', 'true', 'yes')
+
+# Number of first reviews of a book (by id_review) averaged in the 'mean_first_stars' of the book_stats table and of the machine learning dataset
+# It must match the window of the book_stats backfill of doc/nyt-db/migrations/003_book_stats.sql (id_review <= 10): change both together
+FIRST_REVIEWS_COUNT = 10
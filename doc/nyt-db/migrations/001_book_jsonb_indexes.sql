@@ -0,0 +1,25 @@
+/*
+Created on 2026-10-19
+
+@author: Roland
+
+@abstract: indexes of the JSONB attributes of the book table that the API, the dashboards and the data pipeline filter on. Until now the only index of the book table was its primary key, so every query on data->>'genre', data->>'publication_date' or data->>'url' read the whole table.
+
+    book_genre_year_idx: the genre and publication year of /best_book ("left(data->>'publication_date', 4) = :year AND data->>'genre' = :genre"); its leading column also serves the distinct genres of /all_genres.
+    book_publication_year_idx: the queries by publication year only.
+    book_url_idx: the lookup of already scraped Amazon URLs by checking_for_a_new_bestseller ("data->>'url' IN (...)").
+    book_data_gin_idx: containment filters on any other attribute ("data @> '{"publisher": "..."}'"), for the ad hoc dashboard queries.
+
+    The expressions must be written exactly the same way in the queries for the planner to use the indexes. The indexes are built CONCURRENTLY, so that the book table stays writable: run the file outside a transaction (e.g. psql -d nyt -f 001_book_jsonb_indexes.sql).
+
+*/
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS book_genre_year_idx ON book ((data->>'genre'), (left(data->>'publication_date', 4)));
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS book_publication_year_idx ON book ((left(data->>'publication_date', 4)));
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS book_url_idx ON book ((data->>'url'));
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS book_data_gin_idx ON book USING GIN (data jsonb_path_ops);
+
+ANALYZE book;
@@ -0,0 +1,48 @@
+/*
+Created on 2026-10-19
+
+@author: Roland
+
+@abstract: typed columns of the book table, generated from its JSONB data. The API, the dashboards and the machine learning dataset used to cast the same JSON text on every row of every request (REPLACE(data->>'rating', ',', '')::float, CAST(data->>'number_of_stars' AS float), ...) and to parse the prices with a regular expression in pandas. The stored generated columns are computed once, when a book is inserted or updated, and can be indexed:
+
+    rating: the number of Amazon ratings ('4,373' -> 4373).
+    stars: the Amazon number of stars ('4.9' -> 4.9).
+    reviews_count: the number of Amazon reviews.
+    max_price: the highest of the prices of the book ('["0.00", "$7.85"]' -> 7.85).
+    publication_year: the year of the publication date ('2023-01-10' -> 2023).
+    genre: the Apple Books genre.
+
+    The values that cannot be converted (e.g. 'None') become NULL instead of making the insert fail. Adding a stored generated column rewrites the book table under an exclusive lock: run the file during a maintenance window. The indexes of migration 001 on the genre and publication year expressions are replaced by an index on the typed columns.
+
+*/
+
+-- Converts a JSON text into a number, ignoring the thousands separators and currency signs, or NULL if it is not a number
+CREATE OR REPLACE FUNCTION nyt_to_number(value TEXT) RETURNS DOUBLE PRECISION
+    LANGUAGE SQL IMMUTABLE PARALLEL SAFE AS
+$$
+    SELECT CASE WHEN replace(replace(value, ',', ''), '$', '') ~ '^\s*-?[0-9]+(\.[0-9]+)?\s*$'
+                THEN replace(replace(value, ',', ''), '$', '')::DOUBLE PRECISION
+           END;
+$$;
+
+-- Returns the highest of the prices (decimal numbers) of a JSON list of prices, as extract_max_price did in pandas
+CREATE OR REPLACE FUNCTION nyt_max_price(prices JSONB) RETURNS DOUBLE PRECISION
+    LANGUAGE SQL IMMUTABLE PARALLEL SAFE AS
+$$
+    SELECT max(match[1]::DOUBLE PRECISION) FROM regexp_matches(prices::TEXT, '(\d+\.\d+)', 'g') AS match;
+$$;
+
+ALTER TABLE book
+    ADD COLUMN IF NOT EXISTS rating INT GENERATED ALWAYS AS (nyt_to_number(data->>'rating')::INT) STORED,
+    ADD COLUMN IF NOT EXISTS stars DOUBLE PRECISION GENERATED ALWAYS AS (nyt_to_number(data->>'number_of_stars')) STORED,
+    ADD COLUMN IF NOT EXISTS reviews_count INT GENERATED ALWAYS AS (nyt_to_number(data->>'reviews_count')::INT) STORED,
+    ADD COLUMN IF NOT EXISTS max_price DOUBLE PRECISION GENERATED ALWAYS AS (nyt_max_price(data->'price')) STORED,
+    ADD COLUMN IF NOT EXISTS publication_year SMALLINT GENERATED ALWAYS AS (nyt_to_number(left(data->>'publication_date', 4))::SMALLINT) STORED,
+    ADD COLUMN IF NOT EXISTS genre TEXT GENERATED ALWAYS AS (data->>'genre') STORED;
+
+CREATE INDEX IF NOT EXISTS book_genre_publication_year_idx ON book (genre, publication_year);
+
+DROP INDEX IF EXISTS book_genre_year_idx;
+DROP INDEX IF EXISTS book_publication_year_idx;
+
+ANALYZE book;
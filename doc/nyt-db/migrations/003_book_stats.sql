@@ -0,0 +1,47 @@
+/*
+Created on 2026-10-19
+
+@author: Roland
+
+@abstract: per-book aggregate table, maintained at load time. The machine learning dataset and the dashboards used to recompute MIN(rank) and MAX(weeks_on_list) per book by grouping the whole rank table on every read, and to read the mean stars of the first reviews from an undocumented 'first_reviews' relation. The book_stats table keeps these aggregates, one row per book, so that the analytical reads become primary key lookups:
+
+    best_rank, max_weeks: the best rank and the maximum number of weeks on a list.
+    first_date, last_date: the first and last dates the book was listed.
+    categories: the distinct list categories of the book (a JSON array).
+    mean_first_stars: the mean stars of the first 10 reviews (by id_review). The 10 of the backfill below must match FIRST_REVIEWS_COUNT in config.py, which the loaders use: if FIRST_REVIEWS_COUNT changes, change the backfill too and run it again.
+    reviews_count: the number of reviews loaded.
+
+    The loaders of src/data_ingestion/load.py refresh the rows of the books they insert rank or review rows for (load.refresh_book_stats), in the same transaction. This file creates the table and fills it from the existing history once.
+
+*/
+
+CREATE TABLE IF NOT EXISTS book_stats (
+    id_book INT PRIMARY KEY REFERENCES book(id),
+    best_rank INT,
+    max_weeks INT,
+    first_date DATE,
+    last_date DATE,
+    categories JSONB,
+    mean_first_stars DOUBLE PRECISION,
+    reviews_count INT NOT NULL DEFAULT 0
+);
+
+INSERT INTO book_stats (id_book, best_rank, max_weeks, first_date, last_date, categories, mean_first_stars, reviews_count)
+SELECT b.id, r.best_rank, r.max_weeks, r.first_date, r.last_date, r.categories, v.mean_first_stars, COALESCE(v.reviews_count, 0)
+FROM book AS b
+LEFT JOIN (
+    SELECT id_book, MIN(rank) AS best_rank, MAX(weeks_on_list) AS max_weeks, MIN(date) AS first_date, MAX(date) AS last_date,
+           jsonb_agg(DISTINCT category ORDER BY category) AS categories
+    FROM rank GROUP BY id_book
+) AS r ON r.id_book = b.id
+LEFT JOIN (
+    -- The first reviews window must match FIRST_REVIEWS_COUNT in config.py
+    SELECT id_book, AVG(CASE WHEN id_review <= 10 THEN stars END) AS mean_first_stars, COUNT(*) AS reviews_count
+    FROM review GROUP BY id_book
+) AS v ON v.id_book = b.id
+WHERE r.id_book IS NOT NULL OR v.id_book IS NOT NULL
+ON CONFLICT (id_book) DO UPDATE SET
+    best_rank = excluded.best_rank, max_weeks = excluded.max_weeks, first_date = excluded.first_date, last_date = excluded.last_date,
+    categories = excluded.categories, mean_first_stars = excluded.mean_first_stars, reviews_count = excluded.reviews_count;
+
+ANALYZE book_stats;
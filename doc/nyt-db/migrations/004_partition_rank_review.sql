@@ -0,0 +1,73 @@
+/*
+Created on 2026-10-19
+
+@author: Roland
+
+@abstract: declarative partitioning of the rank and review tables, for multi-decade histories of all the NYT lists and full review histories. Queries filtered on a date range or on a book only read the matching partitions, and the maintenance (VACUUM, backfills, archiving) works partition by partition:
+
+    rank: partitioned by range of date, one partition per year (rank_y2023 holds the ranks of 2023). The loaders of src/data_ingestion/load.py create the partition of a new year before inserting its ranks (load.ensure_rank_partitions), and a past year can be bulk loaded into a standalone table, then attached (load.attach_rank_partition).
+    review: partitioned by hash of id_book into 8 partitions (review_p0 to review_p7), so that the reviews of a book are in a single partition.
+
+    The primary keys include the partition keys (date for rank, id_book for review), so they are unchanged. The existing rows are copied into the new tables in a single transaction, during which the rank and review tables are locked: run the file during a maintenance window.
+
+*/
+
+BEGIN;
+
+ALTER TABLE rank RENAME TO rank_unpartitioned;
+ALTER TABLE rank_unpartitioned RENAME CONSTRAINT rank_pkey TO rank_unpartitioned_pkey;
+ALTER TABLE review RENAME TO review_unpartitioned;
+ALTER TABLE review_unpartitioned RENAME CONSTRAINT review_pkey TO review_unpartitioned_pkey;
+
+
+CREATE TABLE rank (
+    id_book INT NOT NULL REFERENCES book(id),
+    date Date NOT NULL,
+    category VARCHAR(50) NOT NULL,
+    rank INT,
+    rank_last_week INT,
+    weeks_on_list INT,
+    PRIMARY KEY (id_book, date, category)
+) PARTITION BY RANGE (date);
+
+-- One partition per year of the existing ranks
+DO $$
+DECLARE
+    partition_year INT;
+BEGIN
+    FOR partition_year IN SELECT DISTINCT EXTRACT(YEAR FROM date)::INT FROM rank_unpartitioned LOOP
+        EXECUTE format('CREATE TABLE %I PARTITION OF rank FOR VALUES FROM (%L) TO (%L)',
+                       'rank_y' || lpad(partition_year::TEXT, 4, '0'), make_date(partition_year, 1, 1), make_date(partition_year + 1, 1, 1));
+    END LOOP;
+END $$;
+
+INSERT INTO rank SELECT * FROM rank_unpartitioned;
+
+
+CREATE TABLE review (
+    id_book INT NOT NULL REFERENCES book(id),
+    id_review INT NOT NULL,
+    stars INT,
+    title TEXT,
+    text TEXT,
+    date DATE,
+    PRIMARY KEY (id_book, id_review)
+) PARTITION BY HASH (id_book);
+
+DO $$
+BEGIN
+    FOR remainder IN 0..7 LOOP
+        EXECUTE format('CREATE TABLE %I PARTITION OF review FOR VALUES WITH (MODULUS 8, REMAINDER %s)', 'review_p' || remainder, remainder);
+    END LOOP;
+END $$;
+
+INSERT INTO review SELECT * FROM review_unpartitioned;
+
+
+DROP TABLE rank_unpartitioned;
+DROP TABLE review_unpartitioned;
+
+COMMIT;
+
+ANALYZE rank;
+ANALYZE review;
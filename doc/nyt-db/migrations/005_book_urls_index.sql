@@ -0,0 +1,16 @@
+/*
+Created on 2026-10-19
+
+@author: Roland
+
+@abstract: index of the earlier Amazon URLs of the books merged from several Amazon pages. When a new Amazon page of a stored book is loaded, or two books are merged by the identity index, the 'url' of the book becomes its most recent page and every Amazon URL of the book is kept in the 'urls' list of its data (records.merge_book_data).
+
+    book_urls_idx: the lookup of already scraped Amazon URLs by checking_for_a_new_bestseller in the 'urls' lists ("data->'urls' ?| ARRAY[...]"), next to the lookup of the current URLs in book_url_idx (001_book_jsonb_indexes.sql).
+
+    The books with a single Amazon URL have no 'urls' list and are not in the index. The index is built CONCURRENTLY, so that the book table stays writable: run the file outside a transaction (e.g. psql -d nyt -f 005_book_urls_index.sql).
+
+*/
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS book_urls_idx ON book USING GIN ((data->'urls'));
+
+ANALYZE book;
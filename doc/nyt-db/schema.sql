@@ -3,7 +3,7 @@ Created on 2023-06-04
 
 @author: Roland
 
-@abstract: The code creates 3 tables for 'nyt' database. The relationships between the tables in the database schema are as follows:
+@abstract: The code creates 3 tables for 'nyt' database (and the book_stats table of their per-book aggregates). The relationships between the tables in the database schema are as follows:
 
     book <-> review:
         One-to-Many Relationship: One book can have multiple reviews. The id_book column in the review table creates a foreign key relationship to the id column in the book table. So each row in the review table is associated with a row in the book table.
@@ -13,9 +13,32 @@ Created on 2023-06-04
 
 */
 
+-- Conversions of the JSON texts of the book data into numbers (see migrations/002_book_typed_columns.sql)
+CREATE FUNCTION nyt_to_number(value TEXT) RETURNS DOUBLE PRECISION
+    LANGUAGE SQL IMMUTABLE PARALLEL SAFE AS
+$$
+    SELECT CASE WHEN replace(replace(value, ',', ''), '$', '') ~ '^\s*-?[0-9]+(\.[0-9]+)?\s*$'
+                THEN replace(replace(value, ',', ''), '$', '')::DOUBLE PRECISION
+           END;
+$$;
+
+CREATE FUNCTION nyt_max_price(prices JSONB) RETURNS DOUBLE PRECISION
+    LANGUAGE SQL IMMUTABLE PARALLEL SAFE AS
+$$
+    SELECT max(match[1]::DOUBLE PRECISION) FROM regexp_matches(prices::TEXT, '(\d+\.\d+)', 'g') AS match;
+$$;
+
+
 CREATE TABLE book (
     id INT PRIMARY KEY,
-    data JSONB NOT NULL
+    data JSONB NOT NULL,
+    -- Typed columns, generated from the data at insert or update
+    rating INT GENERATED ALWAYS AS (nyt_to_number(data->>'rating')::INT) STORED,
+    stars DOUBLE PRECISION GENERATED ALWAYS AS (nyt_to_number(data->>'number_of_stars')) STORED,
+    reviews_count INT GENERATED ALWAYS AS (nyt_to_number(data->>'reviews_count')::INT) STORED,
+    max_price DOUBLE PRECISION GENERATED ALWAYS AS (nyt_max_price(data->'price')) STORED,
+    publication_year SMALLINT GENERATED ALWAYS AS (nyt_to_number(left(data->>'publication_date', 4))::SMALLINT) STORED,
+    genre TEXT GENERATED ALWAYS AS (data->>'genre') STORED
 );
 
 
@@ -27,7 +50,17 @@ CREATE TABLE review (
     text TEXT,
     date DATE,
     PRIMARY KEY (id_book, id_review)
-);
+) PARTITION BY HASH (id_book);
+
+-- 8 partitions of the reviews, by hash of the book (see migrations/004_partition_rank_review.sql)
+CREATE TABLE review_p0 PARTITION OF review FOR VALUES WITH (MODULUS 8, REMAINDER 0);
+CREATE TABLE review_p1 PARTITION OF review FOR VALUES WITH (MODULUS 8, REMAINDER 1);
+CREATE TABLE review_p2 PARTITION OF review FOR VALUES WITH (MODULUS 8, REMAINDER 2);
+CREATE TABLE review_p3 PARTITION OF review FOR VALUES WITH (MODULUS 8, REMAINDER 3);
+CREATE TABLE review_p4 PARTITION OF review FOR VALUES WITH (MODULUS 8, REMAINDER 4);
+CREATE TABLE review_p5 PARTITION OF review FOR VALUES WITH (MODULUS 8, REMAINDER 5);
+CREATE TABLE review_p6 PARTITION OF review FOR VALUES WITH (MODULUS 8, REMAINDER 6);
+CREATE TABLE review_p7 PARTITION OF review FOR VALUES WITH (MODULUS 8, REMAINDER 7);
 
 
 CREATE TABLE rank (
@@ -38,4 +71,24 @@ CREATE TABLE rank (
     rank_last_week INT,
     weeks_on_list INT,
     PRIMARY KEY (id_book, date, category)
+) PARTITION BY RANGE (date);
+-- The yearly partitions of the ranks (rank_y2023, ...) are created by the loaders, see load.ensure_rank_partitions
+
+
+-- Per-book aggregates of the rank and review tables, refreshed by the loaders (see migrations/003_book_stats.sql)
+CREATE TABLE book_stats (
+    id_book INT PRIMARY KEY REFERENCES book(id),
+    best_rank INT,
+    max_weeks INT,
+    first_date DATE,
+    last_date DATE,
+    categories JSONB,
+    mean_first_stars DOUBLE PRECISION,
+    reviews_count INT NOT NULL DEFAULT 0
 );
+
+-- Indexes of the book attributes queried by the API and the data pipeline (see migrations/001_book_jsonb_indexes.sql, 002_book_typed_columns.sql and 005_book_urls_index.sql)
+CREATE INDEX book_genre_publication_year_idx ON book (genre, publication_year);
+CREATE INDEX book_url_idx ON book ((data->>'url'));
+CREATE INDEX book_urls_idx ON book USING GIN ((data->'urls'));
+CREATE INDEX book_data_gin_idx ON book USING GIN (data jsonb_path_ops);
@@ -13,14 +13,51 @@ from sqlalchemy import text
 from sqlalchemy.exc import SQLAlchemyError
 
 
+# The top 5 books of a genre and publication year, as a parameterized statement: its text never changes, so each connection prepares it once on the server and reuses the plan across requests.
+# The filters are on the typed genre and publication_year columns of the book table (doc/nyt-db/migrations/002_book_typed_columns.sql), so that the books are found by an index scan of book_genre_publication_year_idx
+BEST_BOOKS_QUERY = text("""
+    WITH UniqueBooks AS (
+        SELECT DISTINCT ON (b.data->>'author', b.data->>'title')
+            b.data->>'title' AS title,
+            b.data->>'author' AS author,
+            r.weeks_on_list
+        FROM
+            book AS b
+        JOIN
+            rank AS r ON b.id = r.id_book
+        WHERE
+            b.genre = :genre
+            AND b.publication_year = :year
+        ORDER BY
+            b.data->>'author',
+            b.data->>'title',
+            r.weeks_on_list DESC
+    )
+    SELECT json_agg(row_to_json(UniqueBooks.*))
+    FROM (SELECT * FROM UniqueBooks ORDER BY weeks_on_list DESC LIMIT 5) AS UniqueBooks;
+    """)
+
+# The distinct genres, read as a loose index scan of book_genre_publication_year_idx: each step jumps to the next genre in the index instead of reading every book
+ALL_GENRES_QUERY = text("""
+    WITH RECURSIVE genres AS (
+        SELECT min(genre) AS genre FROM book
+        UNION ALL
+        SELECT (SELECT min(book.genre) FROM book WHERE book.genre > genres.genre)
+        FROM genres
+        WHERE genres.genre IS NOT NULL
+    )
+    SELECT genre FROM genres WHERE genre IS NOT NULL;
+    """)
+
+
 async def read_all_genres(engine, app):
     """
     Fetches all distinct genres from the 'book' table.
 
-    This function uses SQLAlchemy to execute a SQL query against a PostgreSQL database. The query fetches all distinct genres present in the 'book' table.
+    This function uses the SQLAlchemy async engine to execute a SQL query against a PostgreSQL database. The query fetches all distinct (non-null) genres present in the 'book' table, in alphabetical order, by walking the genre index.
 
     Args:
-        engine (Engine): The SQLAlchemy database connection, to provide a source of database connectivity and behavior.
+        engine (AsyncEngine): The asynchronous SQLAlchemy database connection (asyncpg), to provide a source of database connectivity and behavior without blocking the event loop.
         app(FastAPI): The FastAPI application instance.
 
     Returns:
@@ -29,11 +66,9 @@ async def read_all_genres(engine, app):
     Raises:
         HTTPException: An exception is raised if no data is found (HTTP status code 404), or if there is a SQLAlchemy error (HTTP status code 500).
     """
-    query = "SELECT DISTINCT data->>'genre' AS genre FROM book;"
-    
     try:
-        with engine.connect() as connection:
-            result = connection.execute(text(query))
+        async with engine.connect() as connection:
+            result = await connection.execute(ALL_GENRES_QUERY)
             genres = [row[0] for row in result]
             
             if not genres:
@@ -44,16 +79,16 @@ async def read_all_genres(engine, app):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-async def read_best_books(engine, app, year: str, genre: str):
+async def read_best_books(engine, app, year: int, genre: str):
     """
     Fetches the best books based on the specified year and genre.
 
-    This function uses SQLAlchemy to execute a SQL query against a PostgreSQL database. The query fetches the top 5 books of the specified genre and year, sorted by their weeks on the list, while ensuring that each 'author - title' pair is unique. The result is returned in JSON format.
+    This function uses the SQLAlchemy async engine to execute a SQL query against a PostgreSQL database. The query fetches the top 5 books of the specified genre and year, sorted by their weeks on the list, while ensuring that each 'author - title' pair is unique. The result is returned in JSON format. The year and genre are bound as parameters of the prepared BEST_BOOKS_QUERY, never interpolated into the SQL.
 
     Args:
-        engine (Engine): The SQLAlchemy database connection, to provide a source of database connectivity and behavior.
+        engine (AsyncEngine): The asynchronous SQLAlchemy database connection (asyncpg), to provide a source of database connectivity and behavior without blocking the event loop.
         app (FastAPI): The FastAPI application instance.
-        year (str): The year the books were published.
+        year (int): The year the books were published.
         genre (str): The genre of the books.
 
     Returns:
@@ -62,31 +97,10 @@ async def read_best_books(engine, app, year: str, genre: str):
     Raises:
         HTTPException: An exception is raised if no data is found (HTTP status code 404), or if there is a SQLAlchemy error (HTTP status code 500).
 
-    """
-    query = f"""
-    WITH UniqueBooks AS (
-        SELECT DISTINCT ON (b.data->>'author', b.data->>'title')
-            b.data->>'title' AS title,
-            b.data->>'author' AS author,
-            r.weeks_on_list
-        FROM
-            book AS b
-        JOIN
-            rank AS r ON b.id = r.id_book
-        WHERE
-            b.data->>'publication_date' LIKE '{year}-%'
-            AND b.data->>'genre' = '{genre}'
-        ORDER BY
-            b.data->>'author',
-            b.data->>'title',
-            r.weeks_on_list DESC
-    )
-    SELECT json_agg(row_to_json(UniqueBooks.*))
-    FROM (SELECT * FROM UniqueBooks ORDER BY weeks_on_list DESC LIMIT 5) AS UniqueBooks;
     """
     try:
-        with engine.connect() as connection:
-            result = connection.execute(text(query))
+        async with engine.connect() as connection:
+            result = await connection.execute(BEST_BOOKS_QUERY, {"year": int(year), "genre": genre})
             best_book_json = result.fetchone()[0]
             if not best_book_json:
                 raise HTTPException(status_code=404, detail="No data found")
@@ -11,7 +11,6 @@ Created on 2023-09-08
 import os
 import sys
 from fastapi import FastAPI
-from sqlalchemy import create_engine
 from typing import List
 
 # Getting the absolute path of the current script file
@@ -22,15 +21,12 @@ current_script_dir = os.path.dirname(current_script_path)
 src_dir = os.path.join(current_script_dir, '../..')
 # Adding the absolute path to system path
 sys.path.append(src_dir)
-from config import DB_ENGINE
+from src.database import get_async_engine
 from src.api.best_book import read_all_genres, read_best_books
 
 
-try:
-    # Attempt to create the database engine
-    engine = create_engine(DB_ENGINE)
-except Exception as e:
-    raise RuntimeError(f"Failed to create database engine: {e}")
+# Asynchronous database engine (asyncpg), with its connection pool shared by all the concurrent requests of the worker
+engine = get_async_engine('nyt-api')
 
 app = FastAPI()
 
@@ -51,5 +47,5 @@ async def read_all_genres_route():
     return await read_all_genres(engine, app)
 
 @app.get("/best_book", summary="The 5 best books by year and genre") 
-async def read_best_books_route(year: str, genre: str):
+async def read_best_books_route(year: int, genre: str):
     return await read_best_books(engine, app, year, genre)
\ No newline at end of file
@@ -12,12 +12,12 @@ Created on 2023-05-18
 import os
 import time
 from datetime import datetime
-import json
 import pandas as pd
 import requests
 from pynytimes import NYTAPI
 
 from src.data_collection.api_request import api_request
+from src.data_collection import serialization
 from config import RAW_DATA_ABS_PATH
 
 
@@ -155,7 +155,7 @@ def save_as_json(data, year, month, day):
 
     try:
         with open('{}/best_sellers_{}_{}_{}.json'.format(path, year, month, day), 'w', encoding='utf-8') as jsonfile: 
-            json.dump(data, jsonfile)
+            serialization.dump(data, jsonfile)
     except FileNotFoundError:
         print("Error: File not found.")
         raise
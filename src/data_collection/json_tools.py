@@ -12,6 +12,196 @@ Created on 2023-05-19
 import os
 import json
 import glob
+import hashlib
+import itertools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from src.data_collection import serialization
+
+
+def iter_json_array(json_file, chunk_size=65536):
+    """
+    Iterates over the items of a JSON file holding a top-level array, without
+    loading the whole file into memory.
+
+    The file is read by chunks and each item is decoded incrementally with the
+    standard library decoder, so that only the current item (and the unread
+    part of the current chunk) is held in memory.
+
+    Args:
+        json_file (str): the name (and path) of the JSON file.
+        chunk_size (int): the number of characters read at a time.
+
+    Yields:
+        object: the successive items of the top-level JSON array.
+
+    Raises:
+        json.JSONDecodeError: If the file is not a valid JSON array.
+
+    Example:
+        >>> for book in iter_json_array('best_sellers.json'):
+        ...     print(book['title'])
+
+    """
+    decoder = json.JSONDecoder()
+    whitespace = ' \t\n\r'
+
+    with open(json_file, "r", encoding='utf-8') as f:
+        buffer = f.read(chunk_size)
+        eof = len(buffer) < chunk_size
+        pos = 0
+        expected = '['
+
+        while True:
+            # Skip whitespace, reading a new chunk if the buffer is exhausted
+            while pos < len(buffer) and buffer[pos] in whitespace:
+                pos += 1
+            if pos == len(buffer):
+                if eof:
+                    raise json.JSONDecodeError("Unexpected end of JSON array", buffer, pos)
+                buffer = f.read(chunk_size)
+                eof = len(buffer) < chunk_size
+                pos = 0
+                continue
+
+            char = buffer[pos]
+            if expected == '[':
+                if char != '[':
+                    raise json.JSONDecodeError("Expecting a JSON array", buffer, pos)
+                pos += 1
+                expected = 'item'
+                continue
+            if char == ']' and expected in ('item', ',]'):
+                return
+            if expected == ',]':
+                if char != ',':
+                    raise json.JSONDecodeError("Expecting ',' delimiter", buffer, pos)
+                pos += 1
+                expected = 'value'
+                continue
+
+            # Decode the next item, extending the buffer while it is incomplete
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+                complete = end < len(buffer) or eof
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                complete = False
+            if not complete:
+                chunk = f.read(chunk_size)
+                eof = len(chunk) < chunk_size
+                buffer = buffer[pos:] + chunk
+                pos = 0
+                continue
+
+            yield item
+            pos = end
+            expected = ',]'
+
+
+def _row_field_values(row, field, link_name=None):
+    """Yields the values of a field in a JSON row, or the urls of its links named link_name."""
+    if field not in row:
+        return
+    if isinstance(row[field], list) and link_name:
+        # Handle fields which are lists of objects
+        for link in row[field]:
+            if link['name'] == link_name:
+                yield link['url']
+    else:
+        # Handle fields which are strings
+        yield row[field]
+
+
+def iter_unique_field_values(json_file, field, link_name=None):
+    """
+    Streams a JSON file and yields the unique values of a specified field, in
+    the order in which they first appear.
+
+    The order is deterministic from one run to the next, and the caller can
+    stop iterating as soon as it has found what it needs, without the rest of
+    the file being read.
+
+    Args:
+        json_file (str): the name (and path) of the JSON file.
+        field (str): the name of the field to extract values from.
+        link_name (str) : the name of a secondary dictionary
+
+    Yields:
+        The unique values of the specified field in the JSON file.
+
+    Example:
+        >>> next(iter_unique_field_values('best_sellers.json', 'amazon_product_url'))
+        'https://www.amazon.com/...'
+
+    """
+    if not os.path.isfile(json_file):
+        print(f"Error: File not found: {json_file}")
+        return
+
+    seen = set()
+    for row in iter_json_array(json_file):
+        for value in _row_field_values(row, field, link_name):
+            if value not in seen:
+                seen.add(value)
+                yield value
+
+
+def json_fields_to_lists(json_file, fields, key=None):
+    """
+    Extracts, in a single pass over a JSON file, the values of several fields
+    and returns them as lists.
+
+    Each requested field is either a field name, or a (field, link_name) tuple
+    for fields which are lists of {'name': ..., 'url': ...} objects (e.g.
+    ('buy_links', 'Apple Books')). The file is streamed item by item, so it is
+    read and parsed only once whatever the number of fields.
+
+    With a key field, the values are associated with the key of their item
+    instead: each requested field gives a dictionary of its first value by key,
+    in order of first appearance of the keys, the items without key being
+    skipped. The None field then stands for the whole item.
+
+    Args:
+        json_file (str): the name (and path) of the JSON file.
+        fields (list): the field names and/or (field, link_name) tuples to extract.
+        key (str): the name of the field by which the values are associated, None for lists of unique values.
+
+    Returns:
+        dict: for each requested field, the list of its unique values, in order of first appearance (or, with a key, the dictionary of its first value by key).
+
+    Example:
+        >>> json_fields_to_lists('best_sellers.json', ['amazon_product_url', ('buy_links', 'Apple Books')])
+        {'amazon_product_url': ['https://www.amazon.com/...', ...], ('buy_links', 'Apple Books'): ['https://goto.applebooks.apple/...', ...]}
+        >>> json_fields_to_lists('best_sellers.json', [None, ('buy_links', 'Apple Books')], key='amazon_product_url')
+        {None: {'https://www.amazon.com/...': {'title': ...}, ...}, ('buy_links', 'Apple Books'): {'https://www.amazon.com/...': 'https://goto.applebooks.apple/...', ...}}
+
+    """
+    # Dictionaries keep the insertion order, unlike sets
+    field_values = {spec: {} for spec in fields}
+
+    if not os.path.isfile(json_file):
+        print(f"Error: File not found: {json_file}")
+        return field_values if key is not None else {spec: [] for spec in fields}
+
+    for row in iter_json_array(json_file):
+        key_value = row.get(key) if key is not None else None
+        if key is not None and key_value is None:
+            continue
+        for spec, values in field_values.items():
+            if spec is None:
+                values.setdefault(key_value, row)
+                continue
+            field, link_name = spec if isinstance(spec, tuple) else (spec, None)
+            if key is None:
+                for value in _row_field_values(row, field, link_name):
+                    values.setdefault(value)
+            elif values.get(key_value) is None:
+                values[key_value] = next(_row_field_values(row, field, link_name), None)
+
+    return field_values if key is not None else {spec: list(values) for spec, values in field_values.items()}
 
 
 def json_field_to_list(json_file, field, link_name=None):
@@ -25,75 +215,110 @@ def json_field_to_list(json_file, field, link_name=None):
         link_name (str) : the name of a secondary dictionary 
 
     Returns:
-        list: A list of the values of the specified field in the JSON file.
+        list: A list of the unique values of the specified field in the JSON file, in order of first appearance.
         
     Example:
         >>> field_values_of_JSON_file('example.json', 'url')
         ['https://www.example1.com', 'https://www.example2.com', ...]
     
     """
-    # Opening a JSON file containing the field
-    if os.path.isfile(json_file):
-        try:
-            with open(json_file, "r", encoding='utf-8') as f:
-                data = json.load(f)
-        except FileNotFoundError:
-            print(f"Error: File not found: {json_file}")
-            return []
-    else:
-        print(f"Error: File not found: {json_file}")
-        return []
+    return list(iter_unique_field_values(json_file, field, link_name))
 
-    # Iterating through the JSON list and create a list
-    list_of_field_values = []
-    for row in data:
-        if field in row:
-            if isinstance(row[field], list) and link_name:
-                # Handle fields which are lists of objects
-                for link in row[field]:
-                    if link['name'] == link_name:
-                        list_of_field_values.append(link['url'])
-            else:
-                # Handle fields which are strings
-                list_of_field_values.append(row[field])
 
-    return list(set(list_of_field_values))
+def _read_json_file(json_file):
+    """Reads and parses a whole JSON file."""
+    with open(json_file, "rb") as infile:
+        return serialization.load(infile)
 
 
-def merge_json_files(input_files, output_file):
+def _iter_json_files(json_files, max_workers=None):
+    """
+    Yields the parsed content of JSON files, in the order of the files.
+
+    When max_workers is set, the files are read in a thread pool, at most 
+    2 * max_workers files ahead of the consumer, so that memory stays bounded
+    whatever the number of files.
+
+    Args:
+        json_files (list): the paths of the JSON files to read.
+        max_workers (int) : the number of reading threads, None to read serially.
+
+    Yields:
+        object: the parsed content of each file.
+
+    """
+    if not max_workers:
+        for json_file in json_files:
+            yield _read_json_file(json_file)
+        return
+
+    files = iter(json_files)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque(executor.submit(_read_json_file, f)
+                        for f in itertools.islice(files, 2 * max_workers))
+        while pending:
+            data = pending.popleft().result()
+            next_file = next(files, None)
+            if next_file is not None:
+                pending.append(executor.submit(_read_json_file, next_file))
+            yield data
+
+
+def merge_json_files(input_files, output_file, dedup_key=None, max_workers=None):
     """
     Merges multiple JSON files into one, where each file contains data for a 
     single item.
 
     The function reads all the JSON files in the specified directory that match
     the pattern "xxx_*.json", where the asterisk is a wildcard that matches 
-    any number of characters. The contents of these files are merged into a
-    single list, which is then written to a single JSON file.
+    any number of characters. The items of these files are written to a single
+    JSON file as they are read, so that only a few files are held in memory at
+    a time.
+
+    Optionally, items are deduplicated on the value of a key (e.g. 'url'):
+    only the first item with a given value is kept, the values already seen 
+    being remembered as 8-byte hashes rather than full strings.
 
     Args:
         input_files (str) : path of the files to merge
         output_file (str) : output name of merged files
+        dedup_key (str) : the key on which to deduplicate items, None to keep them all
+        max_workers (int) : the number of threads reading the files, None to read them serially
 
     Returns:
         None.
    
     """
-    result = []
-    matching_files = glob.glob(os.path.join(input_files, "*.json"))
+    matching_files = sorted(glob.glob(os.path.join(input_files, "*.json")))
 
     # Raise an error if no files were found
     if not matching_files:
         raise FileNotFoundError(f"No files matching {input_files + '.json'} were found")
 
-    for f in matching_files:
-        with open(f, "r", encoding="utf-8") as infile:
-            data = json.load(infile)
-            for item in data:
-                result.append(item)
-
     dir_name = os.path.dirname(output_file)
     if dir_name and not os.path.exists(dir_name):
         raise FileNotFoundError(f"Directory {dir_name} does not exist")
 
-    with open(output_file, "w", encoding="utf-8") as outfile:
-        json.dump(result, outfile)
+    # Write to a temporary file, so that a failed merge never leaves a truncated output
+    tmp_file = output_file + ".tmp"
+    seen_keys = set()
+    try:
+        with open(tmp_file, "w", encoding="utf-8") as outfile:
+            outfile.write("[")
+            separator = ""
+            for data in _iter_json_files(matching_files, max_workers):
+                for item in data:
+                    if dedup_key is not None and dedup_key in item:
+                        digest = hashlib.blake2b(str(item[dedup_key]).encode('utf-8'), digest_size=8).digest()
+                        if digest in seen_keys:
+                            continue
+                        seen_keys.add(digest)
+                    outfile.write(separator + serialization.dumps(item))
+                    separator = ","
+            outfile.write("]")
+    except BaseException:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+
+    os.replace(tmp_file, output_file)
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 2026-10-19
+
+@author: Roland
+
+@abstract: single entry point for the JSON serialization of the raw and processed data. The encoding and decoding are delegated to a pluggable backend (orjson by default, msgspec or the standard library as alternatives), and the NYT best-seller records can be decoded directly into typed structures.
+
+"""
+
+import json
+from typing import List, Optional, Union
+
+import msgspec
+import orjson
+
+
+# Backends
+# ========
+
+def _json_dumps(obj, indent=False):
+    return json.dumps(obj, ensure_ascii=False, indent=2 if indent else None)
+
+
+def _orjson_dumps(obj, indent=False):
+    return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0).decode('utf-8')
+
+
+def _msgspec_loads(data):
+    try:
+        return msgspec.json.decode(data)
+    except msgspec.DecodeError as e:
+        # Keep the same exception type whatever the backend
+        raise json.JSONDecodeError(str(e), data if isinstance(data, str) else '', 0) from e
+
+
+def _msgspec_dumps(obj, indent=False):
+    encoded = msgspec.json.encode(obj)
+    if indent:
+        encoded = msgspec.json.format(encoded, indent=2)
+    return encoded.decode('utf-8')
+
+
+_BACKENDS = {
+    'json': (json.loads, _json_dumps),
+    'orjson': (orjson.loads, _orjson_dumps),
+    'msgspec': (_msgspec_loads, _msgspec_dumps),
+}
+
+_backend = 'orjson'
+
+
+def register_backend(name, loads_function, dumps_function):
+    """
+    Registers a new JSON backend, that can then be selected with set_backend.
+
+    Args:
+        name (str): the name of the backend.
+        loads_function (callable): decodes a str or bytes document into Python objects, raising json.JSONDecodeError on invalid input.
+        dumps_function (callable): encodes Python objects into a str, with an 'indent' boolean keyword argument.
+
+    Returns:
+        None
+
+    """
+    _BACKENDS[name] = (loads_function, dumps_function)
+
+
+def set_backend(name):
+    """
+    Selects the backend used by loads, dumps, load and dump.
+
+    Args:
+        name (str): the name of a registered backend ('orjson', 'msgspec' or 'json').
+
+    Returns:
+        None
+
+    Raises:
+        ValueError: If the backend is not registered.
+
+    """
+    global _backend
+    if name not in _BACKENDS:
+        raise ValueError(f"Unknown JSON backend: {name}")
+    _backend = name
+
+
+def get_backend():
+    """Returns the name of the backend in use."""
+    return _backend
+
+
+# Serialization
+# =============
+
+def loads(data):
+    """
+    Decodes a JSON document.
+
+    Args:
+        data (str or bytes): the JSON document.
+
+    Returns:
+        object: the decoded Python objects.
+
+    Raises:
+        json.JSONDecodeError: If the document is not valid JSON.
+
+    """
+    return _BACKENDS[_backend][0](data)
+
+
+def dumps(obj, indent=False):
+    """
+    Encodes Python objects into a JSON document. Non-ASCII characters are kept as is.
+
+    Args:
+        obj (object): the objects to encode.
+        indent (bool): whether to indent the document, for human reading.
+
+    Returns:
+        str: the JSON document.
+
+    Raises:
+        TypeError: If the objects are not JSON serializable.
+
+    """
+    return _BACKENDS[_backend][1](obj, indent=indent)
+
+
+def load(fp):
+    """
+    Decodes the JSON document of a file object, preferably opened in binary mode.
+
+    Args:
+        fp (file): the file object to read.
+
+    Returns:
+        object: the decoded Python objects.
+
+    Raises:
+        json.JSONDecodeError: If the document is not valid JSON.
+
+    """
+    return loads(fp.read())
+
+
+def dump(obj, fp, indent=False):
+    """
+    Encodes Python objects into a JSON document written to a text file object.
+
+    Args:
+        obj (object): the objects to encode.
+        fp (file): the file object to write, opened in text mode.
+        indent (bool): whether to indent the document, for human reading.
+
+    Returns:
+        None
+
+    Raises:
+        TypeError: If the objects are not JSON serializable.
+
+    """
+    fp.write(dumps(obj, indent=indent))
+
+
+# Typed NYT book records
+# ======================
+
+class _Record(msgspec.Struct):
+    """Typed record whose fields can also be read like the keys of a dictionary, so that the builders of the pipeline accept it as well as a decoded JSON object."""
+
+    def __getitem__(self, name):
+        try:
+            return getattr(self, name)
+        except AttributeError:
+            raise KeyError(name) from None
+
+    def get(self, name, default=None):
+        return getattr(self, name, default)
+
+
+class Isbn(_Record):
+    """ISBN pair of a best-seller edition."""
+    isbn10: Optional[str] = None
+    isbn13: Optional[str] = None
+
+
+class BuyLink(_Record):
+    """Link to a merchant site selling a best-seller."""
+    name: str
+    url: str
+
+
+class BestSeller(_Record):
+    """A book of a New York Times best-seller list, for a given category and Monday."""
+    title: str
+    author: str
+    rank: int
+    rank_last_week: int
+    weeks_on_list: int
+    category: str
+    bestsellers_date: str
+    amazon_product_url: Optional[str] = None
+    book_uri: Optional[str] = None
+    contributor: Optional[str] = None
+    description: Optional[str] = None
+    publisher: Optional[str] = None
+    price: Union[str, float, None] = None
+    dagger: int = 0
+    asterisk: int = 0
+    primary_isbn10: Optional[str] = None
+    primary_isbn13: Optional[str] = None
+    isbns: List[Isbn] = []
+    buy_links: List[BuyLink] = []
+
+
+_best_sellers_decoder = msgspec.json.Decoder(List[BestSeller])
+
+
+def load_best_sellers(best_sellers_json):
+    """
+    Decodes a best-seller JSON file directly into typed BestSeller records.
+
+    The fields are validated while decoding, and the fields not declared in
+    BestSeller are skipped without being materialized, which is faster and
+    lighter than decoding into dictionaries.
+
+    Args:
+        best_sellers_json (str): The path to the JSON file with best seller books data.
+
+    Returns:
+        list(BestSeller): the best-seller records.
+
+    Raises:
+        msgspec.ValidationError: If a record does not match the BestSeller types.
+        json.JSONDecodeError: If the file is not valid JSON.
+
+    """
+    with open(best_sellers_json, "rb") as f:
+        data = f.read()
+
+    try:
+        return _best_sellers_decoder.decode(data)
+    except msgspec.ValidationError:
+        raise
+    except msgspec.DecodeError as e:
+        raise json.JSONDecodeError(str(e), '', 0) from e
@@ -10,165 +10,486 @@ Created on 2023-05-22
 """
 
 import re
+import sys
+from array import array
 from datetime import datetime
-import json
 import csv
-from collections import defaultdict
+import numpy as np
 
+from src.data_collection import serialization
+from src.data_collection.json_tools import iter_json_array
+from src.data_ingestion.identity_index import record_identifiers
+from src.data_ingestion.records import Book, Rank, Review, parse_stars
 
 
-def combine_book_data(best_sellers_json, merged_amazon_books_json, apple_store_books_csv, output_json):
-    """
-    Function to combine book data from JSON and CSV files, and save the combined data into a JSON file.
 
-    Args:
-        best_sellers_json (str): The path to the JSON file with best seller books data.
-        merged_amazon_books_json (str): The path to the JSON file with merged Amazon books data.
-        apple_store_books_csv (str): The path to the CSV file with Apple Store books data.
-        output_json (str): The path to the JSON file where the combined data will be saved.
+# Bits of the date ordinal and of the category code in the packed (id_book, date, category) key of a rank row
+_RANK_DATE_BITS = 20
+_RANK_CATEGORY_BITS = 12
+
+# Formats of the review dates, which follow the last 'on ' of the text and depend on the Amazon marketplace ('July 12, 2023' in the United States, '12 July 2023' in the United Kingdom, India...)
+_REVIEW_DATE_PATTERN = re.compile(r'.*\bon\s+(.+?)\s*$', re.DOTALL)
+_REVIEW_DATE_FORMATS = ['%B %d, %Y', '%d %B %Y']
+
+# Fields of the book table which accumulate the distinct values of all the best-seller records of a book
+_LIST_FIELDS = Book.LIST_FIELDS
+
+
+def _intern(value):
+    """Interns strings, so that values repeated across records (publishers, categories...) are stored once."""
+    return sys.intern(value) if isinstance(value, str) else value
 
-    Returns: 
-        None
 
+def _append_unique(values, value):
+    """Appends a value to a small list if it is not already there, keeping the order of first appearance."""
+    value = _intern(value)
+    if value not in values:
+        values.append(value)
+
+
+class _BookAccumulator:
     """
+    Compact accumulator of the best-seller records sharing the same Amazon URL.
 
-    # Read and parse the best_sellers.json file
-    with open(best_sellers_json, "r", encoding='utf-8') as f:
-        book_data = json.load(f)
+    The multi-valued fields are kept in small lists rather than sets, and the
+    strings are interned, which divides the memory per book several times
+    compared to a dictionary of sets.
 
-    # Read and parse the merged_Amazon_books.json file
-    with open(merged_amazon_books_json, "r",encoding='utf-8') as f:
-        amazon_data = json.load(f)
+    """
+    __slots__ = ["id", "url", "title", "author", "contributor", "publisher", "dagger", "genre"] + _LIST_FIELDS
+
+    def __init__(self, book_id, book):
+        self.id = book_id
+        self.url = _intern(book["amazon_product_url"])
+        self.title = book["title"]
+        self.author = _intern(book["author"])
+        self.contributor = _intern(book["contributor"])
+        self.publisher = _intern(book["publisher"])
+        self.dagger = book["dagger"]
+        self.genre = ""
+        for field in _LIST_FIELDS:
+            setattr(self, field, [])
+
+    def add(self, book, apple_data):
+        """Adds the values of a best-seller record of the book."""
+        if self.url is None:
+            self.url = _intern(book["amazon_product_url"])
 
-    # Read and parse the apple_store_books.csv file
+        for isbn in book["isbns"]:
+            _append_unique(self.isbn10, isbn["isbn10"])
+            _append_unique(self.isbn13, isbn["isbn13"])
+
+        _append_unique(self.book_uri, book["book_uri"])
+        _append_unique(self.description, book["description"])
+        _append_unique(self.price, book["price"])
+        _append_unique(self.asterisk, book["asterisk"])
+
+        apple_url = next((link["url"] for link in book["buy_links"] if link["name"] == "Apple Books"), None)
+        if apple_url in apple_data:
+            self.genre = apple_data[apple_url]
+
+    def to_dict(self, amazon_item=None):
+        """Returns the book table item, completed with the data of its Amazon page if any."""
+        book = {
+            "id": self.id,
+            "url": self.url,
+            "title": self.title,
+            "author": self.author,
+            "isbn10": self.isbn10,
+            "isbn13": self.isbn13,
+            "book_uri": self.book_uri,
+            "contributor": self.contributor,
+            "description": self.description,
+            "publisher": self.publisher,
+            "price": self.price,
+            "dagger": self.dagger,
+            "asterisk": self.asterisk,
+            "genre": self.genre
+        }
+        if amazon_item is not None:
+            price = list(self.price)
+            _append_unique(price, amazon_item["price"])
+            book.update(amazon_item, price=price)
+        return book
+
+
+def read_apple_genres(apple_store_books_csv):
+    """Reads the Apple Store CSV file into a dictionary of genres by Apple Books URL."""
     apple_data = {}
     with open(apple_store_books_csv, "r", encoding='utf-8') as f:
         reader = csv.reader(f)
         next(reader)  # Skip header
         for row in reader:
             apple_data[row[0]] = row[1]
+    return apple_data
+
 
-    # Combine the data
-    combined_data = defaultdict(dict)
-    id_counter = 1 
+def accumulate_best_sellers(records, apple_data, url_to_id=None, next_id=1, ranks=None, identity_index=None):
+    """
+    Groups best-seller records by Amazon URL into book accumulators, in a single pass.
+
+    Args:
+        records (iterable): the best-seller records.
+        apple_data (dict): the genres by Apple Books URL.
+        url_to_id (dict): ids already assigned to Amazon URLs, None if there are none.
+        next_id (int): the id of the first new book.
+        ranks (RankColumns): if given, the rank row of each record is also added to it, in the same pass.
+        identity_index (IdentityIndex): if given, the records are grouped by the book id it resolves them to (from their ISBNs, ASIN, NYT URI or normalized URL) rather than by Amazon URL, and url_to_id and next_id are ignored.
 
-    for book in book_data:
-        amazon_url = book["amazon_product_url"]
-        if amazon_url is None:
+    Returns:
+        tuple: the book accumulators by Amazon URL (or by book id with an identity index) (dict), in order of first appearance, and the next free id (int).
+
+    """
+    url_to_id = url_to_id or {}
+    books = {}
+
+    for book in records:
+        if identity_index is not None:
+            book_key = book_id = identity_index.book_id(book)
+        else:
+            book_key = book["amazon_product_url"]
+            book_id = url_to_id.get(book_key)
+        if book_key is None:
             continue
-        
-        if amazon_url not in combined_data:
-            combined_data[amazon_url] = {
-                "id": id_counter,
-                "url": amazon_url,
-                "title": book["title"],
-                "author": book["author"],
-                "isbn10": set(),
-                "isbn13": set(),
-                "book_uri": set(),
-                "contributor": book["contributor"],
-                "description": set(),
-                "publisher": book["publisher"],
-                "price": set(),
-                "dagger": book["dagger"],
-                "asterisk": set(),
-                "genre": ""
-            }
-            id_counter += 1
 
-        for isbn in book["isbns"]:
-            combined_data[amazon_url]["isbn10"].add(isbn["isbn10"])
-            combined_data[amazon_url]["isbn13"].add(isbn["isbn13"])
+        accumulator = books.get(book_key)
+        if accumulator is None:
+            if book_id is None:
+                book_id = next_id
+                next_id += 1
+            accumulator = books[book_key] = _BookAccumulator(book_id, book)
+        accumulator.add(book, apple_data)
+        if ranks is not None:
+            ranks.add(book, accumulator.id)
 
-        combined_data[amazon_url]["book_uri"].add(book["book_uri"])
-        combined_data[amazon_url]["description"].add(book["description"])
-        combined_data[amazon_url]["price"].add(book["price"])
-        combined_data[amazon_url]["asterisk"].add(book["asterisk"])
+    return books, next_id
 
-        apple_url = next((link["url"] for link in book["buy_links"] if link["name"] == "Apple Books"), None)
-        if apple_url in apple_data:
-            combined_data[amazon_url]["genre"] = apple_data[apple_url]
-
-    for item in amazon_data:
-        amazon_url = item["url"]
-        if amazon_url in combined_data:
-            combined_data[amazon_url].update({
-                "id": combined_data[amazon_url]["id"], 
-                "rating": item["rating"],
-                "number_of_stars": item["number_of_stars"],
-                "price": combined_data[amazon_url]["price"].union({item.get("price", None)}),
-                "number_of_pages": item.get("number_of_pages", None),
-                "language": item.get("language", None),
-                "publication_date": item.get("publication_date", None),
-                "reviews_count": item["reviews_count"],
-                "random_pages_count": item["random_pages_count"]
-            })
-
-    # Convert sets to lists
-    for amazon_url in combined_data:
-        for key in ["isbn10", "isbn13", "book_uri", "description", "price", "asterisk"]:
-            combined_data[amazon_url][key] = list(combined_data[amazon_url][key])
-
-    # Save combined_data to a JSON file
+
+def amazon_book_fields(item):
+    """
+    Returns the fields of the book table of an Amazon item (the reviews are left out).
+
+    Args:
+        item (dict): the Amazon item.
+
+    Returns:
+        dict: the book table fields of the item, to be passed to the to_dict of its book accumulator.
+
+    """
+    return {
+        "rating": item["rating"],
+        "number_of_stars": item["number_of_stars"],
+        "price": item.get("price", None),
+        "number_of_pages": item.get("number_of_pages", None),
+        "language": item.get("language", None),
+        "publication_date": item.get("publication_date", None),
+        "reviews_count": item["reviews_count"],
+        "random_pages_count": item["random_pages_count"]
+    }
+
+
+def _index_amazon_data(items, urls, book_key=None):
+    """
+    Indexes by URL the Amazon data of the given books, keeping only the fields of the book table (the reviews are left out).
+
+    Args:
+        items (iterable): the Amazon items.
+        urls (container): the Amazon URLs of the books to index (or their keys, with book_key).
+        book_key (callable): if given, gives the key of the book of an Amazon URL, by which the data are indexed instead.
+
+    Returns:
+        dict: the book table fields of the Amazon items by URL (or by key).
+
+    """
+    amazon_index = {}
+    for item in items:
+        amazon_url = item["url"] if book_key is None else book_key(item["url"])
+        if amazon_url in urls:
+            amazon_index[amazon_url] = amazon_book_fields(item)
+    return amazon_index
+
+
+def _write_books_json(books, amazon_index, output_json):
+    """Writes the book table to a JSON file, one book at a time."""
     with open(output_json, "w", encoding='utf-8') as f:
-        json.dump(list(combined_data.values()), f, ensure_ascii=False, indent=4)
+        f.write("[")
+        for i, (book_key, accumulator) in enumerate(books.items()):
+            if i:
+                f.write(",")
+            serialization.dump(accumulator.to_dict(amazon_index.get(book_key)), f)
+        f.write("]")
 
 
-def write_rank(best_sellers_json, book_json, rank_csv):
+def combine_book_data(best_sellers_json, merged_amazon_books_json, apple_store_books_csv, output_json, identity_index=None):
     """
-    Function to read book data from JSON files, combine the data, and save the combined data into a CSV file.
+    Function to combine book data from JSON and CSV files, and save the combined data into a JSON file.
+
+    The best-seller file is decoded into typed BestSeller records (the fields
+    the tables do not use are skipped and the types are validated), grouped in a
+    single pass into compact per-book accumulators, the merged Amazon file is
+    streamed to index the book fields
+    of the Amazon pages by URL (without their reviews), and the books are
+    written one at a time, so that memory depends on the number of books, not
+    on the size of the input files.
 
     Args:
         best_sellers_json (str): The path to the JSON file with best seller books data.
-        book_json (str): The path to the JSON file with book identifiers.
-        rank_csv (str): The path to the CSV file where the combined data will be saved.
+        merged_amazon_books_json (str): The path to the JSON file with merged Amazon books data.
+        apple_store_books_csv (str): The path to the CSV file with Apple Store books data.
+        output_json (str): The path to the JSON file where the combined data will be saved.
+        identity_index (IdentityIndex): if given, the records are combined by book identity (ISBNs, ASIN, NYT URI, normalized URL) with this index, which keeps the ids across runs, instead of by exact Amazon URL. The records without Amazon URL are then kept.
+
+    Returns: 
+        None
+
+    Raises:
+        msgspec.ValidationError: If a best-seller record does not match the BestSeller types.
+
+    """
+    # Read and parse the apple_store_books.csv file
+    apple_data = read_apple_genres(apple_store_books_csv)
+
+    # Decode the best-seller records
+    records = serialization.load_best_sellers(best_sellers_json)
+
+    # Merge all the identifiers first, so that the books resolved early are not split
+    book_key = None
+    if identity_index is not None:
+        identity_index.add_records(records)
+        book_key = identity_index.url_id
+
+    # Combine the best-seller records by Amazon URL
+    books, _ = accumulate_best_sellers(records, apple_data, identity_index=identity_index)
+
+    # Index the Amazon data of these books
+    amazon_index = _index_amazon_data(iter_json_array(merged_amazon_books_json), books, book_key)
+
+    # Save the combined data to a JSON file
+    _write_books_json(books, amazon_index, output_json)
+
+
+def _parse_bestsellers_date(date):
+    """Parses a best-seller date, whose month and day may not be zero-padded (e.g. '2023-6-5')."""
+    return datetime.strptime(date, '%Y-%m-%d').date()
+
+
+def _records_after(records, watermark, latest):
+    """Yields the best-seller records dated after the watermark (all if None), keeping in latest['date'] the most recent date yielded."""
+    for record in records:
+        date = _parse_bestsellers_date(record["bestsellers_date"])
+        if watermark is None or date > watermark:
+            if latest["date"] is None or date > latest["date"]:
+                latest["date"] = date
+            yield record
+
+
+def read_book_index(index_json):
+    """
+    Reads the sidecar index of the books already transformed: the id of each Amazon URL, the next free id, and the date of the most recent best-seller record processed (the watermark).
+
+    Args:
+        index_json (str): The path to the JSON file of the index.
+
+    Returns:
+        dict: the index, with the 'ids', 'next_id' and 'watermark' keys. An empty index is returned if the file does not exist yet.
+
+    """
+    try:
+        with open(index_json, "rb") as f:
+            return serialization.load(f)
+    except FileNotFoundError:
+        return {"watermark": None, "next_id": 1, "ids": {}}
+
+
+def write_book_index(book_index, index_json):
+    """
+    Saves the sidecar index of the books already transformed.
+
+    Args:
+        book_index (dict): the index, as returned by combine_new_book_data.
+        index_json (str): The path to the JSON file of the index.
 
     Returns:
         None
 
     """
-    # Read and parse the best_sellers.json file
-    with open(best_sellers_json, "r", encoding='utf-8') as f:
-        data = json.load(f)
+    with open(index_json, "w", encoding='utf-8') as f:
+        serialization.dump(book_index, f)
 
-    # Read and parse the book.json file
-    with open(book_json, "r", encoding='utf-8') as f:
-        data_id = json.load(f)
 
-    # Write the CSV file
+def combine_new_book_data(best_sellers_json, merged_amazon_books_json, apple_store_books_csv, output_json, book_index):
+    """
+    Incremental version of combine_book_data: only the best-seller records more recent than the watermark of the index are processed, and the books they concern are saved as a delta.
+
+    The books already known keep their id, the new ones get ids following the last one, so that a re-run over new data never renumbers the existing books. The cost is proportional to the new records.
+
+    The delta of a known book only holds the values of its new records (and an empty genre if none of them has an Apple Books genre): it must be loaded with load.load_books_into_database, which merges it with the stored book instead of replacing its history.
+
+    Args:
+        best_sellers_json (str): The path to the JSON file with best seller books data.
+        merged_amazon_books_json (str): The path to the JSON file with merged Amazon books data.
+        apple_store_books_csv (str): The path to the CSV file with Apple Store books data.
+        output_json (str): The path to the JSON file where the books of the new records will be saved.
+        book_index (dict): the index of the books already transformed, from read_book_index or from the database (load.fetch_book_index).
+
+    Returns:
+        dict: the updated index, to be saved with write_book_index.
+
+    Raises:
+        msgspec.ValidationError: If a best-seller record does not match the BestSeller types.
+
+    """
+    watermark = book_index["watermark"] and _parse_bestsellers_date(book_index["watermark"])
+    latest = {"date": watermark}
+
+    # Read and parse the apple_store_books.csv file
+    apple_data = read_apple_genres(apple_store_books_csv)
+
+    # Combine the new best-seller records by Amazon URL
+    new_records = _records_after(serialization.load_best_sellers(best_sellers_json), watermark, latest)
+    books, next_id = accumulate_best_sellers(new_records, apple_data, book_index["ids"], book_index["next_id"])
+
+    # Index the Amazon data of these books and save the delta
+    amazon_index = _index_amazon_data(iter_json_array(merged_amazon_books_json), books)
+    _write_books_json(books, amazon_index, output_json)
+
+    ids = dict(book_index["ids"])
+    ids.update((url, accumulator.id) for url, accumulator in books.items())
+
+    return {"watermark": latest["date"] and latest["date"].isoformat(), "next_id": next_id, "ids": ids}
+
+
+class RankColumns:
+    """
+    Compact columnar arrays of rank rows, filled one best-seller record at a time.
+
+    Each row also gets its natural key (id_book, date, category) packed into a 64-bit integer: the id in the high bits, then the date ordinal on _RANK_DATE_BITS bits and the category code on _RANK_CATEGORY_BITS bits.
+
+    """
+    __slots__ = ["columns", "dates", "ordinals", "categories"]
+
+    def __init__(self):
+        self.columns = {name: array('q') for name in ['id_book', 'date_ordinal', 'category', 'rank', 'rank_last_week', 'weeks_on_list']}
+        self.dates = []
+        self.ordinals = {}
+        self.categories = {}
+
+    def add(self, item, id_book):
+        """Adds the rank row of a best-seller record of the book id_book."""
+        # Parse each distinct date string and code each distinct category only once
+        date = item['bestsellers_date']
+        if date not in self.ordinals:
+            self.ordinals[_intern(date)] = _parse_bestsellers_date(date).toordinal()
+        category = item['category']
+        if category not in self.categories:
+            self.categories[category] = len(self.categories)
+
+        columns = self.columns
+        columns['id_book'].append(id_book)
+        columns['date_ordinal'].append(self.ordinals[date])
+        columns['category'].append(self.categories[category])
+        columns['rank'].append(item['rank'])
+        columns['rank_last_week'].append(item['rank_last_week'])
+        columns['weeks_on_list'].append(item['weeks_on_list'])
+        self.dates.append(_intern(date))
+
+    def unique_rows(self):
+        """
+        Returns the rank rows deduplicated on their natural key, the first occurrence being kept, in the original order.
+
+        Returns:
+            tuple: the indices of the rows kept (list), and the rows (list).
+
+        Raises:
+            ValueError: If there are more categories than the packed key can encode.
+
+        """
+        if len(self.categories) > 1 << _RANK_CATEGORY_BITS:
+            raise ValueError(f"Too many categories to pack the rank keys: {len(self.categories)}")
+
+        columns = {name: np.frombuffer(column, dtype=np.int64) for name, column in self.columns.items()}
+        keys = ((columns['id_book'] << (_RANK_DATE_BITS + _RANK_CATEGORY_BITS))
+                | (columns['date_ordinal'] << _RANK_CATEGORY_BITS)
+                | columns['category'])
+
+        # Keep the first occurrence of each key
+        _, first_rows = np.unique(keys, return_index=True)
+        first_rows.sort()
+
+        categories = list(self.categories)
+        indices = first_rows.tolist()
+        rows = [list(row) for row in zip(columns['id_book'][first_rows].tolist(),
+                                         [self.dates[i] for i in indices],
+                                         [categories[code] for code in columns['category'][first_rows].tolist()],
+                                         columns['rank'][first_rows].tolist(),
+                                         columns['rank_last_week'][first_rows].tolist(),
+                                         columns['weeks_on_list'][first_rows].tolist())]
+        return indices, rows
+
+
+def _known_id(book_id, book_ids):
+    """Returns the book id if it is one of book_ids, None otherwise."""
+    return book_id if book_id in book_ids else None
+
+
+def _rank_columns(records, book_id):
+    """Gathers the rank rows of best-seller records into a RankColumns, book_id(record) giving the id of a record, and the records without id being skipped."""
+    columns = RankColumns()
+    for item in records:
+        id_book = book_id(item)
+        if id_book is not None:
+            columns.add(item, id_book)
+    return columns
+
+
+def _write_rank_csv(rows, rank_csv):
+    """Writes the rank rows to a CSV file."""
     with open(rank_csv, 'w', newline='', encoding='utf-8') as csv_file:
         writer = csv.writer(csv_file)
 
         # Write the header
-        header = ['id_book', 'date', 'category', 'rank', 'rank_last_week', 'weeks_on_list']
-        writer.writerow(header)
+        writer.writerow(Rank.COLUMNS)
 
         # Write the data
-        url_to_id = {i['url']: i["id"] for i in data_id}
+        writer.writerows(rows)
 
-        # Create an empty set to store written rows
-        written_rows = set()
-        
-        for item in data:
-            target_url = item['amazon_product_url']
-            if target_url is None:
-                continue
-            
-            # Create the row
-            row = [url_to_id.get(target_url),
-                   item['bestsellers_date'],
-                   item['category'],
-                   item['rank'],
-                   item['rank_last_week'],
-                   item['weeks_on_list']]
-            
-            # Convert the row to a tuple so it can be stored in the set
-            row_tuple = tuple(row)
-            
-            # If the row has not been written yet, write it and add it to the set
-            if row_tuple not in written_rows:
-                writer.writerow(row)
-                written_rows.add(row_tuple)
+
+def write_rank(best_sellers_json, book_json, rank_csv, since=None, identity_index=None):
+    """
+    Function to read book data from JSON files, combine the data, and save the combined data into a CSV file.
+
+    The rows are deduplicated on their natural key (id_book, date, category), the first occurrence being kept, and the rows of the records whose book is not in book.json are skipped.
+
+    Args:
+        best_sellers_json (str): The path to the JSON file with best seller books data.
+        book_json (str): The path to the JSON file with book identifiers.
+        rank_csv (str): The path to the CSV file where the combined data will be saved.
+        since (str): only the best-seller records dated after this date ('%Y-%m-%d') are written, e.g. the previous watermark of an incremental run. None to write them all.
+        identity_index (IdentityIndex): the index used by combine_book_data, if any, to resolve the book of each record by identity.
+
+    Returns:
+        None
+
+    Raises:
+        msgspec.ValidationError: If a best-seller record does not match the BestSeller types.
+
+    """
+    # Read the identifier of each book from the book.json file
+    url_to_id = {book['url']: book['id'] for book in iter_json_array(book_json)}
+    if identity_index is not None:
+        book_ids = set(url_to_id.values())
+        book_id = lambda item: _known_id(identity_index.find_id(record_identifiers(item)), book_ids)
+    else:
+        book_id = lambda item: url_to_id.get(item['amazon_product_url'])
+
+    # Decode the best_sellers.json file and gather its rows into columns
+    data = serialization.load_best_sellers(best_sellers_json)
+    if since is not None:
+        data = _records_after(data, _parse_bestsellers_date(since), {"date": None})
+    _, rows = _rank_columns(data, book_id).unique_rows()
+
+    # Write the CSV file
+    _write_rank_csv(rows, rank_csv)
 
 
 def convert_to_date(text):
@@ -201,46 +522,194 @@ def convert_to_date(text):
     return date.strftime('%Y-%m-%d')
 
 
-def write_reviews(merged_amazon_books_json, book_json, review_csv):
+def _parse_review_date(text):
+    """Parses the date of a review text in one of the _REVIEW_DATE_FORMATS into the '%Y-%m-%d' format, or returns None."""
+    match = _REVIEW_DATE_PATTERN.match(text) if isinstance(text, str) else None
+    if match is None:
+        return None
+
+    for date_format in _REVIEW_DATE_FORMATS:
+        try:
+            return datetime.strptime(match.group(1), date_format).strftime('%Y-%m-%d')
+        except ValueError:
+            pass
+    return None
+
+
+def convert_to_dates(texts):
     """
-    Function to read book review data from JSON files, combine the data, and save the combined data into a CSV file.
+    Batch version of convert_to_date: converts a whole column of review date texts into the '%Y-%m-%d' format, without stopping on unparseable texts.
+
+    The date follows the last 'on ' of the text, in the format of the Amazon marketplace of the review (e.g. 'Reviewed in the United States on July 12, 2023' or 'Reviewed in the United Kingdom on 12 July 2023'). Each distinct text is parsed only once, since many reviews share the same date.
 
     Args:
-        merged_amazon_books_json (str): The path to the JSON file with merged Amazon books data.
-        book_json (str): The path to the JSON file with book identifiers.
-        review_csv (str): The path to the CSV file where the combined data will be saved.
+        texts (iterable): The texts containing the date strings to be converted.
+
+    Returns:
+        tuple: the list of the converted dates (None for the unparseable texts), and the list of the indices of the unparseable texts.
+
+    Examples:
+        >>> convert_to_dates(['Reviewed in the United States on July 12, 2023', 'Reviewed in India on 12 July 2023', 'yesterday'])
+        (['2023-07-12', '2023-07-12', None], [2])
+
+    """
+    parsed = {}
+    dates = []
+    unparseable = []
+
+    for index, text in enumerate(texts):
+        if text not in parsed:
+            parsed[text] = _parse_review_date(text)
+        date = parsed[text]
+        if date is None:
+            unparseable.append(index)
+        dates.append(date)
+
+    return dates, unparseable
+
+
+def add_review_rows(item, id_book, rows, date_texts, review_counts=None):
+    """
+    Adds the review rows of an Amazon item, without their date, to rows (with integer stars), and their date texts to date_texts.
+
+    The reviews of a book are numbered from 1, or, with review_counts, after the reviews already added for the same book, so that several Amazon items resolved to the same book (by an identity index) never give colliding (id_book, id_review) keys.
+
+    Args:
+        item (dict): the Amazon item.
+        id_book (int): the id of its book.
+        rows (list): the review rows, to which the rows of the item are appended.
+        date_texts (list): the date texts of the reviews, to which those of the item are appended.
+        review_counts (dict): if given, the number of reviews already added by book id, updated with the reviews of the item.
 
     Returns:
         None
 
     """
-    # Read and parse the merged_amazon_books.json file, with the review data
-    with open(merged_amazon_books_json, "r", encoding='utf-8') as f:
-        data = json.load(f)
+    first = review_counts.get(id_book, 0) + 1 if review_counts is not None else 1
+    for index, review in enumerate(item['reviews'], start=first):
+        rows.append([id_book, index, parse_stars(review['stars']), review['title'], review['text']])
+        date_texts.append(review['date'])
+    if review_counts is not None:
+        review_counts[id_book] = first - 1 + len(item['reviews'])
+
+
+def _write_review_csv(rows, date_texts, review_csv):
+    """
+    Converts the whole date column at once, then writes the review rows to a CSV file. The reviews whose date cannot be parsed are written with an empty date and reported.
 
-    # Read and parse the book.json file, with the book identifier
-    with open(book_json, "r", encoding='utf-8') as f:
-        data_id = json.load(f)
+    Returns:
+        list: the (id_book, id_review) keys of the reviews with an unparseable date.
+
+    """
+    dates, unparseable = convert_to_dates(date_texts)
+    if unparseable:
+        print(f"{len(unparseable)} review(s) with an unparseable date, e.g. {date_texts[unparseable[0]]!r}")
 
     # Write the CSV file
     with open(review_csv, 'w', newline='', encoding='utf-8') as csv_file:
         writer = csv.writer(csv_file)
 
         # Write the header
-        header = ['id_book', 'id_review', 'stars', 'title', 'text', 'date']
-        writer.writerow(header)
+        writer.writerow(Review.COLUMNS)
 
         # Write the data
-        url_to_id = {j["url"]: j["id"] for j in data_id}
-        for item in data:
-            target_url = item['url']
-            for index, review in enumerate(item['reviews']):
-                writer.writerow([url_to_id.get(target_url),
-                                  index + 1,
-                                  review['stars'],
-                                  review['title'],
-                                  review['text'],
-                                  convert_to_date(review['date'])])
+        for row, date in zip(rows, dates):
+            row.append(date)
+            writer.writerow(row)
+
+    return [tuple(rows[index][:2]) for index in unparseable]
+
+
+def write_reviews(merged_amazon_books_json, book_json, review_csv, identity_index=None):
+    """
+    Function to read book review data from JSON files, combine the data, and save the combined data into a CSV file.
+
+    The reviews whose date cannot be parsed are written with an empty date and reported.
+
+    Args:
+        merged_amazon_books_json (str): The path to the JSON file with merged Amazon books data.
+        book_json (str): The path to the JSON file with book identifiers.
+        review_csv (str): The path to the CSV file where the combined data will be saved.
+        identity_index (IdentityIndex): the index used by combine_book_data, if any, to resolve the book of each Amazon URL by identity.
+
+    Returns:
+        list: the (id_book, id_review) keys of the reviews with an unparseable date.
+
+    """
+    # Read the identifier of each book from the book.json file
+    url_to_id = {book["url"]: book["id"] for book in iter_json_array(book_json)}
+    book_ids = set(url_to_id.values())
+
+    # Stream the merged_amazon_books.json file, with the review data, numbered per book
+    rows = []
+    date_texts = []
+    review_counts = {}
+    for item in iter_json_array(merged_amazon_books_json):
+        # Skip the books absent from book.json, e.g. the books already loaded when book.json is an incremental delta
+        if identity_index is not None:
+            id_book = _known_id(identity_index.url_id(item['url']), book_ids)
+        else:
+            id_book = url_to_id.get(item['url'])
+        if id_book is not None:
+            add_review_rows(item, id_book, rows, date_texts, review_counts)
+
+    return _write_review_csv(rows, date_texts, review_csv)
+
+
+def transform_tables(best_sellers_json, merged_amazon_books_json, apple_store_books_csv, book_json, rank_csv, review_csv, identity_index=None):
+    """
+    Fused version of combine_book_data, write_rank and write_reviews: each source is read once, and the 3 tables are built from the same pass, without reading back book.json.
+
+    The best-seller file is decoded once into typed BestSeller records, to accumulate the books and gather the rank rows, and the merged Amazon file is streamed once to index the book fields of the Amazon pages and gather the review rows. The files written are the same as the ones of the 3 separate functions.
+
+    Args:
+        best_sellers_json (str): The path to the JSON file with best seller books data.
+        merged_amazon_books_json (str): The path to the JSON file with merged Amazon books data.
+        apple_store_books_csv (str): The path to the CSV file with Apple Store books data.
+        book_json (str): The path to the JSON file where the book table will be saved.
+        rank_csv (str): The path to the CSV file where the rank table will be saved.
+        review_csv (str): The path to the CSV file where the review table will be saved.
+        identity_index (IdentityIndex): if given, the books are resolved by identity with this index, as in combine_book_data. The best-seller records are then passed twice, to merge all the identifiers first.
+
+    Returns:
+        list: the (id_book, id_review) keys of the reviews with an unparseable date.
+
+    Raises:
+        msgspec.ValidationError: If a best-seller record does not match the BestSeller types.
+
+    """
+    # Read and parse the apple_store_books.csv file
+    apple_data = read_apple_genres(apple_store_books_csv)
+
+    # Decode the best-seller records
+    records = serialization.load_best_sellers(best_sellers_json)
+
+    # Merge all the identifiers first, so that the books resolved early are not split
+    book_key = None
+    if identity_index is not None:
+        identity_index.add_records(records)
+        book_key = identity_index.url_id
+
+    # Combine the best-seller records by Amazon URL, gathering their rank rows on the way
+    ranks = RankColumns()
+    books, _ = accumulate_best_sellers(records, apple_data, ranks=ranks, identity_index=identity_index)
+
+    # Index the Amazon data of these books, gathering their review rows on the way, numbered per book
+    amazon_index = {}
+    review_rows = []
+    date_texts = []
+    review_counts = {}
+    for item in iter_json_array(merged_amazon_books_json):
+        amazon_key = item['url'] if book_key is None else book_key(item['url'])
+        accumulator = books.get(amazon_key)
+        if accumulator is not None:
+            amazon_index[amazon_key] = amazon_book_fields(item)
+            add_review_rows(item, accumulator.id, review_rows, date_texts, review_counts)
+
+    # Save the 3 tables
+    _write_books_json(books, amazon_index, book_json)
+    _write_rank_csv(ranks.unique_rows()[1], rank_csv)
+    return _write_review_csv(review_rows, date_texts, review_csv)
 
 
 def create_a_book_table_item(new_id, nyt_data, amazon_data, apple_data):
@@ -248,7 +717,7 @@ def create_a_book_table_item(new_id, nyt_data, amazon_data, apple_data):
     Creates a new item for the book table.
     
     This function forms a new book record by pulling relevant data from the New York Times, Amazon, and Apple bestseller lists. The resultant book record 
-    is formatted as a dictionary.
+    is validated as a records.Book, and formatted as a dictionary.
 
     Args:
         new_id (int): The ID of the new bestseller book.
@@ -258,31 +727,32 @@ def create_a_book_table_item(new_id, nyt_data, amazon_data, apple_data):
 
     Returns:
         dict: A dictionary containing the combined book data from the New York Times, Amazon, and Apple bestseller lists.
-    """
-    book = {
-        'id': new_id,
-        'url': amazon_data[0]['url'],
-        'title': nyt_data['title'],
-        'author': nyt_data['author'],
-        'isbn10': [isbn['isbn10'] for isbn in nyt_data['isbns']],
-        'isbn13': [isbn['isbn13'] for isbn in nyt_data['isbns']],
-        'book_uri': [nyt_data['book_uri']],
-        'contributor': nyt_data['contributor'],
-        'description': [nyt_data['description']],
-        'publisher': nyt_data['publisher'],
-        'price': [nyt_data['price'], amazon_data[0]['price']],
-        'dagger': nyt_data['dagger'],
-        'asterisk': [nyt_data['asterisk']],
-        'genre': apple_data,
-        'rating': amazon_data[0]['rating'],
-        'number_of_stars': amazon_data[0]['number_of_stars'],
-        'number_of_pages': amazon_data[0]['number_of_pages'],
-        'language': amazon_data[0]['language'],
-        'publication_date': amazon_data[0]['publication_date'],
-        'reviews_count': amazon_data[0]['reviews_count'],
-    }
 
-    return book
+    Raises:
+        KeyError: If a field is missing from the data.
+        TypeError: If the id is not an integer.
+    """
+    amazon_item = amazon_data[0]
+    return Book(id=new_id,
+                url=amazon_item['url'],
+                title=nyt_data['title'],
+                author=nyt_data['author'],
+                isbn10=[isbn['isbn10'] for isbn in nyt_data['isbns']],
+                isbn13=[isbn['isbn13'] for isbn in nyt_data['isbns']],
+                book_uri=[nyt_data['book_uri']],
+                contributor=nyt_data['contributor'],
+                description=[nyt_data['description']],
+                publisher=nyt_data['publisher'],
+                price=[nyt_data['price'], amazon_item['price']],
+                dagger=nyt_data['dagger'],
+                asterisk=[nyt_data['asterisk']],
+                genre=apple_data,
+                rating=amazon_item['rating'],
+                number_of_stars=amazon_item['number_of_stars'],
+                number_of_pages=amazon_item['number_of_pages'],
+                language=amazon_item['language'],
+                publication_date=amazon_item['publication_date'],
+                reviews_count=amazon_item['reviews_count']).to_dict()
 
 
 def create_a_rank_table_item(new_id, nyt_data):
@@ -299,20 +769,7 @@ def create_a_rank_table_item(new_id, nyt_data):
     Raises:
         TypeError: If the data in the nyt_data dictionary is not of the expected type.
     """
-    if not isinstance(nyt_data['bestsellers_date'], str):
-        raise TypeError("bestsellers_date must be a string")
-    if not isinstance(nyt_data['category'], str):
-        raise TypeError("category must be a string")
-    if not isinstance(nyt_data['rank'], int):
-        raise TypeError("rank must be an integer")
-    if not isinstance(nyt_data['rank_last_week'], int):
-        raise TypeError("rank_last_week must be an integer")
-    if not isinstance(nyt_data['weeks_on_list'], int):
-        raise TypeError("weeks_on_list must be an integer")
-
-    rank = [new_id, nyt_data['bestsellers_date'], nyt_data['category'], nyt_data['rank'], nyt_data['rank_last_week'], nyt_data['weeks_on_list']]
-
-    return rank
+    return Rank(new_id, nyt_data['bestsellers_date'], nyt_data['category'], nyt_data['rank'], nyt_data['rank_last_week'], nyt_data['weeks_on_list']).to_row()
 
 
 
@@ -320,27 +777,20 @@ def create_of_review_table_items(new_id, amazon_data):
     """
     Creates review table items for a given book using its id and Amazon data.
 
-    This function constructs a list of lists, each sublist representing a review table item. Each review table item includes the book 'id', review id, stars, title, text, and date.
+    This function constructs a list of lists, each sublist representing a review table item. Each review table item includes the book 'id', review id, stars, title, text, and date. The dates of all the reviews are converted at once.
 
     Args:
         new_id (int): The id of the book for which the review table items are to be created. 
         amazon_data (list): The data list from Amazon, where each item is a dictionary that contains a 'reviews' key with a list of review data.
 
     Returns:
-        list: A list of lists, where each sublist represents a review table item.
+        list: A list of lists, where each sublist represents a review table item, with integer stars. The date of a review is None if it cannot be parsed.
 
     """
-    # Create an empty result list
-    review = []
+    reviews = [r for book in amazon_data for r in book['reviews']]
+    dates, _ = convert_to_dates(r['date'] for r in reviews)
 
-    # Iterate over each dictionary in the list
-    for book in amazon_data:
-        reviews = book['reviews']  # get the list of reviews
+    # The reviews are numbered from 1 for each Amazon item
+    numbers = (i for book in amazon_data for i in range(1, len(book['reviews']) + 1))
 
-        # Iterate over each review
-        for i, r in enumerate(reviews, start=1):
-            # Extract the data you want and add it to the result list
-            review_data = [new_id, i, r['stars'], r['title'], r['text'], convert_to_date(r['date'])]
-            review.append(review_data)
-    
-    return review
+    return [Review(new_id, i, parse_stars(r['stars']), r['title'], r['text'], date).to_row() for i, r, date in zip(numbers, reviews, dates)]
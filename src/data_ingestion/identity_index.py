@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 2026-10-19
+
+@author: Roland
+
+@abstract: entity resolution of the books across the NYT, Amazon and Apple records. The identifiers of a record (ISBN-13, ISBN-10, ASIN, NYT book URI, and Amazon URL without its tracking parameters) are merged with a union-find structure, so that all the records sharing any identifier resolve to the same book id in O(1). The index is persisted in a JSON file between runs.
+
+"""
+
+import re
+from urllib.parse import urlsplit
+
+from src.data_collection import serialization
+
+
+# ASIN of an Amazon product URL (e.g. 'https://www.amazon.com/dp/1943200084?tag=NYTBSREV-20')
+_ASIN_PATTERN = re.compile(r'/(?:dp|gp/product)/([0-9A-Z]{10})(?:[/?#]|$)', re.IGNORECASE)
+
+
+def normalize_url(url):
+    """Returns an Amazon URL without its query (tracking parameters) and fragment, with a lowercase host and no trailing slash."""
+    parts = urlsplit(url.strip())
+    return f"{parts.scheme.lower()}://{parts.netloc.lower()}{parts.path.rstrip('/')}"
+
+
+def url_identifiers(url):
+    """Returns the identifiers of an Amazon URL: its ASIN if any, and its normalized form."""
+    if not url:
+        return []
+    keys = []
+    match = _ASIN_PATTERN.search(url)
+    if match:
+        keys.append("asin:" + match.group(1).upper())
+    keys.append("url:" + normalize_url(url))
+    return keys
+
+
+def record_identifiers(record):
+    """
+    Returns the identifiers of a best-seller record or of an Amazon item.
+
+    Args:
+        record (dict): a NYT best-seller record, or an Amazon item with its 'url'.
+
+    Returns:
+        list: the identifiers, prefixed by their kind (e.g. 'isbn13:9781943200085').
+
+    """
+    keys = []
+    isbns = list(record.get("isbns") or [])
+    isbns.append({"isbn10": record.get("primary_isbn10"), "isbn13": record.get("primary_isbn13")})
+    for isbn in isbns:
+        for kind in ("isbn13", "isbn10"):
+            value = isbn.get(kind)
+            if value and value != "None":
+                keys.append(f"{kind}:{value}")
+
+    if record.get("book_uri"):
+        keys.append("uri:" + record["book_uri"])
+
+    keys.extend(url_identifiers(record.get("amazon_product_url") or record.get("url")))
+
+    # Remove the duplicates, keeping the order
+    return list(dict.fromkeys(keys))
+
+
+class IdentityIndex:
+    """
+    Union-find index of the book identifiers, giving each set of connected identifiers a single book id.
+
+    When two books turn out to be the same one, the smaller id is kept and the other one is recorded in 'aliases'. The rows already loaded under a merged id are moved to the kept id in the database by load.apply_book_aliases, or in the transaction of the load of a new best-seller by load.load_best_seller_into_database.
+
+    """
+    __slots__ = ["parent", "ids", "next_id", "aliases"]
+
+    def __init__(self, parent=None, ids=None, next_id=1, aliases=None):
+        self.parent = parent or {}
+        self.ids = ids or {}
+        self.next_id = next_id
+        self.aliases = aliases or {}
+
+    def _find(self, key):
+        """Returns the root identifier of a known identifier, compressing the path."""
+        parent = self.parent
+        root = key
+        while parent[root] != root:
+            root = parent[root]
+        while parent[key] != root:
+            parent[key], key = root, parent[key]
+        return root
+
+    def _union(self, key, other):
+        """Merges the sets of two known identifiers, keeping the smaller book id."""
+        root, other_root = self._find(key), self._find(other)
+        if root == other_root:
+            return root
+
+        book_id, other_id = self.ids.pop(root, None), self.ids.pop(other_root, None)
+        self.parent[other_root] = root
+        if book_id is not None and other_id is not None:
+            kept, merged = min(book_id, other_id), max(book_id, other_id)
+            self.aliases[str(merged)] = kept
+            book_id = kept
+        elif book_id is None:
+            book_id = other_id
+        if book_id is not None:
+            self.ids[root] = book_id
+        return root
+
+    def add(self, keys):
+        """
+        Adds identifiers known to belong to the same book, merging the sets they already belong to.
+
+        Args:
+            keys (list): the identifiers.
+
+        Returns:
+            str: the root identifier of the book, None if there are no identifiers.
+
+        """
+        root = None
+        for key in keys:
+            if key not in self.parent:
+                self.parent[key] = key
+            root = key if root is None else self._union(root, key)
+        return root if root is None else self._find(root)
+
+    def add_records(self, records):
+        """Adds the identifiers of best-seller records or Amazon items, e.g. all the records of a run before resolving them."""
+        for record in records:
+            self.add(record_identifiers(record))
+
+    def book_id(self, record):
+        """
+        Resolves a record to its book id, adding its identifiers and assigning a new id to a new book.
+
+        Args:
+            record (dict): a NYT best-seller record, or an Amazon item with its 'url'.
+
+        Returns:
+            int: the book id, None if the record has no identifier.
+
+        """
+        root = self.add(record_identifiers(record))
+        if root is None:
+            return None
+        if root not in self.ids:
+            self.ids[root] = self.next_id
+            self.next_id += 1
+        return self.ids[root]
+
+    def find_id(self, keys):
+        """Returns the book id of the first known identifier, without adding anything, None if none is known."""
+        for key in keys:
+            if key in self.parent:
+                return self.ids.get(self._find(key))
+        return None
+
+    def url_id(self, url):
+        """Returns the book id of an Amazon URL, whatever its tracking parameters, None if it is unknown."""
+        return self.find_id(url_identifiers(url))
+
+    def resolve_id(self, book_id):
+        """Returns the id a book id has been merged into, or the id itself."""
+        while str(book_id) in self.aliases:
+            book_id = self.aliases[str(book_id)]
+        return book_id
+
+    @classmethod
+    def load(cls, index_json):
+        """
+        Reads an index from a JSON file, an empty index being returned if the file does not exist yet.
+
+        Args:
+            index_json (str): The path to the JSON file of the index.
+
+        Returns:
+            IdentityIndex: the index.
+
+        """
+        try:
+            with open(index_json, "rb") as f:
+                data = serialization.load(f)
+        except FileNotFoundError:
+            return cls()
+        return cls(data["parent"], data["ids"], data["next_id"], data["aliases"])
+
+    def save(self, index_json):
+        """
+        Saves the index to a JSON file, with the paths fully compressed.
+
+        Args:
+            index_json (str): The path to the JSON file of the index.
+
+        Returns:
+            None
+
+        """
+        for key in self.parent:
+            self._find(key)
+        with open(index_json, "w", encoding='utf-8') as f:
+            serialization.dump({"parent": self.parent, "ids": self.ids, "next_id": self.next_id, "aliases": self.aliases}, f)
@@ -5,13 +5,72 @@ Created on 2023-05-29
 
 @author: Roland
 
-@abstract: load the 3 relational tables (book, rank and review) into the PosGreSQL database from individual csv or json files
+@abstract: load the 3 relational tables (book, rank and review) into the PosGreSQL database from individual csv, json or parquet files
 
 """
 
-import json
+import io
+import csv
+import itertools
 import pandas as pd
-from sqlalchemy import text
+from sqlalchemy import bindparam, text
+
+from config import FIRST_REVIEWS_COUNT
+from src.data_collection import serialization
+from src.data_collection.json_tools import iter_json_array
+from src.data_ingestion import parquet_store
+from src.data_ingestion.records import Rank, Review, merge_book_data, parse_stars
+
+
+# Primary keys of the rank and review tables, as declared in doc/nyt-db/schema.sql
+PRIMARY_KEYS = {
+    'rank': ['id_book', 'date', 'category'],
+    'review': ['id_book', 'id_review'],
+}
+
+
+# Aggregate of the distinct categories of a book into a JSON array, per SQL dialect
+_JSON_ARRAY_AGG = {
+    'postgresql': "jsonb_agg(DISTINCT {column} ORDER BY {column})",
+    'sqlite': "json_group_array(DISTINCT {column})",
+}
+
+
+def _read_table_file(file):
+    """Reads a rank or review table from a CSV file, or from a Parquet file or dataset."""
+    if parquet_store.is_parquet(file):
+        return parquet_store.read_parquet_table(file)
+    return pd.read_csv(file)
+
+
+def fetch_book_index(engine, book_table='book', rank_table='rank'):
+    """
+    Builds, from the database, the index of the books already loaded, for an incremental run of extract_transform.combine_new_book_data.
+
+    Args:
+        engine (Engine): The SQLAlchemy database connection, to provide a source of database connectivity and behavior.
+        book_table (str): The name of the book table.
+        rank_table (str): The name of the rank table, whose dates give the watermark.
+
+    Returns:
+        dict: the index, with the 'ids' (Amazon URL -> id, every Amazon URL of a book merged from several pages being indexed), 'next_id' and 'watermark' keys.
+
+    Note:
+        The single-book pipeline loads the books of a best-seller list one at a time, so the most recent date of the rank table may be only partly loaded. The watermark is therefore the date before it, and the records of the most recent date are processed again by the incremental run: their books are merged with the stored ones and their rank rows already loaded are skipped, so re-processing them is harmless.
+
+    """
+    with engine.connect() as connection:
+        ids = {}
+        for id_value, url, urls in connection.execute(text(f"SELECT id, data->>'url', data->'urls' FROM {book_table}")):
+            # The earlier Amazon URLs of a book merged from several pages (JSONB is decoded by the driver, TEXT (SQLite) is not)
+            urls = serialization.loads(urls) if isinstance(urls, (str, bytes)) else urls
+            ids.update((other_url, id_value) for other_url in urls or [])
+            ids[url] = id_value
+        watermark = connection.execute(text(f"SELECT MAX(date) FROM {rank_table} WHERE date < (SELECT MAX(date) FROM {rank_table})")).scalar()
+
+    return {"watermark": str(watermark) if watermark is not None else None,
+            "next_id": max(ids.values(), default=0) + 1,
+            "ids": ids}
 
 
 def load_book_into_database(file, engine, table):
@@ -29,100 +88,581 @@ def load_book_into_database(file, engine, table):
         None
 
     """
-    # Read existing ids from the table
-    with engine.connect() as connection:
-        result = connection.execute(text(f"SELECT id FROM {table}"))
-        existing_ids = [row[0] for row in result]
-        
     # Read data from JSON file
-    with open(file, 'r', encoding='utf-8') as f:
-        data_json = json.load(f)
-        
-    # Check if id in the JSON data exists in the table
-    if data_json['id'] not in existing_ids:
+    with open(file, 'rb') as f:
+        data_json = serialization.load(f)
+
+    # Check if id in the JSON data exists in the table, with a primary key lookup
+    with engine.connect() as connection:
+        exists = connection.execute(text(f"SELECT 1 FROM {table} WHERE id = :id"), {'id': data_json['id']}).first() is not None
+
+    if not exists:
         # If it doesn't exist, insert the whole JSON object into the 'data' column
         id_value = data_json.pop('id')  # Remove 'id' from JSON and keep its value
         with engine.connect() as connection:
-            connection.execute(text(f"INSERT INTO {table} (id, data) VALUES (:id, :data)"), {'id': id_value, 'data': json.dumps(data_json)})
+            connection.execute(text(f"INSERT INTO {table} (id, data) VALUES (:id, :data)"), {'id': id_value, 'data': serialization.dumps(data_json)})
             connection.commit()
 
 
-def load_rank_into_database(file, engine, table):
+def _drop_existing_rows(data, engine, table, key_columns):
+    """
+    Removes from a batch the rows whose primary key is already in the table, or repeated in the batch.
+
+    Only the key columns of the rows of the books of the batch are read from the table, so that the cost depends on the batch, not on the table.
+
+    Args:
+        data (pd.DataFrame): the batch, with an 'id_book' column.
+        engine (Engine): The SQLAlchemy database connection.
+        table (str): The name of the table.
+        key_columns (list): The primary key columns of the table.
+
+    Returns:
+        pd.DataFrame: the new rows of the batch.
+
+    """
+    data = data.drop_duplicates(subset=key_columns)
+    if data.empty:
+        return data
+
+    # Read the keys of the same books only
+    query = text(f"SELECT {', '.join(key_columns)} FROM {table} WHERE id_book IN :id_books").bindparams(bindparam('id_books', expanding=True))
+    with engine.connect() as connection:
+        rows = connection.execute(query, {'id_books': [int(i) for i in data['id_book'].unique()]}).fetchall()
+    existing_keys = pd.DataFrame(rows, columns=key_columns).astype(data[key_columns].dtypes.to_dict())
+    if 'date' in key_columns:
+        existing_keys['date'] = pd.to_datetime(existing_keys['date'])
+
+    # Compare the keys as tuples
+    is_existing = pd.MultiIndex.from_frame(data[key_columns]).isin(pd.MultiIndex.from_frame(existing_keys))
+    return data[~is_existing]
+
+
+# Locking clause of the read of the stored books of a chunk, by SQL dialect, so that they are not updated concurrently before the upsert
+_FOR_UPDATE = {
+    'postgresql': " FOR UPDATE",
+}
+
+
+def _iter_books(file):
+    """Iterates over the books of a JSON array file, or of a JSON Lines file (.jsonl) with one book per line."""
+    if file.endswith('.jsonl'):
+        with open(file, 'rb') as f:
+            for line in f:
+                if line.strip():
+                    yield serialization.loads(line)
+    else:
+        yield from iter_json_array(file)
+
+
+def _fetch_stored_books(connection, table, ids):
+    """Reads the stored data of the books of a chunk that are already in the table, by id."""
+    query = text(f"SELECT id, data FROM {table} WHERE id IN :ids{_FOR_UPDATE.get(connection.dialect.name, '')}").bindparams(bindparam('ids', expanding=True))
+    stored = {}
+    for id_value, data in connection.execute(query, {'ids': ids}):
+        # JSONB is decoded by the driver, TEXT (SQLite) is not
+        stored[id_value] = serialization.loads(data) if isinstance(data, (str, bytes)) else data
+    return stored
+
+
+def _upsert_books(connection, table, books):
+    """Upserts a chunk of books with a single multi-row INSERT ... ON CONFLICT (id) DO UPDATE statement, after merging them with their stored data."""
+    dialect = connection.dialect.name
+    data_placeholder = "CAST(:data_{i} AS JSONB)" if dialect == 'postgresql' else ":data_{i}"
+
+    # Merge the books of the chunk sharing an id in order, since PostgreSQL cannot update the same row twice in one statement
+    chunk = {}
+    for book in books:
+        book = dict(book)
+        id_value = book.pop('id')
+        chunk[id_value] = merge_book_data(chunk[id_value], book) if id_value in chunk else book
+
+    # Read the stored data of the books already known, whose list fields are accumulated rather than replaced
+    stored = _fetch_stored_books(connection, table, list(chunk))
+
+    values = []
+    parameters = {}
+    for i, (id_value, book) in enumerate(chunk.items()):
+        values.append(f"(:id_{i}, {data_placeholder.format(i=i)})")
+        parameters[f"id_{i}"] = id_value
+        if id_value in stored:
+            book = merge_book_data(stored[id_value], book)
+        parameters[f"data_{i}"] = serialization.dumps(book)
+
+    connection.execute(text(f"INSERT INTO {table} (id, data) VALUES {', '.join(values)} "
+                            f"ON CONFLICT (id) DO UPDATE SET data = EXCLUDED.data"), parameters)
+
+
+def load_books_into_database(file, engine, table='book', chunk_size=1000):
+    """
+    Upserts all the books of a JSON array file (e.g. the book.json of combine_book_data) or of a JSON Lines file into the database.
+
+    The books are streamed and upserted by chunks of multi-row INSERT ... ON CONFLICT (id) DO UPDATE statements, in a single transaction. The books of a chunk sharing an id are first merged in file order, and the JSON data of a book already in the table is merged with the new one (records.merge_book_data): the new keys win, except the list fields, which accumulate the values of both, and an empty genre, which never replaces a known one. A delta of combine_new_book_data thus completes the stored history of a book instead of replacing it.
+
+    Args:
+        file (str): The path to the JSON or JSON Lines (.jsonl) file to be read, each book having an 'id' key.
+        engine (Engine): The SQLAlchemy database connection (PostgreSQL, or SQLite for the tests).
+        table (str): The name of the table within the database where the data will be stored.
+        chunk_size (int): The number of books per statement.
+
+    Returns:
+        int: the number of books upserted.
+
+    """
+    count = 0
+    books = _iter_books(file)
+    with engine.begin() as connection:
+        while True:
+            chunk = list(itertools.islice(books, chunk_size))
+            if not chunk:
+                break
+            _upsert_books(connection, table, chunk)
+            count += len(chunk)
+    return count
+
+
+def _book_stats_upsert(dialect, id_books, stats_table, tables):
+    """Returns the statement recomputing the book_stats rows of the books selected by the id_books SQL (a bind parameter or a subquery) from their rank and review rows."""
+    book_table, rank_table, review_table = tables
+    categories = _JSON_ARRAY_AGG[dialect].format(column='category')
+    return f"""
+        INSERT INTO {stats_table} (id_book, best_rank, max_weeks, first_date, last_date, categories, mean_first_stars, reviews_count)
+        SELECT b.id, r.best_rank, r.max_weeks, r.first_date, r.last_date, r.categories, v.mean_first_stars, COALESCE(v.reviews_count, 0)
+        FROM {book_table} AS b
+        LEFT JOIN (
+            SELECT id_book, MIN(rank) AS best_rank, MAX(weeks_on_list) AS max_weeks, MIN(date) AS first_date, MAX(date) AS last_date,
+                   {categories} AS categories
+            FROM {rank_table} WHERE id_book IN {id_books} GROUP BY id_book
+        ) AS r ON r.id_book = b.id
+        LEFT JOIN (
+            SELECT id_book, AVG(CASE WHEN id_review <= {FIRST_REVIEWS_COUNT:d} THEN stars END) AS mean_first_stars, COUNT(*) AS reviews_count
+            FROM {review_table} WHERE id_book IN {id_books} GROUP BY id_book
+        ) AS v ON v.id_book = b.id
+        WHERE b.id IN {id_books}
+        ON CONFLICT (id_book) DO UPDATE SET
+            best_rank = excluded.best_rank, max_weeks = excluded.max_weeks, first_date = excluded.first_date, last_date = excluded.last_date,
+            categories = excluded.categories, mean_first_stars = excluded.mean_first_stars, reviews_count = excluded.reviews_count
+        """
+
+
+def refresh_book_stats(connection, id_books, stats_table='book_stats', tables=('book', 'rank', 'review')):
+    """
+    Recomputes the book_stats rows (best rank, max weeks on list, first and last listed dates, categories, mean stars of the first reviews and number of reviews) of some books, after new rank or review rows of these books have been inserted.
+
+    Only the rows of the given books are read, through the primary key indexes of the rank and review tables, so that the cost of a refresh depends on the size of the load and not on the size of the history. It runs on the connection (and in the transaction) of the load.
+
+    Args:
+        connection (Connection): The SQLAlchemy connection of the load (PostgreSQL, or SQLite for the tests).
+        id_books (iterable): The ids of the books whose rows have changed.
+        stats_table (str): The name of the book_stats table.
+        tables (tuple): the names of the book, rank and review tables.
+
+    Returns:
+        None
+
+    """
+    id_books = sorted({int(id_book) for id_book in id_books})
+    if not id_books:
+        return
+    statement = text(_book_stats_upsert(connection.dialect.name, ':id_books', stats_table, tables))
+    connection.execute(statement.bindparams(bindparam('id_books', expanding=True)), {'id_books': id_books})
+
+
+# Whether a PostgreSQL table is partitioned (see doc/nyt-db/migrations/004_partition_rank_review.sql)
+_IS_PARTITIONED_QUERY = "SELECT COUNT(*) FROM pg_partitioned_table WHERE partrelid = to_regclass('{table}')"
+
+
+def rank_partition_name(table, year):
+    """Returns the name of the partition of a rank table holding the ranks of a year."""
+    return f"{table}_y{int(year):04d}"
+
+
+def _rank_partition_bounds(year):
+    """Returns the SQL bounds (inclusive, exclusive) of the dates of a yearly rank partition."""
+    return f"'{int(year):04d}-01-01'", f"'{int(year) + 1:04d}-01-01'"
+
+
+def _rank_partition_statements(table, years):
+    """Returns the statements creating the yearly partitions of a rank table (partitioned by range of date) that do not exist yet."""
+    statements = []
+    for year in sorted({int(year) for year in years}):
+        lower, upper = _rank_partition_bounds(year)
+        statements.append(f"CREATE TABLE IF NOT EXISTS {rank_partition_name(table, year)} PARTITION OF {table} FOR VALUES FROM ({lower}) TO ({upper})")
+    return statements
+
+
+def ensure_rank_partitions(connection, years, table='rank'):
+    """
+    Creates the missing yearly partitions of the rank table for the years of the ranks about to be inserted, as a row outside of every partition would be rejected.
+
+    Nothing is done if the database is not PostgreSQL (e.g. SQLite in the tests) or if the table is not partitioned (migration 004 not applied).
+
+    Args:
+        connection (Connection): The SQLAlchemy connection of the load.
+        years (iterable): The years of the dates of the ranks.
+        table (str): The name of the rank table.
+
+    Returns:
+        list: the names of the partitions of the years, or an empty list if the table is not partitioned.
+
+    """
+    if connection.dialect.name != 'postgresql' or not connection.exec_driver_sql(_IS_PARTITIONED_QUERY.format(table=table)).scalar():
+        return []
+
+    for statement in _rank_partition_statements(table, years):
+        connection.exec_driver_sql(statement)
+    return [rank_partition_name(table, year) for year in sorted({int(year) for year in years})]
+
+
+def attach_rank_partition(engine, partition, year, table='rank', stats_table='book_stats'):
+    """
+    Attaches a standalone table, bulk loaded beforehand, as the partition of a year of the rank table (e.g. for a backfill of a past year).
+
+    The table is created with 'CREATE TABLE rank_y2001 (LIKE rank INCLUDING DEFAULTS INCLUDING CONSTRAINTS)' and loaded (e.g. with copy_into_database, without refreshing the statistics) while the rank table stays available. A CHECK constraint matching the bounds of the partition is validated first, so that the attachment itself does not scan the rows under the lock of the rank table, and is then dropped. The statistics of the books of the partition are refreshed in the same transaction.
+
+    Args:
+        engine (Engine): The SQLAlchemy engine of the PostgreSQL database.
+        partition (str): The name of the loaded table (e.g. rank_partition_name('rank', 2001)).
+        year (int): The year of the dates of the table.
+        table (str): The name of the partitioned rank table.
+        stats_table (str): The name of the book_stats table, or None not to refresh it.
+
+    Returns:
+        None
+
+    """
+    lower, upper = _rank_partition_bounds(year)
+    constraint = f"{partition}_date_range"
+    with engine.begin() as connection:
+        connection.exec_driver_sql(f"ALTER TABLE {partition} ADD CONSTRAINT {constraint} CHECK (date >= {lower} AND date < {upper})")
+        connection.exec_driver_sql(f"ALTER TABLE {table} ATTACH PARTITION {partition} FOR VALUES FROM ({lower}) TO ({upper})")
+        connection.exec_driver_sql(f"ALTER TABLE {partition} DROP CONSTRAINT {constraint}")
+        if stats_table:
+            connection.exec_driver_sql(_book_stats_upsert('postgresql', f"(SELECT DISTINCT id_book FROM {partition})", stats_table, ('book', table, 'review')))
+
+
+def load_rank_into_database(file, engine, table, stats_table='book_stats'):
     """
     Uploads data 'rank' from a CSV file into a PostgreSQL database, while preventing duplicates.
 
-    This function reads a CSV file and uploads its data into a specified PostgreSQL database. It checks for duplicates based on the combination of 'id_book', 'date', and 'category' before appending the new data to the specified table in the database.
+    This function reads a CSV file (or a Parquet file or dataset) and uploads its data into a specified PostgreSQL database. It checks for duplicates based on the combination of 'id_book', 'date', and 'category' before appending the new data to the specified table in the database, reading from the table only the keys of the books of the file. The yearly partitions of the new dates are created if needed.
 
     Args:
-        file (str): The path to the CSV file to be read.
+        file (str): The path to the CSV or Parquet file to be read.
         engine (Engine): The SQLAlchemy database connection, to provide a source of database connectivity and behavior.
         table (str): The name of the table within the database where the data will be stored.
+        stats_table (str): The name of the book_stats table refreshed for the books of the new rows, or None not to refresh it.
 
     Returns:
         None
 
     """
-     # Read data from CSV file
-    data = pd.read_csv(file) 
-    
-    # Read existing data from the table
-    existing_data = pd.read_sql(table, engine)
-    
-    # Convert date column to datetime object in both dataframes for proper comparison
-    data['date'] = pd.to_datetime(data['date'])
-    existing_data['date'] = pd.to_datetime(existing_data['date'])
+    # Read data from CSV or Parquet file
+    data = _read_table_file(file)
 
-    # Combine the three columns to create a single identifier for each row
-    data['combined_key'] = data['id_book'].astype(str) + data['date'].astype(str) + data['category']
-    existing_data['combined_key'] = existing_data['id_book'].astype(str) + existing_data['date'].astype(str) + existing_data['category']
+    # Convert date column to datetime object for proper comparison
+    data['date'] = pd.to_datetime(data['date'])
 
-    # Only keep rows from the new data where combined_key does not exist in the existing data
-    data = data[~data.combined_key.isin(existing_data.combined_key)]
+    # Only keep the rows whose key does not exist in the table
+    data = _drop_existing_rows(data, engine, table, PRIMARY_KEYS['rank'])
 
-    # Drop the combined_key column as it's no longer needed
-    data.drop(columns=['combined_key'], inplace=True)
-    
-    # If there is any new data, append it to the table
+    # If there is any new data, append it to the table and refresh the statistics of its books, in the same transaction
     if len(data) > 0:
-        data.to_sql(table, engine, if_exists='append', index=False)
+        with engine.begin() as connection:
+            ensure_rank_partitions(connection, data['date'].dt.year.unique(), table)
+            data.to_sql(table, connection, if_exists='append', index=False)
+            if stats_table:
+                refresh_book_stats(connection, data['id_book'], stats_table, ('book', table, 'review'))
 
 
-def load_review_into_database(file, engine, table):
+def load_review_into_database(file, engine, table, stats_table='book_stats'):
     """
     Uploads data 'review' from a CSV file into a PostgreSQL database, while preventing duplicates.
 
-    This function reads a CSV file and uploads its data into a specified PostgreSQL database. It checks for duplicates based on the combination of 'id_book' and 'id_review'  before appending the new data to the specified table in the database.
+    This function reads a CSV file (or a Parquet file or dataset) and uploads its data into a specified PostgreSQL database. It checks for duplicates based on the combination of 'id_book' and 'id_review' before appending the new data to the specified table in the database, reading from the table only the keys of the books of the file.
 
     Args:
-        file (str): The path to the CSV file to be read.
+        file (str): The path to the CSV or Parquet file to be read.
         engine (Engine): The SQLAlchemy database connection, to provide a source of database connectivity and behavior.
         table (str): The name of the table within the database where the data will be stored.
+        stats_table (str): The name of the book_stats table refreshed for the books of the new rows, or None not to refresh it.
 
     Returns:
         None
 
     """
-     # Read data from CSV file
-    data = pd.read_csv(file)
-    print("data 1 :", data.shape)
-    # Read existing data from the table
-    existing_data = pd.read_sql(table, engine)
+    # Read data from CSV or Parquet file
+    data = _read_table_file(file)
 
-    # Convert date column to datetime object in both dataframes for proper comparison
+    # Convert date column to datetime object
     data['date'] = pd.to_datetime(data['date'])
-    existing_data['date'] = pd.to_datetime(existing_data['date'])
 
-    # Combine the two columns to create a single identifier for each row
-    # Pad 'id_review' with leading zeros to ensure consistent length
-    data['combined_key'] = data['id_book'].astype(str) + data['id_review'].astype(str).str.zfill(5)  # assuming max 99999 reviews
-    existing_data['combined_key'] = existing_data['id_book'].astype(str) + existing_data['id_review'].astype(str).str.zfill(5)
+    # Only keep the rows whose key does not exist in the table
+    data = _drop_existing_rows(data, engine, table, PRIMARY_KEYS['review'])
 
-    # Only keep rows from the new data where combined_key does not exist in the existing data
-    data = data[~data.combined_key.isin(existing_data.combined_key)]
-
-    # Drop the combined_key column as it's no longer needed
-    data.drop(columns=['combined_key'], inplace=True)
-    print("data 2 :", data.shape)
-    # If there is any new data, append it to the table
+    # If there is any new data, append it to the table and refresh the statistics of its books, in the same transaction
     if len(data) > 0:
-        data.to_sql(table, engine, if_exists='append', index=False)
+        with engine.begin() as connection:
+            data.to_sql(table, connection, if_exists='append', index=False)
+            if stats_table:
+                refresh_book_stats(connection, data['id_book'], stats_table, ('book', 'rank', table))
+
+
+def _open_csv_source(file):
+    """Opens a table file as a CSV text stream with a header, a Parquet file or dataset being converted on the fly."""
+    if parquet_store.is_parquet(file):
+        return io.StringIO(parquet_store.read_parquet_table(file).to_csv(index=False))
+    return open(file, 'r', newline='', encoding='utf-8')
+
+
+def copy_into_database(file, engine, table, key_columns, stats_table=None, tables=('book', 'rank', 'review'), year_partition_column=None, staging_types=None):
+    """
+    Bulk loads a CSV file (or a Parquet file or dataset) into a PostgreSQL table, the rows already present being skipped by the database.
+
+    The file is streamed with COPY FROM STDIN into a temporary table, which is then inserted into the table with ON CONFLICT DO NOTHING on its primary key, in a single transaction. Neither the table nor the file is read into memory. If a book_stats table is given, the statistics of the books of the file are refreshed in the same transaction.
+
+    Args:
+        file (str): The path to the CSV or Parquet file to be read, with a header naming the columns.
+        engine (Engine): The SQLAlchemy engine of the PostgreSQL database (psycopg2 driver).
+        table (str): The name of the table within the database where the data will be stored.
+        key_columns (list): The primary key columns of the table.
+        stats_table (str): The name of the book_stats table to refresh, or None not to refresh it.
+        tables (tuple): the names of the book, rank and review tables, read to refresh the book_stats table.
+        year_partition_column (str): The date column of a table partitioned by year, whose missing partitions are created before the insert, or None.
+        staging_types (dict): The types of the columns of the temporary table that differ from the table (e.g. {'stars': 'NUMERIC'}), the values being cast to the types of the table by the final insert.
+
+    Returns:
+        int: the number of rows inserted.
+
+    """
+    with _open_csv_source(file) as source:
+        # The columns of the file, in the order of its header
+        columns = ", ".join(next(csv.reader([source.readline()])))
+        source.seek(0)
+        temp_table = "tmp_" + table.replace(".", "_")
+
+        connection = engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute(f"CREATE TEMP TABLE {temp_table} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP")
+            for column, column_type in (staging_types or {}).items():
+                cursor.execute(f"ALTER TABLE {temp_table} ALTER COLUMN {column} TYPE {column_type}")
+            cursor.copy_expert(f"COPY {temp_table} ({columns}) FROM STDIN WITH (FORMAT csv, HEADER true)", source)
+            if year_partition_column:
+                cursor.execute(_IS_PARTITIONED_QUERY.format(table=table))
+                if cursor.fetchone()[0]:
+                    cursor.execute(f"SELECT DISTINCT EXTRACT(YEAR FROM {year_partition_column})::INT FROM {temp_table}")
+                    for statement in _rank_partition_statements(table, [row[0] for row in cursor.fetchall()]):
+                        cursor.execute(statement)
+            cursor.execute(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {temp_table} "
+                           f"ON CONFLICT ({', '.join(key_columns)}) DO NOTHING")
+            inserted = cursor.rowcount
+            if stats_table:
+                cursor.execute(_book_stats_upsert('postgresql', f"(SELECT DISTINCT id_book FROM {temp_table})", stats_table, tables))
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            connection.close()
+
+    return inserted
+
+
+def copy_rank_into_database(file, engine, table='rank', stats_table='book_stats'):
+    """
+    Bulk loads data 'rank' from a CSV or Parquet file into a PostgreSQL database with COPY, the duplicates on (id_book, date, category) being skipped by the database and the missing yearly partitions being created.
+
+    Args:
+        file (str): The path to the CSV or Parquet file to be read.
+        engine (Engine): The SQLAlchemy engine of the PostgreSQL database.
+        table (str): The name of the table within the database where the data will be stored.
+        stats_table (str): The name of the book_stats table refreshed for the books of the file, or None not to refresh it.
+
+    Returns:
+        int: the number of rows inserted.
+
+    """
+    return copy_into_database(file, engine, table, PRIMARY_KEYS['rank'], stats_table, ('book', table, 'review'), year_partition_column='date')
+
+
+def copy_review_into_database(file, engine, table='review', stats_table='book_stats'):
+    """
+    Bulk loads data 'review' from a CSV or Parquet file into a PostgreSQL database with COPY, the duplicates on (id_book, id_review) being skipped by the database.
+
+    Args:
+        file (str): The path to the CSV or Parquet file to be read.
+        engine (Engine): The SQLAlchemy engine of the PostgreSQL database.
+        table (str): The name of the table within the database where the data will be stored.
+        stats_table (str): The name of the book_stats table refreshed for the books of the file, or None not to refresh it.
+
+    Returns:
+        int: the number of rows inserted.
+
+    """
+    # The stars are staged as numbers, so that the files with decimal stars (e.g. '5.0') are rounded into the INT column
+    return copy_into_database(file, engine, table, PRIMARY_KEYS['review'], stats_table, ('book', 'rank', table), staging_types={'stars': 'NUMERIC'})
+
+
+def _insert_book(connection, table, book):
+    """Inserts a book dictionary (with its 'id') unless its id is already in the table."""
+    book = dict(book)
+    data_placeholder = "CAST(:data AS JSONB)" if connection.dialect.name == 'postgresql' else ":data"
+    connection.execute(text(f"INSERT INTO {table} (id, data) VALUES (:id, {data_placeholder}) ON CONFLICT (id) DO NOTHING"),
+                       {'id': book.pop('id'), 'data': serialization.dumps(book)})
+
+
+def _insert_rows(connection, table, columns, key_columns, rows):
+    """Inserts rows (lists in the order of columns) in one executemany, the rows whose primary key is already in the table being skipped."""
+    if not rows:
+        return
+    statement = text(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(':' + c for c in columns)}) "
+                     f"ON CONFLICT ({', '.join(key_columns)}) DO NOTHING")
+    connection.execute(statement, [dict(zip(columns, row)) for row in rows])
+
+
+def _append_review_ids(connection, review_table, id_book, reviews):
+    """Numbers the review rows of a book after the reviews already stored for it."""
+    last_id = connection.execute(text(f"SELECT COALESCE(MAX(id_review), 0) FROM {review_table} WHERE id_book = :id_book"), {'id_book': id_book}).scalar()
+    return [[row[0], row[1] + last_id] + list(row[2:]) for row in reviews]
+
+
+def load_best_seller_into_database(engine, book, ranks, reviews, tables=('book', 'rank', 'review'), stats_table='book_stats', append=False, aliases=None):
+    """
+    Loads a new best-seller (its book, ranks and reviews) into the database atomically, with a single connection and transaction.
+
+    Either the 3 tables (and the book_stats row of the book) are written, or none of them is (e.g. if the ranks fail to load after the book), so that readers never see a book without its ranks. The rows already present are skipped by the database on their primary key. The aliases of an identity index are merged in the same transaction, so that readers never see the new book next to a book it has been found to be the same as.
+
+    Args:
+        engine (Engine): The SQLAlchemy database connection.
+        book (dict): the book table item, with its 'id'.
+        ranks (list): the rank rows, in the order of Rank.COLUMNS.
+        reviews (list): the review rows, in the order of Review.COLUMNS.
+        tables (tuple): the names of the book, rank and review tables.
+        stats_table (str): The name of the book_stats table, or None not to refresh it.
+        append (bool): whether the best-seller may be a new Amazon page of a stored book, e.g. resolved by an identity index. The book is then merged with the stored one (records.merge_book_data) and its reviews are numbered after the stored reviews of the book, instead of being skipped as duplicates. Only for best-sellers not loaded yet, since a second load would append the reviews again.
+        aliases (dict): if given, the aliases of an identity index, merged after the load as by apply_book_aliases.
+
+    Returns:
+        int: the id of the book loaded, or of the book it has been merged into by the aliases.
+
+    """
+    book_table, rank_table, review_table = tables
+    resolved = _resolve_aliases(aliases or {})
+    with engine.begin() as connection:
+        if append:
+            _upsert_books(connection, book_table, [book])
+            reviews = _append_review_ids(connection, review_table, book['id'], reviews)
+        else:
+            _insert_book(connection, book_table, book)
+        ensure_rank_partitions(connection, [str(rank[1])[:4] for rank in ranks if rank[1]], rank_table)
+        _insert_rows(connection, rank_table, Rank.COLUMNS, PRIMARY_KEYS['rank'], ranks)
+        _insert_rows(connection, review_table, Review.COLUMNS, PRIMARY_KEYS['review'], reviews)
+        if stats_table:
+            refresh_book_stats(connection, [book['id']], stats_table, tables)
+        _merge_book_aliases(connection, resolved, tables, stats_table)
+    return resolved.get(book['id'], book['id'])
+
+
+# Conversions of the CSV values of the rank and review files into the types of their columns (the dates staying ISO strings)
+_CSV_COLUMN_TYPES = {
+    'rank': [int, str, str, int, int, int],
+    'review': [int, int, parse_stars, str, str, str],
+}
+
+
+def _read_csv_rows(file, types):
+    """Reads the rows of a CSV file without its header, converting the values with the types of their columns, the empty values being read as None (NULL)."""
+    with open(file, 'r', newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        next(reader)  # Skip header
+        return [[convert(value) if value != '' else None for convert, value in zip(types, row)] for row in reader]
+
+
+def load_best_seller_files_into_database(book_file, rank_file, review_file, engine, tables=('book', 'rank', 'review'), stats_table='book_stats'):
+    """
+    Loads the book.json, rank.csv and review.csv files of a new best-seller into the database atomically, with load_best_seller_into_database.
+
+    Args:
+        book_file (str): The path to the JSON file of the book.
+        rank_file (str): The path to the CSV file of the ranks.
+        review_file (str): The path to the CSV file of the reviews.
+        engine (Engine): The SQLAlchemy database connection.
+        tables (tuple): the names of the book, rank and review tables.
+        stats_table (str): The name of the book_stats table, or None not to refresh it.
+
+    Returns:
+        None
+
+    """
+    with open(book_file, 'rb') as f:
+        book = serialization.load(f)
+
+    load_best_seller_into_database(engine, book, _read_csv_rows(rank_file, _CSV_COLUMN_TYPES['rank']),
+                                   _read_csv_rows(review_file, _CSV_COLUMN_TYPES['review']), tables, stats_table)
+
+
+def _resolve_aliases(aliases):
+    """Follows the chains of merges of identity index aliases (whose keys are strings) to the final id, so that a book is never merged into a book which has itself been merged."""
+    aliases = {int(merged): int(kept) for merged, kept in aliases.items()}
+    resolved = {}
+    for merged_id in aliases:
+        kept_id = merged_id
+        while kept_id in aliases:
+            kept_id = aliases[kept_id]
+        resolved[merged_id] = kept_id
+    return resolved
+
+
+def _merge_book_aliases(connection, resolved, tables, stats_table):
+    """Merges each merged id of the resolved aliases into its final id, on the connection (and in the transaction) of the caller, and returns the merged ids found in the book table."""
+    book_table, rank_table, review_table = tables
+    rank_columns = ', '.join(Rank.COLUMNS[1:])
+    review_columns = ', '.join(Review.COLUMNS[2:])
+
+    merged_ids = []
+    kept_ids = set()
+    for merged_id, kept_id in sorted(resolved.items()):
+        stored = _fetch_stored_books(connection, book_table, [merged_id, kept_id])
+        if merged_id == kept_id or merged_id not in stored:
+            continue
+
+        # The stored values of the kept book win, the list fields accumulating the values of both
+        data = merge_book_data(stored[merged_id], stored[kept_id]) if kept_id in stored else stored[merged_id]
+        _upsert_books(connection, book_table, [dict(data, id=kept_id)])
+
+        # Move the ranks and the reviews, then delete the merged book
+        parameters = {'merged_id': merged_id, 'kept_id': kept_id}
+        connection.execute(text(f"INSERT INTO {rank_table} (id_book, {rank_columns}) SELECT :kept_id, {rank_columns} FROM {rank_table} "
+                                f"WHERE id_book = :merged_id ON CONFLICT ({', '.join(PRIMARY_KEYS['rank'])}) DO NOTHING"), parameters)
+        connection.execute(text(f"INSERT INTO {review_table} (id_book, id_review, {review_columns}) "
+                                f"SELECT :kept_id, id_review + (SELECT COALESCE(MAX(id_review), 0) FROM {review_table} WHERE id_book = :kept_id), {review_columns} "
+                                f"FROM {review_table} WHERE id_book = :merged_id"), parameters)
+        for table, column in [(rank_table, 'id_book'), (review_table, 'id_book'), (stats_table, 'id_book'), (book_table, 'id')]:
+            if table:
+                connection.execute(text(f"DELETE FROM {table} WHERE {column} = :merged_id"), parameters)
+        merged_ids.append(merged_id)
+        kept_ids.add(kept_id)
+
+    if stats_table:
+        refresh_book_stats(connection, kept_ids, stats_table, tables)
+    return merged_ids
+
+
+def apply_book_aliases(engine, aliases, tables=('book', 'rank', 'review'), stats_table='book_stats'):
+    """
+    Merges in the database the books found to be the same book by an identity index (see identity_index.IdentityIndex.aliases), after they were loaded under different ids.
+
+    For each merged id, the data of its book are merged into the book it resolves to, its rank rows are moved to that book (the ranks it already has being kept), its reviews are numbered after the reviews of that book, and the merged book is deleted with its book_stats row. Everything runs in a single transaction, and a merged id no longer in the book table is skipped, so that the aliases can be applied again at every run. To merge them in the transaction of the load of a new best-seller, pass them to load_best_seller_into_database instead.
+
+    Args:
+        engine (Engine): The SQLAlchemy database connection (PostgreSQL, or SQLite for the tests).
+        aliases (dict): the id each merged id has been merged into, e.g. the 'aliases' of the identity index (whose keys are strings). The chains of merges are followed to the final id.
+        tables (tuple): the names of the book, rank and review tables.
+        stats_table (str): The name of the book_stats table, or None if there is none.
+
+    Returns:
+        list: the merged ids that were found in the book table and merged.
+
+    """
+    with engine.begin() as connection:
+        return _merge_book_aliases(connection, _resolve_aliases(aliases), tables, stats_table)
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 2026-10-19
+
+@author: Roland
+
+@abstract: optional columnar storage of the raw and processed data layers in Parquet (Arrow) format. The best-seller and rank data are partitioned by year/week/category and the review data by ranges of book ids, so that readers only open the partitions and the columns they need. This layer requires the 'pyarrow' package, which is not installed by default.
+
+"""
+
+import os
+import pandas as pd
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+from src.data_collection import serialization
+
+
+# Number of consecutive book ids stored in the same review partition
+REVIEW_BUCKET_SIZE = 1000
+
+# Technical columns only used to partition the datasets
+PARTITION_COLUMNS = ['year', 'week', 'book_bucket']
+
+
+def _require_pyarrow():
+    """Raises an explicit error when the optional 'pyarrow' dependency is missing."""
+    if pyarrow is None:
+        raise ImportError("The Parquet storage layer requires the 'pyarrow' package: pip install pyarrow")
+
+
+def _add_week_partitions(df, date_column):
+    """Adds the ISO 'year' and 'week' partition columns computed from a date column."""
+    iso = pd.to_datetime(df[date_column]).dt.isocalendar()
+    df['year'] = iso['year'].astype('int32')
+    df['week'] = iso['week'].astype('int32')
+    return df
+
+
+def best_sellers_to_parquet(best_sellers_json, output_dir):
+    """
+    Converts a best-seller JSON file into a Parquet dataset partitioned by year, week and category.
+
+    Args:
+        best_sellers_json (str): The path to the JSON file with best seller books data.
+        output_dir (str): The directory of the Parquet dataset.
+
+    Returns:
+        None
+
+    Raises:
+        ImportError: If 'pyarrow' is not installed.
+
+    """
+    _require_pyarrow()
+
+    with open(best_sellers_json, "rb") as f:
+        df = pd.DataFrame(serialization.load(f))
+
+    df = _add_week_partitions(df, 'bestsellers_date')
+    df.to_parquet(output_dir, partition_cols=['year', 'week', 'category'], index=False)
+
+
+def book_to_parquet(book_json, output_file):
+    """
+    Converts the book JSON file produced by combine_book_data into a single Parquet file.
+
+    Args:
+        book_json (str): The path to the JSON file with the book table.
+        output_file (str): The path of the Parquet file.
+
+    Returns:
+        None
+
+    Raises:
+        ImportError: If 'pyarrow' is not installed.
+
+    """
+    _require_pyarrow()
+
+    with open(book_json, "rb") as f:
+        df = pd.DataFrame(serialization.load(f))
+
+    df.to_parquet(output_file, index=False)
+
+
+def rank_to_parquet(rank_csv, output_dir):
+    """
+    Converts the rank CSV file into a Parquet dataset partitioned by year, week and category.
+
+    Args:
+        rank_csv (str): The path to the CSV file with the rank table.
+        output_dir (str): The directory of the Parquet dataset.
+
+    Returns:
+        None
+
+    Raises:
+        ImportError: If 'pyarrow' is not installed.
+
+    """
+    _require_pyarrow()
+
+    df = pd.read_csv(rank_csv)
+    df = _add_week_partitions(df, 'date')
+    df.to_parquet(output_dir, partition_cols=['year', 'week', 'category'], index=False)
+
+
+def review_to_parquet(review_csv, output_dir):
+    """
+    Converts the review CSV file into a Parquet dataset partitioned by ranges of REVIEW_BUCKET_SIZE book ids.
+
+    Args:
+        review_csv (str): The path to the CSV file with the review table.
+        output_dir (str): The directory of the Parquet dataset.
+
+    Returns:
+        None
+
+    Raises:
+        ImportError: If 'pyarrow' is not installed.
+
+    """
+    _require_pyarrow()
+
+    df = pd.read_csv(review_csv)
+    df['book_bucket'] = (df['id_book'] // REVIEW_BUCKET_SIZE).astype('int32')
+    df.to_parquet(output_dir, partition_cols=['book_bucket'], index=False)
+
+
+def read_parquet_table(path, columns=None, filters=None):
+    """
+    Reads a Parquet file or dataset into a DataFrame, reading only the requested columns and partitions.
+
+    The partition columns are restored to their original type, and the technical ones ('year', 'week', 'book_bucket') are dropped unless explicitly requested.
+
+    Args:
+        path (str): The path of the Parquet file or dataset directory.
+        columns (list): The columns to read, None to read them all.
+        filters (list): pyarrow filters, e.g. [('category', '=', 'Hardcover Fiction')], None to read all the rows.
+
+    Returns:
+        pd.DataFrame: the table.
+
+    Raises:
+        ImportError: If 'pyarrow' is not installed.
+
+    """
+    _require_pyarrow()
+
+    df = pd.read_parquet(path, columns=columns, filters=filters)
+
+    # Hive partitions are read back as categories
+    for column in df.columns:
+        if isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype(df[column].cat.categories.dtype)
+
+    technical_columns = [c for c in PARTITION_COLUMNS if c in df.columns and not (columns and c in columns)]
+    return df.drop(columns=technical_columns)
+
+
+def read_reviews_parquet(path, id_books=None, columns=None):
+    """
+    Reads the reviews of some books from the review Parquet dataset, opening only the partitions of these books.
+
+    Args:
+        path (str): The directory of the review Parquet dataset.
+        id_books (list): The ids of the books, None to read all the reviews.
+        columns (list): The columns to read, None to read them all.
+
+    Returns:
+        pd.DataFrame: the reviews.
+
+    Raises:
+        ImportError: If 'pyarrow' is not installed.
+
+    """
+    filters = None
+    if id_books is not None:
+        id_books = [int(i) for i in id_books]
+        buckets = sorted({i // REVIEW_BUCKET_SIZE for i in id_books})
+        filters = [('book_bucket', 'in', buckets), ('id_book', 'in', id_books)]
+
+    return read_parquet_table(path, columns=columns, filters=filters)
+
+
+def is_parquet(path):
+    """Returns True if the path is a Parquet file or a Parquet dataset directory."""
+    return path.endswith('.parquet') or os.path.isdir(path)
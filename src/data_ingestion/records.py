@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 2026-10-19
+
+@author: Roland
+
+@abstract: typed records of the 3 relational tables (book, rank and review). The records are slotted dataclasses, validated once at construction, and serialized cheaply into the rows of the CSV files (and of the database COPY) or into the dictionaries of the JSON files.
+
+"""
+
+from dataclasses import dataclass, fields
+from typing import Any, ClassVar, List, Optional
+
+
+def _check_type(record, name, expected_type, type_name, label=None):
+    """Raises a TypeError if a field of a record is not of the expected type."""
+    if not isinstance(getattr(record, name), expected_type):
+        raise TypeError(f"{label or name} must be {type_name}")
+
+
+def parse_stars(value):
+    """
+    Converts the stars of an Amazon review, scraped as a string (e.g. '5.0'), into the integer of the 'stars' column of the review table.
+
+    Returns:
+        int: the number of stars, or None if the value is empty or not a number.
+
+    """
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass(slots=True)
+class Book:
+    """An item of the book table: the best-seller fields, completed with the Amazon page and the Apple Books genre."""
+    LIST_FIELDS: ClassVar[List[str]] = ['isbn10', 'isbn13', 'book_uri', 'description', 'price', 'asterisk']
+
+    id: int
+    url: str
+    title: str
+    author: str
+    isbn10: List[Optional[str]]
+    isbn13: List[Optional[str]]
+    book_uri: List[str]
+    contributor: str
+    description: List[str]
+    publisher: str
+    price: List[Any]
+    dagger: Any
+    asterisk: List[Any]
+    genre: Any
+    rating: Optional[str] = None
+    number_of_stars: Any = None
+    number_of_pages: Any = None
+    language: Optional[str] = None
+    publication_date: Optional[str] = None
+    reviews_count: Optional[int] = None
+
+    def __post_init__(self):
+        _check_type(self, 'id', int, "an integer")
+
+    def to_dict(self):
+        """Returns the book as the dictionary stored in the JSON file and in the 'data' column of the database."""
+        return {field.name: getattr(self, field.name) for field in fields(self)}
+
+
+def merge_book_data(stored, new):
+    """
+    Merges the data of a book with the stored data of the same book, e.g. a delta of an incremental run with the row already in the database.
+
+    The new scalar values win, but the list fields accumulate the values of both, in order of first appearance, and an empty genre never replaces a known one. The 'url' is the new Amazon page of the book, and when it differs from the stored one, every Amazon URL of the book is kept in the 'urls' list, so that none of its pages is scraped again.
+
+    Args:
+        stored (dict): the stored data of the book.
+        new (dict): the new data of the book.
+
+    Returns:
+        dict: the merged data.
+
+    """
+    merged = {**stored, **new}
+    for field in Book.LIST_FIELDS:
+        if field in stored and field in new:
+            merged[field] = list(stored[field]) + [value for value in new[field] if value not in stored[field]]
+    if not new.get('genre') and stored.get('genre'):
+        merged['genre'] = stored['genre']
+    urls = _book_urls(stored)
+    urls += [url for url in _book_urls(new) if url not in urls]
+    if len(urls) > 1:
+        merged['urls'] = urls
+    return merged
+
+
+def _book_urls(data):
+    """Returns every Amazon URL of the data of a book: its 'urls' list, or its single 'url'."""
+    return list(data.get('urls') or ([data['url']] if data.get('url') else []))
+
+
+@dataclass(slots=True)
+class Rank:
+    """An item of the rank table: the rank of a book in a best-seller list, for a given category and date."""
+    COLUMNS: ClassVar[List[str]] = ['id_book', 'date', 'category', 'rank', 'rank_last_week', 'weeks_on_list']
+
+    id_book: int
+    date: str
+    category: str
+    rank: int
+    rank_last_week: int
+    weeks_on_list: int
+
+    def __post_init__(self):
+        _check_type(self, 'date', str, "a string", label="bestsellers_date")
+        _check_type(self, 'category', str, "a string")
+        _check_type(self, 'rank', int, "an integer")
+        _check_type(self, 'rank_last_week', int, "an integer")
+        _check_type(self, 'weeks_on_list', int, "an integer")
+
+    def to_row(self):
+        """Returns the rank as a row of the CSV file, in the order of COLUMNS."""
+        return [self.id_book, self.date, self.category, self.rank, self.rank_last_week, self.weeks_on_list]
+
+
+@dataclass(slots=True)
+class Review:
+    """An item of the review table: a review of a book on its Amazon page. The date is None if it could not be parsed."""
+    COLUMNS: ClassVar[List[str]] = ['id_book', 'id_review', 'stars', 'title', 'text', 'date']
+
+    id_book: int
+    id_review: int
+    stars: Any
+    title: str
+    text: str
+    date: Optional[str]
+
+    def to_row(self):
+        """Returns the review as a row of the CSV file, in the order of COLUMNS."""
+        return [self.id_book, self.id_review, self.stars, self.title, self.text, self.date]
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 2026-10-19
+
+@author: Roland
+
+@abstract: parallel version of the extract/transform of the 3 relational tables (book, rank and review). The book ids are assigned in a first pass, then the best-seller and Amazon inputs are partitioned by a hash of the Amazon URL, each shard is transformed in its own process with the builders of extract_transform, and the shard outputs are merged back in the order of the serial functions.
+
+"""
+
+import os
+import csv
+import heapq
+import tempfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+from src.data_collection import serialization
+from src.data_collection.json_tools import iter_json_array
+from src.data_ingestion import extract_transform as et
+from src.data_ingestion.records import Rank, Review
+
+
+def assign_book_ids(best_sellers_json, url_to_id=None, next_id=1):
+    """
+    Assigns a book id to each Amazon URL of the best-seller records, in order of first appearance, like combine_book_data.
+
+    Args:
+        best_sellers_json (str): The path to the JSON file with best seller books data.
+        url_to_id (dict): ids already assigned to Amazon URLs, e.g. the 'ids' of an incremental index, None if there are none.
+        next_id (int): the id of the first new book.
+
+    Returns:
+        dict: the id of each Amazon URL.
+
+    """
+    url_to_id = dict(url_to_id or {})
+    for record in iter_json_array(best_sellers_json):
+        amazon_url = record["amazon_product_url"]
+        if amazon_url is not None and amazon_url not in url_to_id:
+            url_to_id[amazon_url] = next_id
+            next_id += 1
+    return url_to_id
+
+
+def shard_of(url, shards):
+    """Returns the shard of an Amazon URL, stable across processes and runs (unlike the built-in hash)."""
+    return zlib.crc32(url.encode('utf-8')) % shards
+
+
+def _partition(json_file, url_field, shard_files):
+    """Splits the items of a JSON array between JSON Lines shard files by URL, each line being [sequence number, item]. The items without URL are left out."""
+    for sequence, item in enumerate(iter_json_array(json_file)):
+        url = item[url_field]
+        if url is not None:
+            shard_file = shard_files[shard_of(url, len(shard_files))]
+            shard_file.write(serialization.dumps([sequence, item]))
+            shard_file.write("\n")
+
+
+def partition_inputs(best_sellers_json, merged_amazon_books_json, work_dir, shards):
+    """
+    Partitions the best-seller and Amazon inputs into shards by a hash of the Amazon URL, so that all the data of a book are in the same shard.
+
+    Args:
+        best_sellers_json (str): The path to the JSON file with best seller books data.
+        merged_amazon_books_json (str): The path to the JSON file with merged Amazon books data.
+        work_dir (str): The directory of the shard files.
+        shards (int): the number of shards.
+
+    Returns:
+        list: for each shard, the paths of its best-seller and Amazon JSON Lines files.
+
+    """
+    paths = [(os.path.join(work_dir, f"best_sellers_{i}.jsonl"), os.path.join(work_dir, f"amazon_{i}.jsonl")) for i in range(shards)]
+
+    for position, (json_file, url_field) in enumerate([(best_sellers_json, "amazon_product_url"), (merged_amazon_books_json, "url")]):
+        shard_files = [open(shard_paths[position], "w", encoding='utf-8') for shard_paths in paths]
+        try:
+            _partition(json_file, url_field, shard_files)
+        finally:
+            for shard_file in shard_files:
+                shard_file.close()
+
+    return paths
+
+
+def _read_shard(path):
+    """Reads the [sequence number, item] lines of a JSON Lines shard file."""
+    with open(path, "rb") as f:
+        for line in f:
+            yield serialization.loads(line)
+
+
+def _records_of(path, sequences):
+    """Yields the items of a JSON Lines shard file, appending their sequence numbers to sequences."""
+    for sequence, item in _read_shard(path):
+        sequences.append(sequence)
+        yield item
+
+
+def _write_lines(rows, path):
+    """Writes rows to a JSON Lines file."""
+    with open(path, "w", encoding='utf-8') as f:
+        for row in rows:
+            f.write(serialization.dumps(row))
+            f.write("\n")
+
+
+def transform_shard(best_sellers_jsonl, amazon_jsonl, apple_store_books_csv, url_to_id, output_prefix):
+    """
+    Builds the book, rank and review rows of a shard, with the builders of extract_transform. Run in a worker process.
+
+    The outputs are JSON Lines files, each line being [sort key, row]: the book id for the books, the sequence number of the source record for the ranks and reviews, so that the shards can be merged in the order of the serial functions.
+
+    Args:
+        best_sellers_jsonl (str): The path to the best-seller shard file.
+        amazon_jsonl (str): The path to the Amazon shard file.
+        apple_store_books_csv (str): The path to the CSV file with Apple Store books data.
+        url_to_id (dict): the id of each Amazon URL of the shard.
+        output_prefix (str): The prefix of the paths of the book, rank and review output files.
+
+    Returns:
+        tuple: the paths of the book, rank and review output files, and the number of reviews with an unparseable date.
+
+    """
+    apple_data = et.read_apple_genres(apple_store_books_csv)
+
+    # Book and rank tables, in a single pass over the best-seller records, which all have a book id so that rank row i is record i
+    record_sequences = []
+    ranks = et.RankColumns()
+    books, _ = et.accumulate_best_sellers(_records_of(best_sellers_jsonl, record_sequences), apple_data, url_to_id, ranks=ranks)
+
+    # Rank rows deduplicated on the natural key; the keys of different shards never collide since they contain the book id
+    indices, rows = ranks.unique_rows()
+    rank_rows = ([record_sequences[i], row] for i, row in zip(indices, rows))
+
+    # Amazon data and review rows, in a single pass over the Amazon items, the reviews being numbered per book as in write_reviews (all the items of a book are in the same shard)
+    amazon_index = {}
+    review_rows = []
+    review_sequences = []
+    date_texts = []
+    review_counts = {}
+    for sequence, item in _read_shard(amazon_jsonl):
+        accumulator = books.get(item['url'])
+        if accumulator is not None:
+            amazon_index[item['url']] = et.amazon_book_fields(item)
+            et.add_review_rows(item, accumulator.id, review_rows, date_texts, review_counts)
+            review_sequences.extend([sequence] * len(item['reviews']))
+    dates, unparseable = et.convert_to_dates(date_texts)
+    for row, date in zip(review_rows, dates):
+        row.append(date)
+    review_rows = zip(review_sequences, review_rows)
+
+    # Books in id order
+    book_rows = sorted(([accumulator.id, accumulator.to_dict(amazon_index.get(accumulator.url))] for accumulator in books.values()), key=lambda row: row[0])
+
+    paths = tuple(f"{output_prefix}_{table}.jsonl" for table in ["book", "rank", "review"])
+    for rows, path in zip([book_rows, rank_rows, review_rows], paths):
+        _write_lines(rows, path)
+
+    return paths + (len(unparseable),)
+
+
+def _merge_shards(paths):
+    """Merges the [sort key, row] lines of sorted shard files, yielding the rows in the global order."""
+    return (row for _, row in heapq.merge(*[_read_shard(path) for path in paths], key=lambda line: line[0]))
+
+
+def sharded_transform(best_sellers_json, merged_amazon_books_json, apple_store_books_csv, book_json, rank_csv, review_csv,
+                      shards=None, max_workers=None, work_dir=None):
+    """
+    Builds the book, rank and review tables in parallel, giving the same files as combine_book_data, write_rank and write_reviews.
+
+    Args:
+        best_sellers_json (str): The path to the JSON file with best seller books data.
+        merged_amazon_books_json (str): The path to the JSON file with merged Amazon books data.
+        apple_store_books_csv (str): The path to the CSV file with Apple Store books data.
+        book_json (str): The path to the JSON file where the book table will be saved.
+        rank_csv (str): The path to the CSV file where the rank table will be saved.
+        review_csv (str): The path to the CSV file where the review table will be saved.
+        shards (int): the number of shards, the number of CPUs by default.
+        max_workers (int): the maximum number of worker processes, the number of CPUs by default.
+        work_dir (str): The directory of the intermediate shard files, a temporary directory by default.
+
+    Returns:
+        None
+
+    """
+    shards = shards or os.cpu_count() or 1
+
+    with tempfile.TemporaryDirectory(dir=work_dir) as tmp_dir:
+        # Assign the ids globally, then split the inputs by book
+        url_to_id = assign_book_ids(best_sellers_json)
+        shard_paths = partition_inputs(best_sellers_json, merged_amazon_books_json, tmp_dir, shards)
+        shard_ids = [{} for _ in range(shards)]
+        for url, id_book in url_to_id.items():
+            shard_ids[shard_of(url, shards)][url] = id_book
+
+        # Transform the shards in parallel
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(transform_shard, best_sellers_jsonl, amazon_jsonl, apple_store_books_csv, shard_ids[i],
+                                       os.path.join(tmp_dir, f"shard_{i}"))
+                       for i, (best_sellers_jsonl, amazon_jsonl) in enumerate(shard_paths)]
+            outputs = [future.result() for future in futures]
+
+        # Merge the shard outputs
+        with open(book_json, "w", encoding='utf-8') as f:
+            f.write("[")
+            for i, book in enumerate(_merge_shards([output[0] for output in outputs])):
+                if i:
+                    f.write(",")
+                serialization.dump(book, f)
+            f.write("]")
+
+        for path, paths, header in [(rank_csv, [output[1] for output in outputs], Rank.COLUMNS),
+                                    (review_csv, [output[2] for output in outputs], Review.COLUMNS)]:
+            with open(path, 'w', newline='', encoding='utf-8') as csv_file:
+                writer = csv.writer(csv_file)
+                writer.writerow(header)
+                writer.writerows(_merge_shards(paths))
+
+    unparseable = sum(output[3] for output in outputs)
+    if unparseable:
+        print(f"{unparseable} review(s) with an unparseable date")
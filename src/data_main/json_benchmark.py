@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 2026-10-19
+
+@author: Roland
+
+@abstract: measure the load and dump times of the JSON backends available in the serialization module, on a year of best-seller data (e.g. 'best_sellers_2022_None_None.json').
+
+"""
+
+import os
+import sys
+import time
+import json
+
+# Getting the absolute path of the current script file
+current_script_path = os.path.abspath(__file__)
+# Getting the directory of the current script file
+current_script_dir = os.path.dirname(current_script_path)
+# Constructing the absolute path of the src directory
+src_dir = os.path.join(current_script_dir, '../..')
+# Adding the absolute path to system path
+sys.path.append(src_dir)
+from config import RAW_DATA_ABS_PATH
+from src.data_collection import serialization
+
+
+def _best_time(function, repeat):
+    """Returns the best wall-clock time, in seconds, of several calls to a function."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def benchmark_json_backends(json_file, repeat=5):
+    """
+    Measures, for each JSON backend, the time to load a file and to dump its content, plus the time of the typed decoding into BestSeller records.
+
+    Args:
+        json_file (str): The path to the JSON file with best seller books data.
+        repeat (int): the number of measures, the best one being kept.
+
+    Returns:
+        dict: for each backend, a dictionary with the 'load' and 'dump' times in seconds.
+
+    """
+    with open(json_file, "rb") as f:
+        raw = f.read()
+    data = json.loads(raw)
+
+    default = serialization.get_backend()
+    results = {}
+    try:
+        for name in ('json', 'orjson', 'msgspec'):
+            serialization.set_backend(name)
+            results[name] = {
+                'load': _best_time(lambda: serialization.loads(raw), repeat),
+                'dump': _best_time(lambda: serialization.dumps(data), repeat),
+            }
+    finally:
+        serialization.set_backend(default)
+
+    results['msgspec (typed)'] = {
+        'load': _best_time(lambda: serialization.load_best_sellers(json_file), repeat),
+        'dump': None,
+    }
+
+    return results
+
+
+def main():
+    """
+    Runs the benchmark on the best-seller file of the year given by the YEAR environment variable (2022 by default), and prints the results.
+
+    """
+    year = os.environ.get("YEAR", "2022")
+    json_file = os.path.join(RAW_DATA_ABS_PATH, f'best_sellers_{year}_None_None.json')
+
+    size = os.path.getsize(json_file) / 1e6
+    print(f"{json_file} : {size:.1f} MB")
+    print(f"{'backend':<16}{'load (ms)':>12}{'dump (ms)':>12}")
+    for name, timings in benchmark_json_backends(json_file).items():
+        dump = f"{timings['dump'] * 1000:>12.1f}" if timings['dump'] is not None else f"{'-':>12}"
+        print(f"{name:<16}{timings['load'] * 1000:>12.1f}{dump}")
+
+
+if __name__ == "__main__":
+    main()
@@ -11,8 +11,7 @@ Created on 2023-07-25
 
 import os
 import sys
-import json
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 import dash
 import dash_bootstrap_components as dbc
 from dash import dcc, html
@@ -28,14 +27,22 @@ current_script_dir = os.path.dirname(current_script_path)
 src_dir = os.path.join(current_script_dir, '../..')
 # Adding the absolute path to system path
 sys.path.append(src_dir)
-from config import DB_ENGINE, RAW_DATA_ABS_PATH, PROC_DATA_ABS_PATH
-from src.data_ingestion.load import load_book_into_database, load_rank_into_database, load_review_into_database
+from config import DB_STATEMENT_TIMEOUT, IDENTITY_INDEX_JSON, RAW_DATA_ABS_PATH, SAVE_PROCESSED_FILES
+from src.data_ingestion.identity_index import IdentityIndex
+from src.data_ingestion.load import load_best_seller_into_database
+from src.database import get_engine
 from src.data_main.raw_data_summary import data_collection
 from src.data_main.raw_data_transformation import extract_transform
+from src.data_collection import serialization
 
 
-# Create a SQLAlchemy engine that will interface with the database.
-engine = create_engine(DB_ENGINE)
+# Create the SQLAlchemy engines that will interface with the database: the one of the pipeline, without statement timeout,
+# and the one of the dashboard queries, with the statement timeout of the interactive readers
+engine = get_engine('nyt-data-pipeline')
+dashboard_engine = get_engine('nyt-dashboard', DB_STATEMENT_TIMEOUT)
+
+# Id of the bestseller displayed by the dashboard, set by main to the book it has just loaded
+new_book_id = None
 
 # Dashboard preparation
 app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
@@ -70,60 +77,66 @@ def render_content(tab):
         ValueError: If an unsupported tab identifier is provided.
     """
     
+    # The book loaded by this run, or the most recent one if no new bestseller was loaded
+    book_id = new_book_id if new_book_id is not None else _fetch_latest_book_id()
+
     if tab == 'tab-1':
-        return _render_individual_insights()
+        return _render_individual_insights(book_id)
     
     elif tab == 'tab-2':
-        return _render_comparative_insights()
+        return _render_comparative_insights(book_id)
 
     else:
         raise ValueError(f"Unsupported tab identifier: {tab}")
 
 
-def _fetch_latest_book_details():
-    """Fetch the details of the latest book in the database."""
+def _fetch_latest_book_id():
+    """Fetch the id of the most recently added book in the database."""
+    with dashboard_engine.connect() as connection:
+        return connection.execute(text("SELECT MAX(id) FROM book;")).scalar()
+
+
+def _fetch_latest_book_details(book_id):
+    """Fetch the details of the new bestseller from the database."""
     book_query = """
         SELECT 
             b.id AS book_id,
             b.data->>'publisher' AS publisher,
             b.data->>'title' AS title,
             b.data->>'author' AS author,
-            b.data->>'genre' AS genre,
+            b.genre,
             b.data->>'number_of_pages' AS number_of_pages,
             b.data->>'price' AS price,
-            b.data->>'number_of_stars' AS number_of_stars,
-            b.data->>'reviews_count' AS reviews_count
+            b.stars AS number_of_stars,
+            b.reviews_count
         FROM 
             book b
         WHERE 
-            b.id = (SELECT MAX(id) FROM book);
+            b.id = :book_id;
         """
-    with engine.connect() as connection:
-        result = connection.execute(text(book_query))
+    with dashboard_engine.connect() as connection:
+        result = connection.execute(text(book_query), {'book_id': book_id})
         book_details = result.fetchone()
 
     return book_details
 
 
-def _fetch_best_and_worst_reviews():
-    """Fetch the best and the worst reviews from the database."""
+def _fetch_best_and_worst_reviews(book_id):
+    """Fetch the best and the worst reviews of the new bestseller from the database."""
     review_query = """
-        WITH LatestBook AS (
-            SELECT MAX(id) AS max_id FROM book
-        )
         (SELECT id_book, stars, title, text, date
         FROM review
-        WHERE id_book = (SELECT max_id FROM LatestBook)
+        WHERE id_book = :book_id
         ORDER BY stars ASC LIMIT 1)
         UNION ALL
         (SELECT id_book, stars, title, text, date
         FROM review
-        WHERE id_book = (SELECT max_id FROM LatestBook)
+        WHERE id_book = :book_id
         ORDER BY stars DESC LIMIT 1);
         """
         
-    with engine.connect() as connection:
-        result = connection.execute(text(review_query))
+    with dashboard_engine.connect() as connection:
+        result = connection.execute(text(review_query), {'book_id': book_id})
         reviews = result.fetchall()
 
     # Extract the worst and best reviews
@@ -131,19 +144,16 @@ def _fetch_best_and_worst_reviews():
 
     return worst_review, best_review
 
-def _fetch_rank_data():
-    """Fetch rank data for the latest book from the database."""
+def _fetch_rank_data(book_id):
+    """Fetch rank data for the new bestseller from the database."""
     rank_query = """
-        WITH LatestBook AS (
-            SELECT MAX(id) AS max_id FROM book
-        )
         SELECT id_book, AVG(rank) AS avg_rank, date FROM rank
-        WHERE id_book = (SELECT max_id FROM LatestBook)
+        WHERE id_book = :book_id
         GROUP BY id_book, date
         ORDER BY date ASC;
     """
-    with engine.connect() as connection:
-        result = connection.execute(text(rank_query))
+    with dashboard_engine.connect() as connection:
+        result = connection.execute(text(rank_query), {'book_id': book_id})
         rank_data = result.fetchall()
 
     # Extract rank and date for plotting
@@ -152,11 +162,11 @@ def _fetch_rank_data():
 
     return dates, avg_ranks
 
-def _render_individual_insights():
+def _render_individual_insights(book_id):
     """Render insights for an individual book."""
-    book_details = _fetch_latest_book_details()
-    worst_review, best_review = _fetch_best_and_worst_reviews()
-    dates, avg_ranks = _fetch_rank_data()
+    book_details = _fetch_latest_book_details(book_id)
+    worst_review, best_review = _fetch_best_and_worst_reviews(book_id)
+    dates, avg_ranks = _fetch_rank_data(book_id)
 
     # Create book ratings and reviews gauges
     fig = make_subplots(rows=1, cols=2, 
@@ -272,29 +282,25 @@ def _render_individual_insights():
     ])
 
 
-def _fetch_medium_book_details():
-    """Fetch the details of the last and the medium books in the database."""
+def _fetch_medium_book_details(book_id):
+    """Fetch the details of the new bestseller and of the medium book in the database."""
     book_query = """
-      WITH LatestBook AS (
-            SELECT MAX(id) AS max_id FROM book
-        ),
-
-        LatestBookDetails AS (
+      WITH LatestBookDetails AS (
             SELECT
-                CAST(data->>'number_of_stars' AS float) AS latest_number_of_stars,
-                REPLACE(data->>'rating', ',', '')::float AS latest_rating,
-                CAST(data->>'reviews_count' AS float) AS latest_reviews_count
+                stars AS latest_number_of_stars,
+                rating::float AS latest_rating,
+                reviews_count::float AS latest_reviews_count
             FROM 
                 book
             WHERE 
-                id = (SELECT max_id FROM LatestBook)
+                id = :book_id
         ),
 
         AggregateDetails AS (
             SELECT
-                AVG(CAST(data->>'number_of_stars' AS float)) AS avg_number_of_stars,
-                AVG(CAST(REPLACE(data->>'rating', ',', '') AS float)) AS avg_rating,
-                AVG(CAST(data->>'reviews_count' AS float)) AS avg_reviews_count
+                AVG(stars) AS avg_number_of_stars,
+                AVG(rating)::float AS avg_rating,
+                AVG(reviews_count)::float AS avg_reviews_count
             FROM book
         )
 
@@ -309,42 +315,26 @@ def _fetch_medium_book_details():
         CROSS JOIN AggregateDetails ad;
         """
     
-    with engine.connect() as connection:
-        result = connection.execute(text(book_query))
+    with dashboard_engine.connect() as connection:
+        result = connection.execute(text(book_query), {'book_id': book_id})
         book_details = result.fetchone()
 
     return book_details
 
-def _fetch_rank_distribution():
-    """Fetch the rank distribution of all books and new bestseller."""
+def _fetch_rank_distribution(book_id):
+    """Fetch the rank distribution of all books and new bestseller, from the best ranks of the book_stats table."""
     rank_query = """
-    WITH LatestBook AS (
-        SELECT MAX(id) AS max_id FROM book
-    ),
-
-    BestRanks AS (
-        SELECT
-            id_book,
-            MIN(rank) AS best_rank
-        FROM 
-            rank
-        GROUP BY
-            id_book
-    )
-
     SELECT
-        br.best_rank,
-        CASE WHEN br.id_book = lb.max_id THEN 'latest' ELSE 'other' END AS book_type
-    FROM 
-        BestRanks br
-    JOIN
-        LatestBook lb
-    ON
-        br.id_book = lb.max_id OR br.id_book != lb.max_id;
+        best_rank,
+        CASE WHEN id_book = :book_id THEN 'latest' ELSE 'other' END AS book_type
+    FROM
+        book_stats
+    WHERE
+        best_rank IS NOT NULL;
     """
 
-    with engine.connect() as connection:
-        result = connection.execute(text(rank_query))
+    with dashboard_engine.connect() as connection:
+        result = connection.execute(text(rank_query), {'book_id': book_id})
         data = result.fetchall()
 
         # Using numeric indices.
@@ -354,10 +344,10 @@ def _fetch_rank_distribution():
     return ranks, latest_rank
 
 
-def _render_comparative_insights():
+def _render_comparative_insights(book_id):
     """Render comparative insights across multiple books."""
-    book_details = _fetch_medium_book_details()
-    ranks, latest_rank = _fetch_rank_distribution()
+    book_details = _fetch_medium_book_details(book_id)
+    ranks, latest_rank = _fetch_rank_distribution(book_id)
     
     latest_number_of_stars, avg_number_of_stars, latest_rating, avg_rating, latest_reviews_count, avg_reviews_count = book_details
 
@@ -444,33 +434,40 @@ def main():
 
     This function follows these steps:
     1. Collects book data from The New York Times, Amazon, and Apple Store for the specific date.
-    2. Extracts and transforms the collected raw data.
-    3. Loads the processed data into book, rank, and review tables in the PostgreSQL database.
-    4. Display in a dashboard the main features of this new book.
+    2. Extracts and transforms the collected raw data, resolving the book with the identity index.
+    3. Loads the processed data into book, rank, and review tables in the PostgreSQL database, and merges there the books the index found to be the same, in the same transaction.
+    4. Display in a dashboard the main features of this new book, by the id it was loaded under.
+
+    The identity index is saved only once the load has succeeded, so that a failed run is resolved again by the next one.
 
     Global Variables:
-        DB_ENGINE (str): The database engine connection string.
+        engine (Engine): The shared database engine of the pipeline, from src.database.get_engine.
+        new_book_id (int): The id of the book loaded, displayed by the dashboard.
         RAW_DATA_ABS_PATH (str): The path where raw data is stored.
-        PROC_DATA_ABS_PATH (str): The path where processed data is stored.
+        IDENTITY_INDEX_JSON (str): The path of the identity index of the books.
     
     """
+    global new_book_id
     year = os.environ.get("YEAR")
     month = os.environ.get("MONTH")
     day = os.environ.get("DAY")
+    identity_index = IdentityIndex.load(IDENTITY_INDEX_JSON)
     
     # Collect book data from The New York Times, Amazon, and Apple Store. 
-    data_collection(year=int(year), month=int(month), day=int(day), engine= engine)
+    collected = data_collection(year=int(year), month=int(month), day=int(day), engine= engine, identity_index=identity_index)
 
-    # Manage the extraction and transformation of the data collected
-    with open(RAW_DATA_ABS_PATH + "raw_data.json", encoding='utf-8') as json_file:
-        raw_data = json.load(json_file)
+    if collected:
+        # Manage the extraction and transformation of the data collected
+        with open(RAW_DATA_ABS_PATH + "raw_data.json", "rb") as json_file:
+            raw_data = serialization.load(json_file)
 
-    extract_transform(raw_data['new_id'], raw_data['nyt_data'], raw_data['amazon_data'], raw_data['apple_data'])
+        book, ranks, reviews = extract_transform(raw_data['new_id'], raw_data['nyt_data'], raw_data['amazon_data'], raw_data['apple_data'],
+                                                 save_files=SAVE_PROCESSED_FILES, identity_index=identity_index)
 
-    # Load data tables in the PostgreSQL database
-    load_book_into_database(PROC_DATA_ABS_PATH + 'book.json', engine, 'book')
-    load_rank_into_database(PROC_DATA_ABS_PATH + 'rank.csv', engine, 'rank')
-    load_review_into_database(PROC_DATA_ABS_PATH + 'review.csv', engine, 'review')
+        # Load data tables in the PostgreSQL database, directly from memory, a new Amazon page of a known book being added to it,
+        # and merge the books found to be the same one in the same transaction, then save the index
+        new_book_id = load_best_seller_into_database(engine, book, ranks, reviews, append=True, aliases=identity_index.aliases)
+        identity_index.save(IDENTITY_INDEX_JSON)
 
     # Dashboard for the new bestseller 
     app.run_server(debug=False, host='0.0.0.0', port=8050)
@@ -12,8 +12,8 @@ Created on 2023-07-25
 import os
 import sys
 from os.path import exists
-import json
-from sqlalchemy import text
+import itertools
+from sqlalchemy import bindparam, text
 
 # Getting the absolute path of the current script file
 current_script_path = os.path.abspath(__file__)
@@ -31,47 +31,71 @@ import api_nyt as nyt
 import scraping_apple as apple
 import scraping_amazon as amazon
 import json_tools as jt
-
-
-
-def checking_for_a_new_bestseller(nyt_file, engine):
+from src.data_collection import serialization
+
+
+# The maximum book id, read from the primary key index
+MAX_BOOK_ID_QUERY = text("SELECT MAX(id) FROM book;")
+# The already scraped URLs among a batch, per SQL dialect: the current Amazon URLs of the books, looked up in the book_url_idx index (doc/nyt-db/migrations/001_book_jsonb_indexes.sql),
+# and the earlier ones of the books merged from several pages (their 'urls' list), looked up in the book_urls_idx index (doc/nyt-db/migrations/005_book_urls_index.sql)
+SCRAPED_URLS_QUERIES = {
+    'postgresql': text("SELECT data->>'url' FROM book WHERE data->>'url' IN :urls "
+                       "UNION SELECT url FROM book, jsonb_array_elements_text(data->'urls') AS url "
+                       "WHERE data->'urls' ?| CAST(:url_array AS TEXT[]) AND url IN :urls;").bindparams(bindparam('urls', expanding=True)),
+    'sqlite': text("SELECT data->>'url' FROM book WHERE data->>'url' IN :urls "
+                   "UNION SELECT urls.value FROM book, json_each(book.data, '$.urls') AS urls "
+                   "WHERE urls.value IN :urls;").bindparams(bindparam('urls', expanding=True)),
+}
+# Number of URLs of the NYT file looked up per query
+URL_BATCH_SIZE = 500
+
+
+def checking_for_a_new_bestseller(nyt_file, engine, identity_index=None, amazon_urls=None):
     """
     Checks for new bestsellers that have not yet been scraped from Amazon.
 
-    This function compares the list of bestsellers from a given New York Times file with the list of bestsellers already scraped on Amazon. If there are any new bestsellers, it identifies the maximum ID from the existing database and returns it incremented by one along with the Amazon URL of the first new bestseller.
+    This function compares the list of bestsellers from a given New York Times file with the list of bestsellers already scraped on Amazon, by looking the URLs of the file up in the database by batches, instead of reading every book. If there are any new bestsellers, it identifies the maximum ID from the existing database and returns it incremented by one along with the Amazon URL of the first new bestseller, in the order of the file.
 
     Args:
         nyt_file (str): The file containing the New York Times bestseller list.
         engine (Engine): The SQLAlchemy database connection, to provide a source of database connectivity and behavior.
+        identity_index (IdentityIndex): if given, the URLs known to the index are also considered scraped, e.g. a second Amazon page of a book, loaded into the book of the first one.
+        amazon_urls (iterable): the Amazon URLs of the file, in order, if they have already been read from it (e.g. by data_collection), None to stream them from the file.
 
     Returns:
-        tuple: A tuple containing the new ID for the book (int) and the Amazon URL (str) of the first new bestseller to scrape.
+        tuple: A tuple containing the new ID for the book (int) and the Amazon URL (str) of the first new bestseller to scrape, None if all of them have already been scraped.
     
     """
-    # Extract the list of Amazon URLs for the bestsellers from the provided NYT file.
-    new_amazon_urls = jt.json_field_to_list(nyt_file, 'amazon_product_url')
-    
-    # Connect to the database and execute a SQL query to fetch the book IDs and URLs already exists.
+    # Stream the Amazon URLs of the bestsellers, in the order of the NYT file, skipping the bestsellers without one
+    if amazon_urls is None:
+        amazon_urls = jt.iter_unique_field_values(nyt_file, 'amazon_product_url')
+    new_amazon_urls = (url for url in amazon_urls if url is not None)
+
     with engine.connect() as connection:
-        result = connection.execute(text("SELECT id, data->>'url' AS url FROM book;"))
-        result = result.fetchall()
+        # Identify the maximum book ID in the database, from the primary key index.
+        max_id = connection.execute(MAX_BOOK_ID_QUERY).scalar() or 0
+
+        # Look the URLs up by batches in the URL index, and stop at the first batch with a URL not yet scraped.
+        url_left_to_scrape = []
+        for urls in iter(lambda: list(itertools.islice(new_amazon_urls, URL_BATCH_SIZE)), []):
+            urls_already_scraped = {row[0] for row in connection.execute(SCRAPED_URLS_QUERIES[connection.dialect.name], {'urls': urls, 'url_array': urls})}
+            url_left_to_scrape = [url for url in urls if url not in urls_already_scraped
+                                  and (identity_index is None or identity_index.url_id(url) is None)][:1]
+            if url_left_to_scrape:
+                break
 
-        # Identify the maximum book ID in the database.
-        max_id = max([id[0] for id in result]) if result else 0
+    # All the bestsellers of the file have already been scraped
+    if not url_left_to_scrape:
+        print("No new Amazon url to scrape")
+        return max_id + 1, None
 
-        # Create a list of URLs that have already been scraped.
-        urls_already_scraped = [url[1] for url in result]
-    
-    # Identify any new URLs in the bestseller list that have not yet been scraped.
-    url_left_to_scrape = list(set(new_amazon_urls) - set(urls_already_scraped))
-    
     print("new id : ", max_id +1,  "\nnew Amazon url to scrape :", url_left_to_scrape[0])
 
     # Return the incremented maximum ID and the first URL from the list of new bestsellers.
     return max_id + 1, url_left_to_scrape[0]
 
 
-def data_collection(year, month, day, engine):
+def data_collection(year, month, day, engine, identity_index=None):
     """
     Collects bestseller book data from The New York Times, Amazon, and Apple Store. 
 
@@ -82,9 +106,10 @@ def data_collection(year, month, day, engine):
         month (int): The month of the bestseller list.
         day (int): The day of the bestseller list.
         engine (Engine): The SQLAlchemy database connection, to provide a source of database connectivity and behavior.
+        identity_index (IdentityIndex): if given, the index of the books already loaded, whose URLs are not scraped again.
 
     Returns:
-        None
+        bool: whether a new bestseller has been scraped and saved to raw_data.json.
 
     """
     nyt_file = os.path.join(RAW_DATA_ABS_PATH, 'best_sellers_{}_{}_{}.json'.format(year, month, day))
@@ -97,36 +122,23 @@ def data_collection(year, month, day, engine):
         category_list = nyt.get_nyt_book_categories(NYT_api_key, max_year= year)
         nyt.get_nyt_bestsellers(NYT_api_key, category_list, year=year, month=month, day=day)
 
+    # Read the NYT file once: the Amazon URLs in order, with the record and the Apple Books link of each
+    by_amazon_url = jt.json_fields_to_lists(nyt_file, [None, ('buy_links', 'Apple Books')], key='amazon_product_url')
+
     # Check that the bestseller doesn't yet exist in the database
-    new_id, amazon_url = checking_for_a_new_bestseller(nyt_file, engine)
+    new_id, amazon_url = checking_for_a_new_bestseller(nyt_file, engine, identity_index, amazon_urls=by_amazon_url[None])
 
     if not amazon_url:
-       return  # Exit if there's no Amazon URL, without creating the NYT file or scraping anything else.
+       return False  # Exit if there's no Amazon URL, without creating the NYT file or scraping anything else.
 
     # Scraping Amazon
     amazon_data = amazon.scrape_amazon_books(amazon_url)
     
-    # Data NY Times
-    with open(nyt_file, 'r', encoding='utf-8') as f:
-        nyt_data = json.load(f)
-
-    # Get the item from the list
-    selected_item = None
-    for item in nyt_data:
-        if item['amazon_product_url'] == amazon_url:
-            selected_item = item
-            break
+    # The item of the NY Times list and its Apple Books URL
+    selected_item = by_amazon_url[None].get(amazon_url)
+    apple_url = by_amazon_url[('buy_links', 'Apple Books')].get(amazon_url)
 
     # Scraping Apple Store
-    apple_url = None
-    if selected_item is not None:
-        # Scraping Apple Store
-        for link in selected_item['buy_links']:
-            # If the 'name' field is 'Apple Books', print the URL and break the loop
-            if link['name'] == 'Apple Books':
-                apple_url = link['url']
-                break
-    
     genre = apple.scrape_apple_store_book(apple_url) if apple_url is not None else None
 
     # Save the raw data to a JSON file
@@ -138,5 +150,6 @@ def data_collection(year, month, day, engine):
     }
 
     with open(RAW_DATA_ABS_PATH + "raw_data.json", "w", encoding='utf-8') as outfile:
-        json.dump(raw_data, outfile)
-    
+        serialization.dump(raw_data, outfile)
+
+    return True
@@ -11,7 +11,6 @@ Created on 2023-07-25
 
 import os
 import sys
-import json
 import csv
 
 
@@ -25,6 +24,8 @@ src_dir = os.path.join(current_script_dir, '../..')
 sys.path.append(src_dir)
 from config import PROC_DATA_ABS_PATH
 import src.data_ingestion.extract_transform as et
+from src.data_ingestion.records import Rank, Review
+from src.data_collection import serialization
 
 
 def save_to_file(data, filename, filetype='json'):
@@ -42,7 +43,7 @@ def save_to_file(data, filename, filetype='json'):
 
     with open(filename, 'w', newline='', encoding='utf-8') as file:
         if filetype == 'json':
-            json.dump(data, file)
+            serialization.dump(data, file)
         elif filetype == 'csv':
             writer = csv.writer(file)
             writer.writerow(data[0])  # write the header
@@ -51,32 +52,48 @@ def save_to_file(data, filename, filetype='json'):
             raise ValueError(f"Unknown filetype: {filetype}")
 
 
-def extract_transform(new_id, nyt_data, amazon_data, apple_data):
+def extract_transform(new_id, nyt_data, amazon_data, apple_data, save_files=True, identity_index=None):
     """Extracts and transforms the data of a bestseller.
 
     This function creates the book, rank and review data of a bestseller, and 
-    saves each into its respective file.
+    returns them to be loaded directly into the database. Each can also be
+    saved into its respective file, as an audit trail.
+
+    With an identity index, the bestseller is resolved by its identifiers
+    (ISBNs, NYT URI, ASIN, normalized URL): a new Amazon page of a known book
+    keeps the id of that book, to be loaded with the 'append' option of
+    load_best_seller_into_database, and only a new book gets an id.
 
     Args:
         new_id (int): The ID of the new bestseller book.
         nyt_data (dict): The New York Times bestseller data.
         amazon_data (dict): The Amazon bestseller data.
         apple_data (dict): The Apple bestseller data.
+        save_files (bool): Whether to also save the book.json, rank.csv and review.csv files. Defaults to True.
+        identity_index (IdentityIndex): if given, the index resolving the bestseller to its book id, new_id being the smallest id a new book can get.
 
     Return:
-        None
+        tuple: the book item (dict), the rank rows (list) and the review rows (list).
 
     """
+    # Resolve the book by identity, the ids of the index never going below the ids of the database
+    if identity_index is not None:
+        identity_index.next_id = max(identity_index.next_id, new_id)
+        new_id = identity_index.book_id(nyt_data)
+
     # Create and save the book data
     book = et.create_a_book_table_item(new_id, nyt_data, amazon_data, apple_data)
-    save_to_file(book, PROC_DATA_ABS_PATH + "book.json")
+    if save_files:
+        save_to_file(book, PROC_DATA_ABS_PATH + "book.json")
 
     # Create and save the rank data
-    columns = ['id_book', 'date', 'category', 'rank', 'rank_last_week', 'weeks_on_list']
     rank = et.create_a_rank_table_item(new_id, nyt_data)
-    save_to_file([columns, [rank]], PROC_DATA_ABS_PATH + "rank.csv", 'csv')
+    if save_files:
+        save_to_file([Rank.COLUMNS, [rank]], PROC_DATA_ABS_PATH + "rank.csv", 'csv')
 
     # Create and save the review data
-    columns = ['id_book', 'id_review', 'stars', 'title', 'text', 'date']
     review = et.create_of_review_table_items(new_id, amazon_data)
-    save_to_file([columns, review], PROC_DATA_ABS_PATH + "review.csv", 'csv')
+    if save_files:
+        save_to_file([Review.COLUMNS, review], PROC_DATA_ABS_PATH + "review.csv", 'csv')
+
+    return book, [rank], review
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 2026-10-19
+
+@author: Roland
+
+@abstract: single factory of the SQLAlchemy engines of the "nyt" database, shared by the entry points of the project (API, data pipeline and machine learning), with an asynchronous (asyncpg) variant for the API. The connection pool (size, overflow, timeout, recycling, pre-ping), the statement timeout of the API and dashboard engines and the application name are configured in config.py, and each process reuses one engine per application name.
+
+"""
+
+from functools import lru_cache
+
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from config import DB_ENGINE, DB_ASYNC_ENGINE, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_STATEMENT_TIMEOUT, DB_PREPARED_STATEMENT_CACHE_SIZE
+
+
+def create_database_engine(url=DB_ENGINE, application_name='nyt', statement_timeout=0, **overrides):
+    """
+    Creates a SQLAlchemy engine with the project's pool and session settings.
+
+    For PostgreSQL, the pool keeps DB_POOL_SIZE connections (plus DB_MAX_OVERFLOW temporary ones), checks them before use (pre-ping) and replaces them after DB_POOL_RECYCLE seconds; each session gets the application name and the statement timeout. The engines of the interactive readers (e.g. the dashboard) pass DB_STATEMENT_TIMEOUT, so that a runaway query cannot hold a connection forever, while the engines of the pipeline, the bulk loaders and the machine learning keep no timeout, their statements (COPY, partition backfills, book_stats refreshes, whole-table reads) running for as long as the data require. Other databases (e.g. SQLite in the tests) keep the SQLAlchemy defaults.
+
+    Args:
+        url (str): the database URL.
+        application_name (str): the name of the connecting application, shown in pg_stat_activity.
+        statement_timeout (int): the statement timeout of the sessions, in milliseconds, 0 for no timeout.
+        **overrides: other create_engine arguments, overriding the defaults.
+
+    Returns:
+        Engine: the SQLAlchemy engine.
+
+    """
+    options = {}
+    if url.startswith('postgresql'):
+        options = _pool_options()
+        options['connect_args'] = {
+            'application_name': application_name,
+            'options': f'-c statement_timeout={statement_timeout:d}',
+        }
+    options.update(overrides)
+
+    return create_engine(url, **options)
+
+
+@lru_cache(maxsize=None)
+def get_engine(application_name='nyt', statement_timeout=0):
+    """
+    Returns the engine of the "nyt" database for an application, created on the first call and then shared by the whole process.
+
+    Args:
+        application_name (str): the name of the connecting application, shown in pg_stat_activity.
+        statement_timeout (int): the statement timeout of the sessions, in milliseconds: DB_STATEMENT_TIMEOUT for the interactive readers, 0 (no timeout) for the pipeline and the bulk loaders.
+
+    Returns:
+        Engine: the SQLAlchemy engine.
+
+    Raises:
+        RuntimeError: If the engine cannot be created.
+
+    """
+    try:
+        return create_database_engine(application_name=application_name, statement_timeout=statement_timeout)
+    except Exception as e:
+        raise RuntimeError(f"Failed to create database engine: {e}")
+
+
+def _pool_options():
+    """Returns the create_engine arguments of the PostgreSQL connection pool."""
+    return {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': True,
+    }
+
+
+def create_async_database_engine(url=DB_ASYNC_ENGINE, application_name='nyt', statement_timeout=DB_STATEMENT_TIMEOUT, **overrides):
+    """
+    Creates an asynchronous SQLAlchemy engine (asyncpg driver) with the same pool and session settings as create_database_engine, so that the queries do not block the event loop of the API. As an engine of the API, it gets the DB_STATEMENT_TIMEOUT by default.
+
+    Each asyncpg connection prepares its statements on the server and keeps the last DB_PREPARED_STATEMENT_CACHE_SIZE of them, so that a parameterized query is parsed and planned once per connection and then reused by the following requests.
+
+    Args:
+        url (str): the database URL, with an async driver (e.g. 'postgresql+asyncpg://...').
+        application_name (str): the name of the connecting application, shown in pg_stat_activity.
+        statement_timeout (int): the statement timeout of the sessions, in milliseconds, 0 for no timeout.
+        **overrides: other create_async_engine arguments, overriding the defaults.
+
+    Returns:
+        AsyncEngine: the asynchronous SQLAlchemy engine.
+
+    """
+    options = {}
+    if url.startswith('postgresql'):
+        options = _pool_options()
+        options['connect_args'] = {
+            'prepared_statement_cache_size': DB_PREPARED_STATEMENT_CACHE_SIZE,
+            'server_settings': {
+                'application_name': application_name,
+                'statement_timeout': str(statement_timeout),
+            },
+        }
+    options.update(overrides)
+
+    return create_async_engine(url, **options)
+
+
+@lru_cache(maxsize=None)
+def get_async_engine(application_name='nyt'):
+    """
+    Returns the asynchronous engine of the "nyt" database for an application, created on the first call and then shared by the whole process.
+
+    Args:
+        application_name (str): the name of the connecting application, shown in pg_stat_activity.
+
+    Returns:
+        AsyncEngine: the asynchronous SQLAlchemy engine.
+
+    Raises:
+        RuntimeError: If the engine cannot be created (e.g. if 'asyncpg' is not installed).
+
+    """
+    try:
+        return create_async_database_engine(application_name=application_name)
+    except Exception as e:
+        raise RuntimeError(f"Failed to create database engine: {e}")
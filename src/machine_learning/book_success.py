@@ -12,6 +12,10 @@ import re
 import numpy as np
 import pandas as pd
 
+from config import FIRST_REVIEWS_COUNT
+from src.data_collection import serialization
+from src.data_ingestion import parquet_store
+
 from sklearn.decomposition import PCA
 from sklearn.preprocessing import StandardScaler, OneHotEncoder
 from sklearn.model_selection import train_test_split
@@ -30,9 +34,13 @@ def sql_query_to_create_dataset(engine):
     """
     Run a specific SQL query in the 'nyt' PostgreSQL database, to pull data related to books (including features like title, author, genre, price, dagger, asterisk, rating, number_of_stars, number_of_pages, reviews_count, mean_first_stars, best_ranking, and max_weeks), and returns the result as a pandas DataFrame.
 
-    The query joins three tables ('book', 'rank', and 'first_reviews') 
-    based on the book ID, and applies aggregation functions MIN() and 
-    MAX() on certain columns.
+    The query joins the 'book' table with its per-book aggregates of the
+    'book_stats' table (best ranking, maximum weeks on list and mean stars
+    of the first reviews, maintained at load time) on the book ID, so that
+    no table is grouped at read time. The numeric features are read from
+    the typed columns of the book table
+    (doc/nyt-db/migrations/002_book_typed_columns.sql), already converted
+    at load time.
 
     Args:
         engine (Engine): The SQLAlchemy database connection, to provide a source of database connectivity and behavior.
@@ -54,6 +62,7 @@ def sql_query_to_create_dataset(engine):
             - mean_first_stars: The average of the first stars of the book
             - best_ranking: The best ranking of the book
             - max_weeks: The maximum weeks of the book's record
+            - max_price: The highest of the prices of the book
 
     """
     
@@ -62,38 +71,64 @@ def sql_query_to_create_dataset(engine):
     SELECT  book.id,
             book.data->>'title' AS title,
             book.data->>'author' AS author,
-            book.data->>'genre' AS genre,    
+            book.genre,
             book.data->>'price' AS price, 
             book.data->>'dagger' AS dagger,
             book.data->>'dagger' AS asterisk,
-            book.data->>'rating' AS rating, 
-            book.data->>'number_of_stars' AS number_of_stars,
+            book.rating,
+            book.stars AS number_of_stars,
             book.data->>'number_of_pages' AS number_of_pages,
-            book.data->>'reviews_count' AS reviews_count,
-            first_reviews.avg_stars AS mean_first_stars,
-            MIN(rank.rank) AS best_ranking,
-            MAX(rank.weeks_on_list) AS max_weeks
+            book.reviews_count,
+            book_stats.mean_first_stars,
+            book_stats.best_rank AS best_ranking,
+            book_stats.max_weeks,
+            book.max_price
     FROM book
-    LEFT JOIN rank ON book.id = rank.id_book
-    LEFT JOIN first_reviews ON book.id = first_reviews.id_book
-    GROUP BY book.id, 
-            book.data->>'title',   
-            book.data->>'author',
-            book.data->>'genre',    
-            book.data->>'price',
-            book.data->>'dagger',
-            book.data->>'asterisk',
-            book.data->>'rating', 
-            book.data->>'number_of_stars',
-            book.data->>'number_of_pages',
-            book.data->>'reviews_count',
-            first_reviews.avg_stars;
+    LEFT JOIN book_stats ON book.id = book_stats.id_book;
     """
 
     # Create the DataFrame
     df = pd.read_sql_query(query, con=engine)
     return df
 
+
+def parquet_to_create_dataset(book_parquet, rank_parquet, review_parquet):
+    """
+    Builds, from the Parquet storage layer, the same dataset as sql_query_to_create_dataset, reading only the columns it needs.
+
+    Args:
+        book_parquet (str): The path of the book Parquet file.
+        rank_parquet (str): The directory of the rank Parquet dataset.
+        review_parquet (str): The directory of the review Parquet dataset.
+
+    Returns:
+        df (pd.DataFrame): A DataFrame with the same columns as the one returned by sql_query_to_create_dataset.
+
+    Raises:
+        ImportError: If 'pyarrow' is not installed.
+
+    """
+    book_columns = ['id', 'title', 'author', 'genre', 'price', 'dagger', 'asterisk', 'rating',
+                    'number_of_stars', 'number_of_pages', 'reviews_count']
+    books = parquet_store.read_parquet_table(book_parquet, columns=book_columns)
+
+    # The JSON lists are returned as text by the SQL query
+    for column in ['price', 'asterisk']:
+        books[column] = books[column].apply(lambda values: None if values is None else serialization.dumps(values.tolist()))
+
+    ranks = parquet_store.read_parquet_table(rank_parquet, columns=['id_book', 'rank', 'weeks_on_list'])
+    ranks = ranks.groupby('id_book').agg(best_ranking=('rank', 'min'), max_weeks=('weeks_on_list', 'max'))
+
+    reviews = parquet_store.read_parquet_table(review_parquet, columns=['id_book', 'id_review', 'stars'],
+                                               filters=[('id_review', '<=', FIRST_REVIEWS_COUNT)])
+    reviews = reviews.groupby('id_book').agg(mean_first_stars=('stars', 'mean'))
+
+    df = books.merge(reviews, left_on='id', right_index=True, how='left')
+    df = df.merge(ranks, left_on='id', right_index=True, how='left')
+
+    return df[book_columns + ['mean_first_stars', 'best_ranking', 'max_weeks']]
+
+
 # Data cleaning
 # ==============
 
@@ -120,6 +155,8 @@ def dataset_cleaning(df):
             - max_weeks
             - id
             - title
+            - max_price (optional): the maximum price, parsed from 'price'
+              if absent
 
     Returns:
         df (pd.DataFrame): A clean version of the input DataFrame. It 
@@ -145,8 +182,11 @@ def dataset_cleaning(df):
         numbers = [float(value) for value in matches]
         return max(numbers)
 
-    # Apply the function to the 'price' column
-    df['max_price'] = df['price'].apply(extract_max_price)
+    # Use the maximum price computed by the database when present, else apply the function to the 'price' column
+    if 'max_price' in df.columns:
+        df['max_price'] = df.pop('max_price').astype('float')
+    else:
+        df['max_price'] = df['price'].apply(extract_max_price)
 
     # Replace comma in 'rating' column
     df['rating'] = df['rating'].replace(',', '', regex=True)
@@ -11,7 +11,6 @@ Created on 2023-08-13
 
 import os
 import sys
-from sqlalchemy import create_engine
 from sqlalchemy.exc import SQLAlchemyError
 import dash
 from dash import dcc, html, dash_table
@@ -25,17 +24,14 @@ current_script_dir = os.path.dirname(current_script_path)
 src_dir = os.path.join(current_script_dir, '../..')
 # Adding the absolute path to system path
 sys.path.append(src_dir)
-from config import DB_ENGINE
+from src.database import get_engine
 from src.machine_learning.book_success import sql_query_to_create_dataset, dataset_cleaning, target_combination, create_3D_scatter, create_heatmap, create_box_plot, preprocessing, regression_model, plot_actual_vs_predicted_values, plot_feature_importances, plot_predicted_values_vs_residual
 
 
 
 def get_data_from_database():
-    try:
-        # Attempt to create the database engine
-        engine = create_engine(DB_ENGINE)
-    except Exception as e:
-        raise RuntimeError(f"Failed to create database engine: {e}")
+    # Shared database engine, created on the first call
+    engine = get_engine('nyt-machine-learning')
 
     try:
         # Attempt to fetch data
@@ -5,13 +5,13 @@ Created on 2023-08-13
 
 @abstract: create for the 'best_book.py' source file,
     2 unit tests for the 'read_all_genres' function
-    2 unit tests for the 'read_best_books' function
+    3 unit tests for the 'read_best_books' function
     
 """
 
 import os
 import sys
-from unittest.mock import MagicMock
+from unittest.mock import AsyncMock, MagicMock
 import pytest
 from sqlalchemy.exc import SQLAlchemyError
 from fastapi import HTTPException
@@ -24,14 +24,15 @@ current_script_dir = os.path.dirname(current_script_path)
 src_dir = os.path.join(current_script_dir, '../..', 'src', 'api')
 # Adding the absolute path to system path
 sys.path.append(src_dir)
-from best_book import read_all_genres, read_best_books
+from best_book import read_all_genres, read_best_books, BEST_BOOKS_QUERY
 
 
 @pytest.mark.asyncio
 async def test_read_all_genres_successful():
     mock_engine = MagicMock()
     mock_app = MagicMock()
-    mock_connection = mock_engine.connect.return_value.__enter__.return_value
+    mock_connection = mock_engine.connect.return_value.__aenter__.return_value
+    mock_connection.execute = AsyncMock()
     mock_connection.execute.return_value = [(1,), (2,), (3,)]
 
     result = await read_all_genres(mock_engine, mock_app)
@@ -42,7 +43,8 @@ async def test_read_all_genres_successful():
 async def test_read_all_genres_exception():
     mock_engine = MagicMock()
     mock_app = MagicMock()
-    mock_connection = mock_engine.connect.return_value.__enter__.return_value
+    mock_connection = mock_engine.connect.return_value.__aenter__.return_value
+    mock_connection.execute = AsyncMock()
     mock_connection.execute.side_effect = Exception("Database Error")
     
     with pytest.raises(HTTPException) as exc_info:
@@ -55,9 +57,11 @@ async def test_read_all_genres_exception():
 async def test_read_best_books_successful():
     mock_engine = MagicMock()
     mock_app = MagicMock()
-    mock_connection = mock_engine.connect.return_value.__enter__.return_value
+    mock_connection = mock_engine.connect.return_value.__aenter__.return_value
+    mock_connection.execute = AsyncMock()
     mock_result = [{'title': 'Book1', 'author': 'Author1', 'weeks_on_list': 12}]
 
+    mock_connection.execute.return_value = MagicMock()
     mock_connection.execute.return_value.fetchone.return_value = [mock_result]
 
     best_books = await read_best_books(mock_engine, mock_app, '2023', 'Fiction')
@@ -69,7 +73,8 @@ async def test_read_best_books_successful():
 async def test_read_best_books_sqlalchemy_error():
     mock_engine = MagicMock()
     mock_app = MagicMock()
-    mock_connection = mock_engine.connect.return_value.__enter__.return_value
+    mock_connection = mock_engine.connect.return_value.__aenter__.return_value
+    mock_connection.execute = AsyncMock()
     
     mock_connection.execute.side_effect = SQLAlchemyError("SQLAlchemy error")
 
@@ -78,3 +83,22 @@ async def test_read_best_books_sqlalchemy_error():
 
     assert exc_info.value.status_code == 500
     assert "SQLAlchemy error occurred" in exc_info.value.detail
+
+
+# Test that the year and genre are bound as parameters of the same prepared statement, never interpolated into the SQL.
+@pytest.mark.asyncio
+async def test_read_best_books_parameterized():
+    mock_engine = MagicMock()
+    mock_app = MagicMock()
+    mock_connection = mock_engine.connect.return_value.__aenter__.return_value
+    mock_connection.execute = AsyncMock()
+    mock_connection.execute.return_value = MagicMock()
+    mock_connection.execute.return_value.fetchone.return_value = [[{'title': 'Book1'}]]
+    genre = "Fiction'; DROP TABLE book; --"
+
+    await read_best_books(mock_engine, mock_app, '2023', genre)
+
+    statement, parameters = mock_connection.execute.await_args.args
+    assert statement is BEST_BOOKS_QUERY
+    assert parameters == {"year": 2023, "genre": genre}
+    assert genre not in str(statement)
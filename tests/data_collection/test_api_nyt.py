@@ -133,8 +133,8 @@ def test_process_books_multiple_books():
 
 
 class TestSaveAsJson(unittest.TestCase):
-    # Test the normal operation of save_as_json, asserting that open and json.dump are called with the expected arguments.
-    @patch("json.dump")
+    # Test the normal operation of save_as_json, asserting that open and serialization.dump are called with the expected arguments.
+    @patch("src.data_collection.serialization.dump")
     @patch("builtins.open", new_callable=mock_open)
     def test_save_as_json(self, mock_file, mock_json_dump):
         data = {"key": "value"}
@@ -155,7 +155,7 @@ class TestSaveAsJson(unittest.TestCase):
             save_as_json(data, year, month, day)
 
     # Test that a TypeError is raised when the data is not serializable.
-    @patch("json.dump", side_effect=TypeError)
+    @patch("src.data_collection.serialization.dump", side_effect=TypeError)
     @patch("builtins.open", new_callable=mock_open)
     def test_save_as_json_not_serializable(self, mock_file, mock_json_dump):
         data = {"key": "value"}
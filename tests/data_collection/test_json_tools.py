@@ -5,7 +5,7 @@ Created on 2023-07-23
 
 @author: Roland
 
-@abstract: create 3 unit tests for the 'json_field_to_list' function in the 'json_tools.py' source file, and 5 test for the 'merge_json_files' function in the same source file
+@abstract: create 3 unit tests for the 'json_field_to_list' function in the 'json_tools.py' source file, 2 unit tests for the 'iter_json_array' function, 3 unit tests for the 'json_fields_to_lists' function, 2 unit tests for the 'iter_unique_field_values' function, and 7 test for the 'merge_json_files' function in the same source file
 """
 
 import os
@@ -18,11 +18,14 @@ from unittest.mock import mock_open, patch
 current_script_path = os.path.abspath(__file__)
 # Getting the directory of the current script file
 current_script_dir = os.path.dirname(current_script_path)
+# Constructing the absolute path of the project root
+root_dir = os.path.join(current_script_dir, '../..')
+sys.path.append(root_dir)
 # Constructing the absolute path of the src/01_data_collection directory
 src_dir = os.path.join(current_script_dir, '../..', 'src', 'data_collection')
 # Adding the absolute path to system path
 sys.path.append(src_dir)
-from json_tools import json_field_to_list, merge_json_files
+from json_tools import json_field_to_list, json_fields_to_lists, iter_json_array, iter_unique_field_values, merge_json_files
 
 
 # Test when the function is given a valid JSON file and a valid field.
@@ -61,6 +64,85 @@ def test_json_field_to_list_invalid_file(mock_isfile):
     mock_isfile.assert_called_once_with("non_existent.json")
 
 
+# Test that the items of a JSON array are all yielded, even when an item spans several read chunks.
+def test_iter_json_array_small_chunks(tmpdir):
+    data = [{"title": "Book 1", "isbns": [{"isbn10": "1943200084"}]}, {"title": "Book 2"}, 3, "text", None]
+    json_file = tmpdir.join("books.json")
+    json_file.write(json.dumps(data, indent=4))
+
+    assert list(iter_json_array(str(json_file), chunk_size=5)) == data
+
+
+# Test that a truncated JSON array raises a decoding error.
+def test_iter_json_array_truncated_file(tmpdir):
+    json_file = tmpdir.join("books.json")
+    json_file.write('[{"title": "Book 1"}, {"title": "Bo')
+
+    with pytest.raises(json.JSONDecodeError):
+        list(iter_json_array(str(json_file)))
+
+
+# Test that unique values are yielded in the order in which they first appear in the file.
+def test_iter_unique_field_values_first_seen_order(tmpdir):
+    urls = ["https://www.example3.com", "https://www.example1.com", "https://www.example3.com", "https://www.example2.com", "https://www.example1.com"]
+    json_file = tmpdir.join("books.json")
+    json_file.write(json.dumps([{"url": url} for url in urls]))
+
+    assert list(iter_unique_field_values(str(json_file), "url")) == ["https://www.example3.com", "https://www.example1.com", "https://www.example2.com"]
+    assert json_field_to_list(str(json_file), "url") == ["https://www.example3.com", "https://www.example1.com", "https://www.example2.com"]
+
+
+# Test that the file is not read further than needed when the caller stops after the first value.
+def test_iter_unique_field_values_early_stop(tmpdir):
+    json_file = tmpdir.join("books.json")
+    json_file.write('[{"url": "https://www.example1.com"}, {"url": "https://www.example2.com"}, not valid json')
+
+    values = iter_unique_field_values(str(json_file), "url")
+
+    assert next(values) == "https://www.example1.com"
+
+
+# Test that several fields and links are extracted in a single pass.
+def test_json_fields_to_lists_several_fields(tmpdir):
+    data = [
+        {"amazon_product_url": "https://www.amazon.com/1", "buy_links": [{"name": "Apple Books", "url": "https://apple.com/1"}]},
+        {"amazon_product_url": "https://www.amazon.com/2", "buy_links": [{"name": "Amazon", "url": "https://www.amazon.com/2"}]},
+        {"amazon_product_url": "https://www.amazon.com/1", "buy_links": [{"name": "Apple Books", "url": "https://apple.com/1"}]}
+    ]
+    json_file = tmpdir.join("best_sellers.json")
+    json_file.write(json.dumps(data))
+
+    result = json_fields_to_lists(str(json_file), ['amazon_product_url', ('buy_links', 'Apple Books')])
+
+    assert result['amazon_product_url'] == ["https://www.amazon.com/1", "https://www.amazon.com/2"]
+    assert result[('buy_links', 'Apple Books')] == ["https://apple.com/1"]
+
+
+# Test that with a key, each item and its link are associated with their key, the items without key being skipped.
+def test_json_fields_to_lists_by_key(tmpdir):
+    data = [
+        {"amazon_product_url": "https://www.amazon.com/2", "buy_links": [{"name": "Amazon", "url": "https://www.amazon.com/2"}]},
+        {"amazon_product_url": None, "buy_links": [{"name": "Apple Books", "url": "https://apple.com/0"}]},
+        {"amazon_product_url": "https://www.amazon.com/1", "buy_links": [{"name": "Apple Books", "url": "https://apple.com/1"}]},
+        {"amazon_product_url": "https://www.amazon.com/2", "buy_links": [{"name": "Apple Books", "url": "https://apple.com/2"}]}
+    ]
+    json_file = tmpdir.join("best_sellers.json")
+    json_file.write(json.dumps(data))
+
+    result = json_fields_to_lists(str(json_file), [None, ('buy_links', 'Apple Books')], key='amazon_product_url')
+
+    assert list(result[None]) == ["https://www.amazon.com/2", "https://www.amazon.com/1"]
+    assert result[None]["https://www.amazon.com/2"] == data[0]
+    assert result[('buy_links', 'Apple Books')] == {"https://www.amazon.com/2": "https://apple.com/2", "https://www.amazon.com/1": "https://apple.com/1"}
+
+
+# Test that every requested field gets an empty list when the file does not exist.
+def test_json_fields_to_lists_invalid_file():
+    result = json_fields_to_lists("non_existent.json", ['amazon_product_url', ('buy_links', 'Apple Books')])
+
+    assert result == {'amazon_product_url': [], ('buy_links', 'Apple Books'): []}
+
+
 # The test should ensure that the merge_json_files function works correctly with valid input.
 def test_merge_json_files_valid_input(tmpdir):
     # Prepare input json files
@@ -86,6 +168,35 @@ def test_merge_json_files_valid_input(tmpdir):
         assert data == data1 + data2
 
 
+# Test that items sharing the same deduplication key are written only once, the first one being kept.
+def test_merge_json_files_dedup_key(tmpdir):
+    data1 = [{"url": "https://www.amazon.com/1", "rating": "10"}, {"url": "https://www.amazon.com/2", "rating": "20"}]
+    data2 = [{"url": "https://www.amazon.com/1", "rating": "11"}, {"rating": "30"}]
+    tmpdir.join("file1.json").write(json.dumps(data1))
+    tmpdir.join("file2.json").write(json.dumps(data2))
+    output_file = str(tmpdir.join("output.json"))
+
+    merge_json_files(str(tmpdir), output_file, dedup_key="url")
+
+    with open(output_file, "r", encoding="utf-8") as f:
+        assert json.load(f) == data1 + [{"rating": "30"}]
+
+
+# Test that reading the files in a thread pool keeps the order of the files.
+def test_merge_json_files_thread_pool(tmpdir):
+    expected = []
+    for i in range(10):
+        data = [{"url": f"https://www.amazon.com/{i}"}]
+        tmpdir.join(f"file_{i:02d}.json").write(json.dumps(data))
+        expected += data
+    output_file = str(tmpdir.join("output.json"))
+
+    merge_json_files(str(tmpdir), output_file, max_workers=3)
+
+    with open(output_file, "r", encoding="utf-8") as f:
+        assert json.load(f) == expected
+
+
 # The test should test the function's behavior with invalid input.
 def test_merge_json_files_invalid_input():
     invalid_json = "[{'not': 'valid json'}]"
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 2026-10-19
+
+@author: Roland
+
+@abstract: create for the 'serialization.py' source file,
+    2 unit tests for the 'loads' and 'dumps' functions,
+    1 unit test for the 'set_backend' function,
+    2 unit tests for the 'load_best_sellers' function.
+"""
+
+import os
+import sys
+import json
+import pytest
+import msgspec
+
+# Getting the absolute path of the current script file
+current_script_path = os.path.abspath(__file__)
+# Getting the directory of the current script file
+current_script_dir = os.path.dirname(current_script_path)
+# Constructing the absolute path of the project root
+root_dir = os.path.join(current_script_dir, '../..')
+# Adding the absolute path to system path
+sys.path.append(root_dir)
+from src.data_collection import serialization
+
+
+@pytest.fixture
+def backend():
+    # Restore the default backend after each test
+    default = serialization.get_backend()
+    yield
+    serialization.set_backend(default)
+
+
+# Test that every backend round-trips the same data, non-ASCII characters included.
+@pytest.mark.parametrize("name", ["json", "orjson", "msgspec"])
+def test_loads_dumps_round_trip(name, backend):
+    data = [{"title": "Children’s Middle Grade", "rank": 1, "price": "0.00", "isbns": [{"isbn10": None}]}]
+    serialization.set_backend(name)
+
+    encoded = serialization.dumps(data)
+
+    assert isinstance(encoded, str)
+    assert "’" in encoded
+    assert serialization.loads(encoded) == data
+    assert serialization.loads(encoded.encode('utf-8')) == data
+    assert json.loads(serialization.dumps(data, indent=True)) == data
+
+
+# Test that every backend raises the standard library decoding error on invalid JSON.
+@pytest.mark.parametrize("name", ["json", "orjson", "msgspec"])
+def test_loads_invalid_json(name, backend):
+    serialization.set_backend(name)
+
+    with pytest.raises(json.JSONDecodeError):
+        serialization.loads("[{'not': 'valid json'}]")
+
+
+# Test that an unknown backend is rejected.
+def test_set_backend_unknown(backend):
+    with pytest.raises(ValueError):
+        serialization.set_backend("unknown")
+
+
+# Test that best-seller records are decoded into typed structures, unknown fields being ignored.
+def test_load_best_sellers_success(tmpdir):
+    data = [{"title": "BECAUSE I HAD A TEACHER", "author": "Kobi Yamada.", "rank": 3, "rank_last_week": 7,
+             "weeks_on_list": 15, "category": "Picture Books", "bestsellers_date": "2023-6-5",
+             "amazon_product_url": "https://www.amazon.com/dp/1943200084", "contributor_note": "",
+             "isbns": [{"isbn10": "1943200084", "isbn13": "9781943200085"}],
+             "buy_links": [{"name": "Apple Books", "url": "https://goto.applebooks.apple/9781943200085"}]}]
+    json_file = tmpdir.join("best_sellers.json")
+    json_file.write(json.dumps(data))
+
+    books = serialization.load_best_sellers(str(json_file))
+
+    assert len(books) == 1
+    assert books[0].rank == 3
+    assert books[0].isbns[0].isbn13 == "9781943200085"
+    assert books[0].buy_links[0].name == "Apple Books"
+    assert books[0].price is None
+
+
+# Test that a record with a wrong type is rejected.
+def test_load_best_sellers_invalid_type(tmpdir):
+    data = [{"title": "Book", "author": "Author", "rank": "third", "rank_last_week": 0,
+             "weeks_on_list": 1, "category": "Picture Books", "bestsellers_date": "2023-6-5"}]
+    json_file = tmpdir.join("best_sellers.json")
+    json_file.write(json.dumps(data))
+
+    with pytest.raises(msgspec.ValidationError):
+        serialization.load_best_sellers(str(json_file))
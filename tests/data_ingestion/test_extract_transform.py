@@ -6,7 +6,16 @@ Created on 2023-07-24
 @author: Roland
 
 @abstract: create for the 'extract_transform.py' source file,
+    4 unit tests for the 'combine_book_data' function,
+    2 unit tests for the 'combine_new_book_data' function,
+    1 unit test for the 'read_book_index' and 'write_book_index' functions,
+    1 unit test for the 'amazon_book_fields' function,
+    3 unit tests for the 'write_rank' function,
     5 unit tests for the 'convert_to_date' function,
+    2 unit tests for the 'convert_to_dates' function,
+    2 unit tests for the 'write_reviews' and 'transform_tables' functions with an identity index,
+    1 unit test for the 'write_reviews' function,
+    1 unit test for the 'transform_tables' function,
     2 unit tests for the 'create_a_book_table_item' function,
     3 unit tests for the 'create_a_rank_table_item' function,
     2 unit tests for the 'create_of_review_table_items' function.
@@ -15,17 +24,23 @@ Created on 2023-07-24
 
 import os
 import sys
+import json
 import pytest
+import msgspec
 
 # Getting the absolute path of the current script file
 current_script_path = os.path.abspath(__file__)
 # Getting the directory of the current script file
 current_script_dir = os.path.dirname(current_script_path)
+# Constructing the absolute path of the project root
+root_dir = os.path.join(current_script_dir, '../..')
+sys.path.append(root_dir)
 # Constructing the absolute path of the src/01_data_collection directory
 src_dir = os.path.join(current_script_dir, '../..', 'src', 'data_ingestion')
 # Adding the absolute path to system path
 sys.path.append(src_dir)
-from extract_transform import convert_to_date, create_a_book_table_item, create_a_rank_table_item, create_of_review_table_items
+from src.data_ingestion.identity_index import IdentityIndex
+from extract_transform import amazon_book_fields, combine_book_data, combine_new_book_data, read_book_index, write_book_index, write_rank, write_reviews, transform_tables, convert_to_date, convert_to_dates, create_a_book_table_item, create_a_rank_table_item, create_of_review_table_items
 
 
 
@@ -57,6 +72,17 @@ def test_empty_input():
         convert_to_date('')
 
 
+# This test verifies that the United States and the localized date variants are converted, each distinct text once.
+def test_convert_to_dates_success():
+    texts = ['Reviewed in the United States on April 24, 2023', 'Reviewed in the United Kingdom on 24 April 2023',
+             'Reviewed in London on 3 May 2023', 'Reviewed in the United States on April 24, 2023']
+    assert convert_to_dates(texts) == (['2023-04-24', '2023-04-24', '2023-05-03', '2023-04-24'], [])
+
+# This test verifies that the unparseable texts are reported instead of raising an exception.
+def test_convert_to_dates_unparseable():
+    assert convert_to_dates(['Reviewed on July 24, 2023', 'Reviewed yesterday', None, '']) == (['2023-07-24', None, None, None], [1, 2, 3])
+
+
 # Test the function under normal conditions and expects it to return the correct book dictionary. 
 def test_create_a_book_table_item_success():
     new_id = 1
@@ -208,3 +234,228 @@ def test_create_of_review_table_items_no_data():
     expected_output = []
 
     assert create_of_review_table_items(1, amazon_data) == expected_output
+
+
+# Raw data of 2 books (and a record without Amazon URL) over 2 weeks, shared by the tests of the table-level functions
+def best_seller_record(number, date, rank, price="0.00"):
+    return {"amazon_product_url": f"https://www.amazon.com/dp/{number}?tag=NYTBSREV-20" if number else None,
+            "title": f"BOOK {number}", "author": f"Author {number}", "contributor": f"by Author {number}",
+            "publisher": "Compendium", "dagger": 0, "asterisk": 0, "price": price, "description": f"Description {number}",
+            "isbns": [{"isbn10": f"{number}000000000", "isbn13": f"978{number}000000000"}], "book_uri": f"nyt://book/{number}",
+            "buy_links": [{"name": "Apple Books", "url": f"https://goto.applebooks.apple/{number}"}],
+            "category": "Picture Books", "bestsellers_date": date, "rank": rank, "rank_last_week": 0, "weeks_on_list": 1}
+
+
+@pytest.fixture
+def raw_files(tmpdir):
+    best_sellers = [best_seller_record(2, "2023-1-9", 1), best_seller_record(1, "2023-1-9", 2), best_seller_record(0, "2023-1-9", 3),
+                    best_seller_record(2, "2023-1-16", 1, price="9.99")]
+    amazon = [{"url": "https://www.amazon.com/dp/2?tag=NYTBSREV-20", "rating": "4,373", "number_of_stars": "4.9", "price": "$7.85",
+               "number_of_pages": "40", "language": "English", "publication_date": "2017-03-01", "reviews_count": 497,
+               "random_pages_count": 0,
+               "reviews": [{"stars": "5.0", "title": "title 1", "text": "text 1", "date": "Reviewed in the United States on April 24, 2023"},
+                           {"stars": "4.0", "title": "title 2", "text": "text 2", "date": "Reviewed in the United States on April 25, 2023"}]}]
+    tmpdir.join("best_sellers.json").write(json.dumps(best_sellers))
+    tmpdir.join("amazon.json").write(json.dumps(amazon))
+    tmpdir.join("apple.csv").write("url,genre\nhttps://goto.applebooks.apple/2,Kids\n")
+    return {name: str(tmpdir.join(name)) for name in ["best_sellers.json", "amazon.json", "apple.csv", "book.json", "rank.csv", "review.csv"]}
+
+
+# Test that the best-seller records are combined by Amazon URL, ids following the order of first appearance.
+def test_combine_book_data_success(raw_files):
+    combine_book_data(raw_files["best_sellers.json"], raw_files["amazon.json"], raw_files["apple.csv"], raw_files["book.json"])
+
+    with open(raw_files["book.json"], encoding='utf-8') as f:
+        books = json.load(f)
+
+    assert [(book["id"], book["title"]) for book in books] == [(1, "BOOK 2"), (2, "BOOK 1")]
+    assert books[0]["price"] == ["0.00", "9.99", "$7.85"]
+    assert books[0]["genre"] == "Kids"
+    assert books[0]["reviews_count"] == 497
+    assert "reviews" not in books[0]
+
+
+# Test that with an identity index, the records are combined by ISBN whatever their URL, and the ranks and reviews follow.
+def test_combine_book_data_with_identity_index(raw_files, tmpdir):
+    best_sellers = [best_seller_record(2, "2023-1-9", 1), best_seller_record(1, "2023-1-9", 2), best_seller_record(2, "2023-1-16", 1, price="9.99")]
+    best_sellers[1]["isbns"] = best_sellers[0]["isbns"]
+    best_sellers[2]["amazon_product_url"] = None
+    tmpdir.join("best_sellers.json").write(json.dumps(best_sellers))
+    identity_index = IdentityIndex()
+
+    combine_book_data(raw_files["best_sellers.json"], raw_files["amazon.json"], raw_files["apple.csv"], raw_files["book.json"], identity_index)
+    write_rank(raw_files["best_sellers.json"], raw_files["book.json"], raw_files["rank.csv"], identity_index=identity_index)
+    write_reviews(raw_files["amazon.json"], raw_files["book.json"], raw_files["review.csv"], identity_index=identity_index)
+
+    with open(raw_files["book.json"], encoding='utf-8') as f:
+        books = json.load(f)
+
+    assert [(book["id"], book["title"]) for book in books] == [(1, "BOOK 2")]
+    assert books[0]["price"] == ["0.00", "9.99", "$7.85"]
+    assert tmpdir.join("rank.csv").read().splitlines()[1:] == ["1,2023-1-9,Picture Books,1,0,1", "1,2023-1-16,Picture Books,1,0,1"]
+    assert len(tmpdir.join("review.csv").read().splitlines()) == 3
+
+
+# Test that the reviews of 2 Amazon URLs resolved to the same book are numbered after each other, by write_reviews and by transform_tables.
+@pytest.mark.parametrize("fused", [False, True])
+def test_reviews_numbered_per_resolved_book(raw_files, tmpdir, fused):
+    best_sellers = [best_seller_record(2, "2023-1-9", 1), best_seller_record(1, "2023-1-9", 2)]
+    best_sellers[1]["isbns"] = best_sellers[0]["isbns"]
+    tmpdir.join("best_sellers.json").write(json.dumps(best_sellers))
+    amazon = [{"url": f"https://www.amazon.com/dp/{number}?tag=NYTBSREV-20", "rating": "4", "number_of_stars": "4.0", "reviews_count": 1,
+               "random_pages_count": 0, "reviews": [{"stars": "5.0", "title": f"title {number}", "text": "text", "date": "Reviewed on May 1, 2023"}]}
+              for number in [2, 1]]
+    tmpdir.join("amazon.json").write(json.dumps(amazon))
+    identity_index = IdentityIndex()
+
+    if fused:
+        transform_tables(raw_files["best_sellers.json"], raw_files["amazon.json"], raw_files["apple.csv"], raw_files["book.json"],
+                         raw_files["rank.csv"], raw_files["review.csv"], identity_index)
+    else:
+        combine_book_data(raw_files["best_sellers.json"], raw_files["amazon.json"], raw_files["apple.csv"], raw_files["book.json"], identity_index)
+        write_reviews(raw_files["amazon.json"], raw_files["book.json"], raw_files["review.csv"], identity_index=identity_index)
+
+    assert tmpdir.join("review.csv").read().splitlines()[1:] == ["1,1,5,title 2,text,2023-05-01", "1,2,5,title 1,text,2023-05-01"]
+
+
+# Test that a book without Amazon data keeps only its best-seller fields.
+def test_combine_book_data_without_amazon_data(raw_files):
+    combine_book_data(raw_files["best_sellers.json"], raw_files["amazon.json"], raw_files["apple.csv"], raw_files["book.json"])
+
+    with open(raw_files["book.json"], encoding='utf-8') as f:
+        books = json.load(f)
+
+    assert books[1]["price"] == ["0.00"]
+    assert books[1]["genre"] == ""
+    assert "rating" not in books[1]
+
+
+# Test that a best-seller record with a wrong type is rejected while the records are decoded, before any file is written.
+def test_combine_book_data_invalid_record(raw_files, tmpdir):
+    best_sellers = [best_seller_record(2, "2023-1-9", "first")]
+    tmpdir.join("best_sellers.json").write(json.dumps(best_sellers))
+
+    with pytest.raises(msgspec.ValidationError):
+        combine_book_data(raw_files["best_sellers.json"], raw_files["amazon.json"], raw_files["apple.csv"], raw_files["book.json"])
+
+    assert not os.path.exists(raw_files["book.json"])
+
+
+# Test that a first incremental run, from an empty index, gives the same books as combine_book_data and indexes them.
+def test_combine_new_book_data_from_empty_index(raw_files, tmpdir):
+    book_index = combine_new_book_data(raw_files["best_sellers.json"], raw_files["amazon.json"], raw_files["apple.csv"], raw_files["book.json"],
+                                       read_book_index(str(tmpdir.join("missing_index.json"))))
+    combine_book_data(raw_files["best_sellers.json"], raw_files["amazon.json"], raw_files["apple.csv"], str(tmpdir.join("full_book.json")))
+
+    with open(raw_files["book.json"], encoding='utf-8') as f, open(str(tmpdir.join("full_book.json")), encoding='utf-8') as g:
+        assert json.load(f) == json.load(g)
+    assert book_index == {"watermark": "2023-01-16", "next_id": 3,
+                          "ids": {"https://www.amazon.com/dp/2?tag=NYTBSREV-20": 1, "https://www.amazon.com/dp/1?tag=NYTBSREV-20": 2}}
+
+
+# Test that only the records after the watermark are processed, the known books keeping their id.
+def test_combine_new_book_data_after_watermark(raw_files):
+    book_index = {"watermark": "2023-01-09", "next_id": 3,
+                  "ids": {"https://www.amazon.com/dp/2?tag=NYTBSREV-20": 1, "https://www.amazon.com/dp/1?tag=NYTBSREV-20": 2}}
+
+    new_index = combine_new_book_data(raw_files["best_sellers.json"], raw_files["amazon.json"], raw_files["apple.csv"], raw_files["book.json"], book_index)
+
+    with open(raw_files["book.json"], encoding='utf-8') as f:
+        books = json.load(f)
+
+    assert [(book["id"], book["title"]) for book in books] == [(1, "BOOK 2")]
+    assert books[0]["price"] == ["9.99", "$7.85"]
+    assert new_index["watermark"] == "2023-01-16"
+    assert new_index["next_id"] == 3
+    assert book_index["watermark"] == "2023-01-09"
+
+
+# Test that only the book table fields of an Amazon item are kept, the missing optional ones being None.
+def test_amazon_book_fields():
+    item = {"url": "https://www.amazon.com/dp/2", "rating": "4,373", "number_of_stars": "4.9", "price": "$7.85", "reviews_count": 497,
+            "random_pages_count": 0, "reviews": [{"stars": "5.0"}]}
+
+    assert amazon_book_fields(item) == {"rating": "4,373", "number_of_stars": "4.9", "price": "$7.85", "number_of_pages": None, "language": None,
+                                        "publication_date": None, "reviews_count": 497, "random_pages_count": 0}
+
+
+# Test that the index is saved and read back, and that a missing index is empty.
+def test_book_index_round_trip(tmpdir):
+    index_json = str(tmpdir.join("book_index.json"))
+    assert read_book_index(index_json) == {"watermark": None, "next_id": 1, "ids": {}}
+
+    book_index = {"watermark": "2023-01-16", "next_id": 2, "ids": {"https://www.amazon.com/dp/2": 1}}
+    write_book_index(book_index, index_json)
+
+    assert read_book_index(index_json) == book_index
+
+
+# Test that only the ranks after the given date are written.
+def test_write_rank_since(raw_files):
+    combine_book_data(raw_files["best_sellers.json"], raw_files["amazon.json"], raw_files["apple.csv"], raw_files["book.json"])
+
+    write_rank(raw_files["best_sellers.json"], raw_files["book.json"], raw_files["rank.csv"], since="2023-01-09")
+
+    with open(raw_files["rank.csv"], encoding='utf-8') as f:
+        lines = f.read().splitlines()
+
+    assert lines == ["id_book,date,category,rank,rank_last_week,weeks_on_list", "1,2023-1-16,Picture Books,1,0,1"]
+
+
+# Test that the rows are deduplicated on (id_book, date, category), whatever the date padding, keeping the first occurrence.
+def test_write_rank_dedup_on_natural_key(raw_files, tmpdir):
+    best_sellers = [best_seller_record(2, "2023-1-9", 1), best_seller_record(2, "2023-01-09", 5), best_seller_record(1, "2023-1-9", 2)]
+    tmpdir.join("best_sellers.json").write(json.dumps(best_sellers))
+    combine_book_data(raw_files["best_sellers.json"], raw_files["amazon.json"], raw_files["apple.csv"], raw_files["book.json"])
+
+    write_rank(raw_files["best_sellers.json"], raw_files["book.json"], raw_files["rank.csv"])
+
+    with open(raw_files["rank.csv"], encoding='utf-8') as f:
+        lines = f.read().splitlines()
+
+    assert lines[1:] == ["1,2023-1-9,Picture Books,1,0,1", "2,2023-1-9,Picture Books,2,0,1"]
+
+
+# Test that the records without Amazon URL or absent from book.json are skipped.
+def test_write_rank_skips_unknown_books(raw_files, tmpdir):
+    tmpdir.join("book.json").write(json.dumps([{"id": 7, "url": "https://www.amazon.com/dp/1?tag=NYTBSREV-20"}]))
+
+    write_rank(raw_files["best_sellers.json"], raw_files["book.json"], raw_files["rank.csv"])
+
+    with open(raw_files["rank.csv"], encoding='utf-8') as f:
+        lines = f.read().splitlines()
+
+    assert lines[1:] == ["7,2023-1-9,Picture Books,2,0,1"]
+
+
+
+# Test that the reviews are written with their book id and normalized date, an unparseable date being left empty and reported.
+def test_write_reviews_unparseable_date(raw_files, tmpdir):
+    amazon = [{"url": "https://www.amazon.com/dp/2?tag=NYTBSREV-20",
+               "reviews": [{"stars": "5.0", "title": "title 1", "text": "text 1", "date": "Reviewed in the United Kingdom on 24 April 2023"},
+                           {"stars": "4.0", "title": "title 2", "text": "text 2", "date": "Reviewed recently"}]},
+              {"url": "https://www.amazon.com/dp/9", "reviews": [{"stars": "1.0", "title": "t", "text": "t", "date": "Reviewed on May 1, 2023"}]}]
+    tmpdir.join("amazon.json").write(json.dumps(amazon))
+    tmpdir.join("book.json").write(json.dumps([{"id": 1, "url": "https://www.amazon.com/dp/2?tag=NYTBSREV-20"}]))
+
+    unparseable = write_reviews(raw_files["amazon.json"], raw_files["book.json"], raw_files["review.csv"])
+
+    with open(raw_files["review.csv"], encoding='utf-8') as f:
+        lines = f.read().splitlines()
+
+    assert lines[1:] == ["1,1,5,title 1,text 1,2023-04-24", "1,2,4,title 2,text 2,"]
+    assert unparseable == [(1, 2)]
+
+
+# Test that the fused transform writes the same 3 files as combine_book_data, write_rank and write_reviews.
+def test_transform_tables_same_as_separate_functions(raw_files, tmpdir):
+    combine_book_data(raw_files["best_sellers.json"], raw_files["amazon.json"], raw_files["apple.csv"], raw_files["book.json"])
+    write_rank(raw_files["best_sellers.json"], raw_files["book.json"], raw_files["rank.csv"])
+    write_reviews(raw_files["amazon.json"], raw_files["book.json"], raw_files["review.csv"])
+
+    unparseable = transform_tables(raw_files["best_sellers.json"], raw_files["amazon.json"], raw_files["apple.csv"],
+                                   str(tmpdir.join("fused_book.json")), str(tmpdir.join("fused_rank.csv")), str(tmpdir.join("fused_review.csv")))
+
+    assert unparseable == []
+    for name in ["book.json", "rank.csv", "review.csv"]:
+        assert tmpdir.join(f"fused_{name}").read() == tmpdir.join(name).read()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 2026-10-19
+
+@author: Roland
+
+@abstract: create for the 'identity_index.py' source file,
+    2 unit tests for the 'record_identifiers' function,
+    3 unit tests for the 'IdentityIndex' class.
+"""
+
+import os
+import sys
+
+# Getting the absolute path of the current script file
+current_script_path = os.path.abspath(__file__)
+# Getting the directory of the current script file
+current_script_dir = os.path.dirname(current_script_path)
+# Constructing the absolute path of the project root
+root_dir = os.path.join(current_script_dir, '../..')
+sys.path.append(root_dir)
+from src.data_ingestion.identity_index import IdentityIndex, record_identifiers
+
+
+# Test that the identifiers of a best-seller record are its ISBNs, NYT URI, ASIN and normalized URL, without duplicates.
+def test_record_identifiers_best_seller():
+    record = {"isbns": [{"isbn10": "1943200084", "isbn13": "9781943200085"}], "primary_isbn13": "9781943200085", "primary_isbn10": "None",
+              "book_uri": "nyt://book/1", "amazon_product_url": "https://www.Amazon.com/dp/1943200084/?tag=NYTBSREV-20"}
+
+    assert record_identifiers(record) == ["isbn13:9781943200085", "isbn10:1943200084", "uri:nyt://book/1",
+                                          "asin:1943200084", "url:https://www.amazon.com/dp/1943200084"]
+
+
+# Test that an Amazon item is identified by its URL, and a record without any identifier has none.
+def test_record_identifiers_amazon_item():
+    assert record_identifiers({"url": "https://www.amazon.com/gp/product/B0BXYZ1234?th=1"}) == ["asin:B0BXYZ1234", "url:https://www.amazon.com/gp/product/B0BXYZ1234"]
+    assert record_identifiers({"amazon_product_url": None, "isbns": []}) == []
+
+
+# Test that the records sharing any identifier get the same id, and the new books the next ids.
+def test_book_id_union():
+    index = IdentityIndex()
+
+    first = index.book_id({"isbns": [{"isbn13": "9780000000001"}], "amazon_product_url": "https://www.amazon.com/dp/0000000001?tag=a"})
+    same_url = index.book_id({"isbns": [], "amazon_product_url": "https://www.amazon.com/dp/0000000001?tag=b"})
+    same_isbn = index.book_id({"isbns": [{"isbn13": "9780000000001"}], "amazon_product_url": None})
+    other = index.book_id({"isbns": [{"isbn13": "9780000000002"}], "amazon_product_url": None})
+
+    assert (first, same_url, same_isbn, other) == (1, 1, 1, 2)
+    assert index.url_id("https://www.amazon.com/dp/0000000001") == 1
+    assert index.url_id("https://www.amazon.com/dp/0000000009") is None
+
+
+# Test that merging two known books keeps the smaller id and records the other one as an alias.
+def test_book_id_merge_keeps_smaller_id():
+    index = IdentityIndex()
+    index.book_id({"isbns": [{"isbn13": "9780000000001"}]})
+    index.book_id({"isbns": [{"isbn13": "9780000000002"}]})
+
+    merged = index.book_id({"isbns": [{"isbn13": "9780000000002"}, {"isbn13": "9780000000001"}]})
+
+    assert merged == 1
+    assert index.resolve_id(2) == 1
+    assert index.find_id(["isbn13:9780000000002"]) == 1
+
+
+# Test that the index is saved and read back, and that a missing index is empty.
+def test_save_load_round_trip(tmpdir):
+    index_json = str(tmpdir.join("identity_index.json"))
+    assert IdentityIndex.load(index_json).next_id == 1
+
+    index = IdentityIndex()
+    index.book_id({"isbns": [{"isbn13": "9780000000001"}], "book_uri": "nyt://book/1"})
+    index.save(index_json)
+    loaded = IdentityIndex.load(index_json)
+
+    assert loaded.find_id(["uri:nyt://book/1"]) == 1
+    assert loaded.book_id({"isbns": [{"isbn13": "9780000000003"}]}) == 2
@@ -6,9 +6,19 @@ Created on 2023-07-24
 @author: Roland
 
 @abstract: create for the 'load.py' source file,
+    1 unit test for the 'fetch_book_index' function,
     2 unit tests for the 'load_book_into_database' function,
-    2 unit tests for the 'load_rank_into_database' function,
-    2 unit tests for the 'load_review_into_database' function.
+    5 unit tests for the 'load_books_into_database' function,
+    2 unit tests for the 'refresh_book_stats' function,
+    5 unit tests for the 'load_rank_into_database' function,
+    3 unit tests for the 'load_review_into_database' function,
+    2 unit tests for the 'copy_rank_into_database' function,
+    2 unit tests for the 'copy_review_into_database' function,
+    4 unit tests for the 'load_best_seller_into_database' function,
+    1 unit test for the 'load_best_seller_files_into_database' function,
+    3 unit tests for the 'ensure_rank_partitions' function,
+    1 unit test for the 'attach_rank_partition' function,
+    1 unit test for the 'apply_book_aliases' function.
 """
 
 import os
@@ -16,8 +26,8 @@ import sys
 import json
 from io import StringIO
 import pytest
-from unittest.mock import patch, mock_open
-from sqlalchemy import create_engine
+from unittest.mock import patch, mock_open, MagicMock
+from sqlalchemy import create_engine, event
 from sqlalchemy.sql import text
 import pandas as pd
 
@@ -26,11 +36,28 @@ import pandas as pd
 current_script_path = os.path.abspath(__file__)
 # Getting the directory of the current script file
 current_script_dir = os.path.dirname(current_script_path)
+# Constructing the absolute path of the project root
+root_dir = os.path.join(current_script_dir, '../..')
+sys.path.append(root_dir)
 # Constructing the absolute path of the src/01_data_collection directory
 src_dir = os.path.join(current_script_dir, '../..', 'src', 'data_ingestion')
 # Adding the absolute path to system path
 sys.path.append(src_dir)
-from load import load_book_into_database, load_rank_into_database, load_review_into_database
+from load import apply_book_aliases, ensure_rank_partitions, attach_rank_partition, refresh_book_stats, load_best_seller_into_database, load_best_seller_files_into_database, load_books_into_database, copy_rank_into_database, copy_review_into_database, fetch_book_index, load_book_into_database, load_rank_into_database, load_review_into_database
+from src.data_ingestion.extract_transform import write_reviews
+
+
+# The test checks that the index of an incremental run is built from the loaded books (with the earlier URLs of a merged book), the most recent rank date, which may be only partly loaded, being left after the watermark.
+def test_fetch_book_index():
+    engine = create_engine('sqlite:///:memory:')
+    with engine.begin() as connection:
+        connection.execute(text('CREATE TABLE book (id INT PRIMARY KEY, data TEXT)'))
+        connection.execute(text('CREATE TABLE rank (id_book INT, date DATE, category TEXT)'))
+        connection.execute(text("INSERT INTO book (id, data) VALUES (1, :a), (2, :b)"), {"a": json.dumps({"url": "https://www.amazon.com/1"}), "b": json.dumps({"url": "https://www.amazon.com/2", "urls": ["https://www.amazon.com/3", "https://www.amazon.com/2"]})})
+        connection.execute(text("INSERT INTO rank (id_book, date, category) VALUES (1, '2023-01-02', 'Fiction'), (1, '2023-01-09', 'Fiction'), (2, '2023-01-16', 'Fiction')"))
+
+    assert fetch_book_index(engine) == {"watermark": "2023-01-09", "next_id": 3,
+                                        "ids": {"https://www.amazon.com/1": 1, "https://www.amazon.com/2": 2, "https://www.amazon.com/3": 2}}
 
 
 # The test tests the case where the book ID is not already in the database. It asserts that the INSERT statement was executed with the expected values.
@@ -69,6 +96,95 @@ def test_load_book_into_database_existing():
     assert json.loads(result[0][1]) == {"title": "New Book", "author": "John Doe"}
 
 
+# The test checks that a JSON array of books is upserted by chunks, the data of an existing book being merged with the new one.
+def test_load_books_into_database_upsert(tmpdir):
+    engine = create_engine('sqlite:///:memory:')
+    with engine.begin() as connection:
+        connection.execute(text('CREATE TABLE book (id INT PRIMARY KEY, data TEXT)'))
+        connection.execute(text("INSERT INTO book (id, data) VALUES (1, :data)"), {"data": json.dumps({"title": "Old", "genre": "Fiction"})})
+    book_json = tmpdir.join("book.json")
+    book_json.write(json.dumps([{"id": 1, "title": "New"}, {"id": 2, "title": "Book 2"}, {"id": 3, "title": "Book 3"}]))
+
+    count = load_books_into_database(str(book_json), engine, chunk_size=2)
+
+    with engine.connect() as connection:
+        result = connection.execute(text('SELECT id, data FROM book ORDER BY id')).fetchall()
+
+    assert count == 3
+    assert [(row[0], json.loads(row[1])) for row in result] == [(1, {"title": "New", "genre": "Fiction"}), (2, {"title": "Book 2"}), (3, {"title": "Book 3"})]
+
+
+# The test checks that the delta of a known book completes its stored list fields, and keeps its genre when the delta has none.
+def test_load_books_into_database_delta(tmpdir):
+    engine = create_engine('sqlite:///:memory:')
+    with engine.begin() as connection:
+        connection.execute(text('CREATE TABLE book (id INT PRIMARY KEY, data TEXT)'))
+        connection.execute(text("INSERT INTO book (id, data) VALUES (1, :data)"),
+                           {"data": json.dumps({"title": "Book 1", "isbn13": ["978"], "price": ["0.00", "$7.85"], "genre": "Kids", "rating": "4,373"})})
+    book_json = tmpdir.join("book.json")
+    book_json.write(json.dumps([{"id": 1, "title": "Book 1", "isbn13": ["978", "979"], "price": ["9.99"], "genre": ""}]))
+
+    load_books_into_database(str(book_json), engine)
+
+    with engine.connect() as connection:
+        data = json.loads(connection.execute(text('SELECT data FROM book WHERE id = 1')).scalar())
+
+    assert data == {"title": "Book 1", "isbn13": ["978", "979"], "price": ["0.00", "$7.85", "9.99"], "genre": "Kids", "rating": "4,373"}
+
+
+# The test checks that the books of a chunk sharing an id are merged into a single row of the statement, in file order.
+def test_load_books_into_database_duplicate_ids(tmpdir):
+    engine = MagicMock()
+    connection = engine.begin.return_value.__enter__.return_value
+    connection.dialect.name = 'postgresql'
+    book_json = tmpdir.join("book.json")
+    book_json.write(json.dumps([{"id": 1, "title": "Book 1", "price": ["0.00"], "genre": "Kids"}, {"id": 2, "title": "Book 2"},
+                                {"id": 1, "title": "Book 1 (2)", "price": ["9.99"], "genre": ""}]))
+
+    load_books_into_database(str(book_json), engine)
+
+    select, select_parameters = connection.execute.call_args_list[0].args
+    assert select_parameters == {"ids": [1, 2]}
+    statement, parameters = connection.execute.call_args.args
+    assert str(statement).count("CAST(") == 2
+    assert (parameters["id_0"], parameters["id_1"]) == (1, 2)
+    assert json.loads(parameters["data_0"]) == {"title": "Book 1 (2)", "price": ["0.00", "9.99"], "genre": "Kids"}
+
+
+# The test checks that the books can be read from a JSON Lines file.
+def test_load_books_into_database_jsonl(tmpdir):
+    engine = create_engine('sqlite:///:memory:')
+    with engine.begin() as connection:
+        connection.execute(text('CREATE TABLE book (id INT PRIMARY KEY, data TEXT)'))
+    book_jsonl = tmpdir.join("book.jsonl")
+    book_jsonl.write('{"id": 1, "title": "Book 1"}\n{"id": 2, "title": "Book 2"}\n')
+
+    assert load_books_into_database(str(book_jsonl), engine) == 2
+
+    with engine.connect() as connection:
+        assert connection.execute(text('SELECT COUNT(*) FROM book')).scalar() == 2
+
+
+# The test checks the PostgreSQL statements: the stored books locked and read, then a multi-row insert of the merged JSONB values.
+def test_load_books_into_database_postgresql_statement(tmpdir):
+    engine = MagicMock()
+    connection = engine.begin.return_value.__enter__.return_value
+    connection.dialect.name = 'postgresql'
+    book_json = tmpdir.join("book.json")
+    book_json.write(json.dumps([{"id": 1, "title": "Book 1"}, {"id": 2, "title": "Book 2"}]))
+
+    load_books_into_database(str(book_json), engine)
+
+    select, select_parameters = connection.execute.call_args_list[0].args
+    assert str(select) == "SELECT id, data FROM book WHERE id IN (__[POSTCOMPILE_ids]) FOR UPDATE"
+    assert select_parameters == {"ids": [1, 2]}
+    statement, parameters = connection.execute.call_args.args
+    assert str(statement) == ("INSERT INTO book (id, data) VALUES (:id_0, CAST(:data_0 AS JSONB)), (:id_1, CAST(:data_1 AS JSONB)) "
+                              "ON CONFLICT (id) DO UPDATE SET data = EXCLUDED.data")
+    assert parameters["id_1"] == 2
+    assert json.loads(parameters["data_1"]) == {"title": "Book 2"}
+
+
 # The test checks the function's ability to correctly insert new data into an empty database.
 def test_load_rank_into_database_new():
     # Create an in-memory SQLite database for testing
@@ -80,7 +196,7 @@ def test_load_rank_into_database_new():
     
     # Mock the pd.read_csv function to return a DataFrame from our string
     with patch('pandas.read_csv', return_value=pd.read_csv(StringIO(csv_data))):
-        load_rank_into_database('file_path', engine, 'test_table')
+        load_rank_into_database('file_path', engine, 'test_table', stats_table=None)
 
     with engine.connect() as connection:
         result = connection.execute(text('SELECT * FROM test_table')).fetchall()
@@ -103,7 +219,7 @@ def test_load_rank_into_database_existing():
 
     # Mock the pd.read_csv function to return a DataFrame from our string
     with patch('pandas.read_csv', return_value=pd.read_csv(StringIO(csv_data))):
-        load_rank_into_database('file_path', engine, 'test_table')
+        load_rank_into_database('file_path', engine, 'test_table', stats_table=None)
 
     with engine.connect() as connection:
         result = connection.execute(text('SELECT * FROM test_table')).fetchall()
@@ -114,6 +230,24 @@ def test_load_rank_into_database_existing():
     assert result[0][2] == 'Fiction'
 
 
+# The test checks that the rank data can be read from a Parquet dataset instead of a CSV file.
+def test_load_rank_into_database_parquet(tmpdir):
+    pytest.importorskip("pyarrow")
+    engine = create_engine('sqlite:///:memory:')
+    with engine.connect() as connection:
+        connection.execute(text('CREATE TABLE test_table (id_book INT, date DATE, category TEXT)'))
+
+    pd.read_csv(StringIO('id_book,date,category\n1,2023-07-24,Fiction')).to_parquet(str(tmpdir.join("rank")), partition_cols=['category'], index=False)
+    load_rank_into_database(str(tmpdir.join("rank")), engine, 'test_table', stats_table=None)
+
+    with engine.connect() as connection:
+        result = connection.execute(text('SELECT * FROM test_table')).fetchall()
+
+    assert len(result) == 1
+    assert result[0][0] == 1
+    assert result[0][2] == 'Fiction'
+
+
 # The test checks the function's ability to correctly insert new data into an empty database.
 def test_load_review_into_database_new():
     # Create an in-memory SQLite database for testing
@@ -125,7 +259,7 @@ def test_load_review_into_database_new():
     
     # Mock the pd.read_csv function to return a DataFrame from our string
     with patch('pandas.read_csv', return_value=pd.read_csv(StringIO(csv_data))):
-        load_review_into_database('file_path', engine, 'test_table')
+        load_review_into_database('file_path', engine, 'test_table', stats_table=None)
 
     with engine.connect() as connection:
         result = connection.execute(text('SELECT * FROM test_table')).fetchall()
@@ -148,7 +282,7 @@ def test_load_review_into_database_existing():
 
     # Mock the pd.read_csv function to return a DataFrame from our string
     with patch('pandas.read_csv', return_value=pd.read_csv(StringIO(csv_data))):
-        load_review_into_database('file_path', engine, 'test_table')
+        load_review_into_database('file_path', engine, 'test_table', stats_table=None)
 
     with engine.connect() as connection:
         result = connection.execute(text('SELECT * FROM test_table')).fetchall()
@@ -157,3 +291,345 @@ def test_load_review_into_database_existing():
     assert result[0][0] == 1
     assert result[0][1] == 1
     assert pd.to_datetime(result[0][2]) == pd.to_datetime('2023-07-24')
+
+
+# The test checks that only the new keys of a batch are inserted, the same date and category of another book or a repeated row not being confused.
+def test_load_rank_into_database_partial_batch():
+    engine = create_engine('sqlite:///:memory:')
+    with engine.begin() as connection:
+        connection.execute(text('CREATE TABLE test_table (id_book INT, date DATE, category TEXT, rank INT)'))
+        connection.execute(text("INSERT INTO test_table VALUES (1, '2023-07-24', 'Fiction', 1), (2, '2023-07-24', 'Fiction', 2)"))
+
+    csv_data = 'id_book,date,category,rank\n1,2023-07-24,Fiction,1\n1,2023-07-31,Fiction,1\n1,2023-07-31,Fiction,1\n3,2023-07-24,Fiction,2'
+
+    with patch('pandas.read_csv', return_value=pd.read_csv(StringIO(csv_data))):
+        load_rank_into_database('file_path', engine, 'test_table', stats_table=None)
+
+    with engine.connect() as connection:
+        result = connection.execute(text('SELECT id_book, rank FROM test_table ORDER BY id_book, date')).fetchall()
+
+    assert [tuple(row) for row in result] == [(1, 1), (1, 1), (2, 2), (3, 2)]
+
+
+# The test checks that the existing keys are read with a query restricted to the books of the batch.
+def test_load_review_into_database_reads_batch_keys_only():
+    engine = create_engine('sqlite:///:memory:')
+    with engine.begin() as connection:
+        connection.execute(text('CREATE TABLE test_table (id_book INT, id_review INT, text TEXT, date DATE)'))
+        connection.execute(text("INSERT INTO test_table VALUES (1, 1, 'long text', '2023-07-24')"))
+
+    csv_data = 'id_book,id_review,text,date\n1,1,long text,2023-07-24\n1,2,text,2023-07-25'
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda conn, cursor, statement, *args: statements.append(statement))
+
+    with patch('pandas.read_csv', return_value=pd.read_csv(StringIO(csv_data))):
+        load_review_into_database('file_path', engine, 'test_table', stats_table=None)
+
+    with engine.connect() as connection:
+        assert connection.execute(text('SELECT COUNT(*) FROM test_table')).scalar() == 2
+    assert statements[0].startswith("SELECT id_book, id_review FROM test_table WHERE id_book IN (")
+
+
+# The test checks that the rank file is streamed with COPY into a temporary table, then inserted with ON CONFLICT DO NOTHING on the primary key, after the creation of its yearly partition.
+def test_copy_rank_into_database(tmpdir):
+    rank_csv = tmpdir.join("rank.csv")
+    rank_csv.write('id_book,date,category,rank,rank_last_week,weeks_on_list\n1,2023-07-24,Fiction,1,0,1\n')
+    engine = MagicMock()
+    cursor = engine.raw_connection.return_value.cursor.return_value
+    cursor.rowcount = 1
+    cursor.copy_expert.side_effect = lambda sql, source: copied.append(source.read())
+    copied = []
+    # The rank table is partitioned, and the file has ranks of 2023
+    cursor.fetchone.return_value = (1,)
+    cursor.fetchall.return_value = [(2023,)]
+
+    inserted = copy_rank_into_database(str(rank_csv), engine)
+
+    statements = [call.args[0] for call in cursor.execute.call_args_list]
+    assert inserted == 1
+    assert statements[0] == "CREATE TEMP TABLE tmp_rank (LIKE rank INCLUDING DEFAULTS) ON COMMIT DROP"
+    assert cursor.copy_expert.call_args.args[0] == "COPY tmp_rank (id_book, date, category, rank, rank_last_week, weeks_on_list) FROM STDIN WITH (FORMAT csv, HEADER true)"
+    assert copied == [rank_csv.read()]
+    assert statements[3] == "CREATE TABLE IF NOT EXISTS rank_y2023 PARTITION OF rank FOR VALUES FROM ('2023-01-01') TO ('2024-01-01')"
+    assert statements[4].endswith("FROM tmp_rank ON CONFLICT (id_book, date, category) DO NOTHING")
+    assert "INSERT INTO book_stats" in statements[5] and "IN (SELECT DISTINCT id_book FROM tmp_rank)" in statements[5]
+    engine.raw_connection.return_value.commit.assert_called_once()
+    engine.raw_connection.return_value.close.assert_called_once()
+
+
+# The test checks that the transaction is rolled back and the connection closed when the COPY fails.
+def test_copy_rank_into_database_rollback(tmpdir):
+    rank_csv = tmpdir.join("rank.csv")
+    rank_csv.write('id_book,date,category\n1,2023-07-24,Fiction\n')
+    engine = MagicMock()
+    engine.raw_connection.return_value.cursor.return_value.copy_expert.side_effect = RuntimeError("COPY failed")
+
+    with pytest.raises(RuntimeError):
+        copy_rank_into_database(str(rank_csv), engine)
+
+    engine.raw_connection.return_value.rollback.assert_called_once()
+    engine.raw_connection.return_value.commit.assert_not_called()
+    engine.raw_connection.return_value.close.assert_called_once()
+
+
+# The test checks that the reviews are deduplicated on (id_book, id_review) by the database.
+def test_copy_review_into_database(tmpdir):
+    review_csv = tmpdir.join("review.csv")
+    review_csv.write('id_book,id_review,stars,title,text,date\n1,1,5.0,title,text,2023-04-24\n')
+    engine = MagicMock()
+
+    copy_review_into_database(str(review_csv), engine, 'review')
+
+    statements = [call.args[0] for call in engine.raw_connection.return_value.cursor.return_value.execute.call_args_list]
+    assert statements[1] == "ALTER TABLE tmp_review ALTER COLUMN stars TYPE NUMERIC"
+    assert statements[2] == ("INSERT INTO review (id_book, id_review, stars, title, text, date) SELECT id_book, id_review, stars, title, text, date "
+                             "FROM tmp_review ON CONFLICT (id_book, id_review) DO NOTHING")
+
+
+# The test checks that the review.csv written by write_reviews, from the stars scraped as "5.0", is copied with integer stars.
+def test_copy_review_into_database_write_reviews_output(tmpdir):
+    amazon = [{"url": "https://www.amazon.com/dp/1", "reviews": [{"stars": "5.0", "title": "title", "text": "text", "date": "Reviewed in the United States on April 24, 2023"},
+                                                                 {"stars": "4.0", "title": "title", "text": "text", "date": "Reviewed recently"}]}]
+    tmpdir.join("amazon.json").write(json.dumps(amazon))
+    tmpdir.join("book.json").write(json.dumps([{"id": 1, "url": "https://www.amazon.com/dp/1"}]))
+    write_reviews(str(tmpdir.join("amazon.json")), str(tmpdir.join("book.json")), str(tmpdir.join("review.csv")))
+    engine = MagicMock()
+    cursor = engine.raw_connection.return_value.cursor.return_value
+    copied = []
+    cursor.copy_expert.side_effect = lambda sql, source: copied.append(source.read())
+
+    copy_review_into_database(str(tmpdir.join("review.csv")), engine)
+
+    rows = pd.read_csv(StringIO(copied[0]))
+    assert rows['stars'].tolist() == [5, 4]
+    assert rows['stars'].dtype == 'int64'
+
+
+def create_nyt_tables(engine):
+    # The 3 tables of schema.sql and the book_stats table, with SQLite types
+    with engine.begin() as connection:
+        connection.execute(text('CREATE TABLE book (id INT PRIMARY KEY, data TEXT NOT NULL)'))
+        connection.execute(text('CREATE TABLE rank (id_book INT NOT NULL, date DATE NOT NULL, category TEXT NOT NULL, rank INT, '
+                                'rank_last_week INT, weeks_on_list INT, PRIMARY KEY (id_book, date, category))'))
+        connection.execute(text('CREATE TABLE review (id_book INT NOT NULL, id_review INT NOT NULL, stars INT, title TEXT, text TEXT, '
+                                'date DATE, PRIMARY KEY (id_book, id_review))'))
+        connection.execute(text('CREATE TABLE book_stats (id_book INT PRIMARY KEY, best_rank INT, max_weeks INT, first_date DATE, last_date DATE, '
+                                'categories TEXT, mean_first_stars REAL, reviews_count INT NOT NULL DEFAULT 0)'))
+
+
+# The test checks that the book, its ranks, its reviews and its statistics are loaded, the rows already present being skipped.
+def test_load_best_seller_into_database():
+    engine = create_engine('sqlite:///:memory:')
+    create_nyt_tables(engine)
+    ranks = [[1, '2023-07-24', 'Fiction', 1, 0, 1]]
+    reviews = [[1, 1, 5, 'title 1', 'text 1', '2023-04-24'], [1, 2, 4, 'title 2', 'text 2', None]]
+
+    load_best_seller_into_database(engine, {"id": 1, "title": "Book"}, ranks, reviews)
+    load_best_seller_into_database(engine, {"id": 1, "title": "Book"}, ranks, reviews)
+
+    with engine.connect() as connection:
+        counts = [connection.execute(text(f'SELECT COUNT(*) FROM {table}')).scalar() for table in ['book', 'rank', 'review', 'book_stats']]
+        data = connection.execute(text('SELECT data FROM book')).scalar()
+
+    assert counts == [1, 1, 2, 1]
+    assert json.loads(data) == {"title": "Book"}
+
+
+# The test checks that a new Amazon page of a stored book is merged into it, its reviews being numbered after the stored ones.
+def test_load_best_seller_into_database_append():
+    engine = create_engine('sqlite:///:memory:')
+    create_nyt_tables(engine)
+    load_best_seller_into_database(engine, {"id": 1, "title": "Book", "price": ["0.00"], "genre": "Kids"}, [[1, '2023-07-24', 'Fiction', 1, 0, 1]],
+                                   [[1, 1, 5, 'title 1', 'text 1', None], [1, 2, 4, 'title 2', 'text 2', None]])
+
+    load_best_seller_into_database(engine, {"id": 1, "title": "Book", "price": ["9.99"], "genre": ""}, [[1, '2023-07-31', 'Fiction', 2, 1, 2]],
+                                   [[1, 1, 3, 'title 3', 'text 3', None]], append=True)
+
+    with engine.connect() as connection:
+        reviews = connection.execute(text('SELECT id_review, title FROM review ORDER BY id_review')).fetchall()
+        data = json.loads(connection.execute(text('SELECT data FROM book')).scalar())
+        stats = connection.execute(text('SELECT reviews_count, max_weeks FROM book_stats')).fetchone()
+
+    assert reviews == [(1, 'title 1'), (2, 'title 2'), (3, 'title 3')]
+    assert data == {"title": "Book", "price": ["0.00", "9.99"], "genre": "Kids"}
+    assert tuple(stats) == (3, 2)
+
+
+# The test checks that the aliases are merged in the transaction of the load, and that the id the loaded book resolves to is returned.
+def test_load_best_seller_into_database_with_aliases():
+    engine = create_engine('sqlite:///:memory:')
+    create_nyt_tables(engine)
+    load_best_seller_into_database(engine, {"id": 1, "title": "Book"}, [[1, '2023-07-24', 'Fiction', 1, 0, 1]], [[1, 1, 5, 'title 1', 'text 1', None]])
+
+    book_id = load_best_seller_into_database(engine, {"id": 2, "title": "Book (2)"}, [[2, '2023-07-31', 'Fiction', 2, 1, 2]],
+                                             [[2, 1, 4, 'title 2', 'text 2', None]], append=True, aliases={"2": 1})
+
+    with engine.connect() as connection:
+        books = connection.execute(text('SELECT id FROM book')).fetchall()
+        reviews = connection.execute(text('SELECT id_book, id_review FROM review ORDER BY id_review')).fetchall()
+        stats = connection.execute(text('SELECT id_book, reviews_count, max_weeks FROM book_stats')).fetchall()
+
+    assert book_id == 1
+    assert books == [(1,)]
+    assert reviews == [(1, 1), (1, 2)]
+    assert stats == [(1, 2, 2)]
+
+
+# The test checks that nothing is written when one of the tables fails to load.
+def test_load_best_seller_into_database_atomic():
+    engine = create_engine('sqlite:///:memory:')
+    create_nyt_tables(engine)
+
+    with pytest.raises(Exception):
+        load_best_seller_into_database(engine, {"id": 1, "title": "Book"}, [[1, None, 'Fiction', 1, 0, 1]], [])
+
+    with engine.connect() as connection:
+        assert connection.execute(text('SELECT COUNT(*) FROM book')).scalar() == 0
+
+
+# The test checks that the files of the single-book pipeline are loaded with typed values, an empty date being loaded as NULL.
+def test_load_best_seller_files_into_database(tmpdir):
+    engine = create_engine('sqlite:///:memory:')
+    create_nyt_tables(engine)
+    tmpdir.join("book.json").write(json.dumps({"id": 1, "title": "Book"}))
+    tmpdir.join("rank.csv").write('id_book,date,category,rank,rank_last_week,weeks_on_list\n1,2023-07-24,Fiction,1,0,1\n')
+    # The stars are written as write_reviews and the scraper produce them
+    tmpdir.join("review.csv").write('id_book,id_review,stars,title,text,date\n1,1,5.0,title,text,\n')
+    parameters = []
+    event.listen(engine, "before_cursor_execute", lambda conn, cursor, statement, params, *args: parameters.append(params))
+
+    load_best_seller_files_into_database(str(tmpdir.join("book.json")), str(tmpdir.join("rank.csv")), str(tmpdir.join("review.csv")), engine)
+
+    with engine.connect() as connection:
+        assert connection.execute(text('SELECT id_book, date, category FROM rank')).fetchall() == [(1, '2023-07-24', 'Fiction')]
+        assert connection.execute(text('SELECT date FROM review')).scalar() is None
+    # The values are bound with the types of their columns, not as text
+    assert (1, '2023-07-24', 'Fiction', 1, 0, 1) in parameters
+    assert (1, 1, 5, 'title', 'text', None) in parameters
+
+
+# The test checks that the statistics of the given books are computed from their ranks and first reviews, and recomputed after new rows.
+def test_refresh_book_stats():
+    engine = create_engine('sqlite:///:memory:')
+    create_nyt_tables(engine)
+    with engine.begin() as connection:
+        connection.execute(text("INSERT INTO book (id, data) VALUES (1, '{}'), (2, '{}')"))
+        connection.execute(text("INSERT INTO rank VALUES (1, '2023-07-24', 'Fiction', 3, 0, 1), (1, '2023-07-31', 'Fiction', 2, 3, 2), "
+                                "(1, '2023-07-31', 'Audio Fiction', 5, 0, 1), (2, '2023-07-31', 'Fiction', 1, 0, 1)"))
+        connection.execute(text("INSERT INTO review (id_book, id_review, stars) VALUES (:id_book, :id_review, :stars)"),
+                           [{"id_book": 1, "id_review": i, "stars": 4 if i <= 10 else 1} for i in range(1, 13)])
+        refresh_book_stats(connection, [1, 1])
+
+    with engine.begin() as connection:
+        row = connection.execute(text('SELECT * FROM book_stats')).fetchall()
+        assert len(row) == 1
+        id_book, best_rank, max_weeks, first_date, last_date, categories, mean_first_stars, reviews_count = row[0]
+        assert (id_book, best_rank, max_weeks, first_date, last_date) == (1, 2, 2, '2023-07-24', '2023-07-31')
+        assert sorted(json.loads(categories)) == ['Audio Fiction', 'Fiction']
+        assert (mean_first_stars, reviews_count) == (4.0, 12)
+
+        connection.execute(text("INSERT INTO rank VALUES (1, '2023-08-07', 'Fiction', 1, 2, 3)"))
+        refresh_book_stats(connection, [1])
+        assert tuple(connection.execute(text('SELECT best_rank, max_weeks, last_date FROM book_stats WHERE id_book = 1')).fetchone()) == (1, 3, '2023-08-07')
+
+
+# The test checks that no statement is run without any book to refresh.
+def test_refresh_book_stats_no_book():
+    connection = MagicMock()
+
+    refresh_book_stats(connection, [])
+
+    connection.execute.assert_not_called()
+
+
+# The test checks that the statistics of the books of the new rank rows are refreshed with the load.
+def test_load_rank_into_database_refreshes_book_stats():
+    engine = create_engine('sqlite:///:memory:')
+    create_nyt_tables(engine)
+    with engine.begin() as connection:
+        connection.execute(text("INSERT INTO book (id, data) VALUES (1, '{}'), (2, '{}')"))
+
+    csv_data = 'id_book,date,category,rank,rank_last_week,weeks_on_list\n1,2023-07-24,Fiction,4,0,1\n1,2023-07-31,Fiction,2,4,2'
+    with patch('pandas.read_csv', return_value=pd.read_csv(StringIO(csv_data))):
+        load_rank_into_database('file_path', engine, 'rank')
+
+    with engine.connect() as connection:
+        result = connection.execute(text('SELECT id_book, best_rank, max_weeks, reviews_count FROM book_stats')).fetchall()
+
+    assert [tuple(row) for row in result] == [(1, 2, 2, 0)]
+
+
+# The test checks that the missing yearly partitions of a partitioned rank table are created, once per year.
+def test_ensure_rank_partitions():
+    connection = MagicMock()
+    connection.dialect.name = 'postgresql'
+    connection.exec_driver_sql.return_value.scalar.return_value = 1
+
+    partitions = ensure_rank_partitions(connection, [2023, 2022, 2023])
+
+    statements = [call.args[0] for call in connection.exec_driver_sql.call_args_list]
+    assert partitions == ['rank_y2022', 'rank_y2023']
+    assert statements == ["SELECT COUNT(*) FROM pg_partitioned_table WHERE partrelid = to_regclass('rank')",
+                          "CREATE TABLE IF NOT EXISTS rank_y2022 PARTITION OF rank FOR VALUES FROM ('2022-01-01') TO ('2023-01-01')",
+                          "CREATE TABLE IF NOT EXISTS rank_y2023 PARTITION OF rank FOR VALUES FROM ('2023-01-01') TO ('2024-01-01')"]
+
+
+# The test checks that nothing is created when the rank table is not partitioned.
+def test_ensure_rank_partitions_not_partitioned():
+    connection = MagicMock()
+    connection.dialect.name = 'postgresql'
+    connection.exec_driver_sql.return_value.scalar.return_value = 0
+
+    assert ensure_rank_partitions(connection, [2023]) == []
+    assert connection.exec_driver_sql.call_count == 1
+
+
+# The test checks that nothing is done on another database than PostgreSQL.
+def test_ensure_rank_partitions_sqlite():
+    engine = create_engine('sqlite:///:memory:')
+    create_nyt_tables(engine)
+
+    with engine.begin() as connection:
+        assert ensure_rank_partitions(connection, [2023]) == []
+
+
+# The test checks that a loaded table is attached as a yearly partition behind a matching CHECK constraint, and that the statistics of its books are refreshed.
+def test_attach_rank_partition():
+    engine = MagicMock()
+    connection = engine.begin.return_value.__enter__.return_value
+
+    attach_rank_partition(engine, 'rank_y2001', 2001)
+
+    statements = [call.args[0] for call in connection.exec_driver_sql.call_args_list]
+    assert statements[:3] == ["ALTER TABLE rank_y2001 ADD CONSTRAINT rank_y2001_date_range CHECK (date >= '2001-01-01' AND date < '2002-01-01')",
+                              "ALTER TABLE rank ATTACH PARTITION rank_y2001 FOR VALUES FROM ('2001-01-01') TO ('2002-01-01')",
+                              "ALTER TABLE rank_y2001 DROP CONSTRAINT rank_y2001_date_range"]
+    assert "INSERT INTO book_stats" in statements[3] and "IN (SELECT DISTINCT id_book FROM rank_y2001)" in statements[3]
+
+
+# The test checks that the books merged by an identity index are merged in the database, following the chains of merges, and that a second run changes nothing.
+def test_apply_book_aliases():
+    engine = create_engine('sqlite:///:memory:')
+    create_nyt_tables(engine)
+    load_best_seller_into_database(engine, {"id": 1, "title": "Book", "isbn13": ["978"], "genre": ""}, [[1, '2023-07-24', 'Fiction', 1, 0, 1]],
+                                   [[1, 1, 5, 'title 1', 'text 1', None]])
+    load_best_seller_into_database(engine, {"id": 2, "title": "Book (2)", "isbn13": ["979"], "genre": "Kids"},
+                                   [[2, '2023-07-24', 'Fiction', 1, 0, 1], [2, '2023-07-31', 'Fiction', 3, 1, 2]],
+                                   [[2, 1, 4, 'title 2', 'text 2', None], [2, 2, 3, 'title 3', 'text 3', None]])
+    load_best_seller_into_database(engine, {"id": 3, "title": "Book (3)"}, [], [[3, 1, 2, 'title 4', 'text 4', None]])
+    # Book 3 was merged into book 2, later merged into book 1
+    aliases = {"2": 1, "3": 2}
+
+    assert apply_book_aliases(engine, aliases) == [2, 3]
+    assert apply_book_aliases(engine, aliases) == []
+
+    with engine.connect() as connection:
+        books = connection.execute(text('SELECT id, data FROM book')).fetchall()
+        ranks = connection.execute(text('SELECT id_book, date, rank FROM rank ORDER BY date')).fetchall()
+        reviews = connection.execute(text('SELECT id_book, id_review, title FROM review ORDER BY id_review')).fetchall()
+        stats = connection.execute(text('SELECT id_book, reviews_count, max_weeks FROM book_stats')).fetchall()
+
+    assert [(id_book, json.loads(data)) for id_book, data in books] == [(1, {"title": "Book", "isbn13": ["978", "979"], "genre": "Kids"})]
+    assert ranks == [(1, '2023-07-24', 1), (1, '2023-07-31', 3)]
+    assert reviews == [(1, 1, 'title 1'), (1, 2, 'title 2'), (1, 3, 'title 3'), (1, 4, 'title 4')]
+    assert stats == [(1, 4, 2)]
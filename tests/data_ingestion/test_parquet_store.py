@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 2026-10-19
+
+@author: Roland
+
+@abstract: create for the 'parquet_store.py' source file,
+    1 unit test for the 'best_sellers_to_parquet' function,
+    1 unit test for the 'book_to_parquet' function,
+    2 unit tests for the 'rank_to_parquet' and 'read_parquet_table' functions,
+    1 unit test for the 'review_to_parquet' and 'read_reviews_parquet' functions.
+"""
+
+import os
+import sys
+import json
+import pytest
+
+pytest.importorskip("pyarrow")
+
+# Getting the absolute path of the current script file
+current_script_path = os.path.abspath(__file__)
+# Getting the directory of the current script file
+current_script_dir = os.path.dirname(current_script_path)
+# Constructing the absolute path of the project root
+root_dir = os.path.join(current_script_dir, '../..')
+sys.path.append(root_dir)
+from src.data_ingestion.parquet_store import best_sellers_to_parquet, book_to_parquet, rank_to_parquet, review_to_parquet, read_parquet_table, read_reviews_parquet
+
+
+rank_csv_data = """id_book,date,category,rank,rank_last_week,weeks_on_list
+1,2023-01-09,Hardcover Fiction,1,2,10
+2,2023-01-09,Picture Books,3,0,1
+1,2023-01-16,Hardcover Fiction,2,1,11
+"""
+
+review_csv_data = """id_book,id_review,stars,title,text,date
+1,1,5.0,title 1,text 1,2023-04-24
+1,2,4.0,title 2,text 2,2023-04-25
+1500,1,3.0,title 3,text 3,2023-04-26
+"""
+
+
+# Test that the best-seller records are partitioned by year, week and category.
+def test_best_sellers_to_parquet_partitions(tmpdir):
+    data = [{"title": "Book 1", "rank": 1, "category": "Hardcover Fiction", "bestsellers_date": "2023-1-9"},
+            {"title": "Book 2", "rank": 2, "category": "Picture Books", "bestsellers_date": "2023-01-16"}]
+    json_file = tmpdir.join("best_sellers.json")
+    json_file.write(json.dumps(data))
+    output_dir = str(tmpdir.join("best_sellers"))
+
+    best_sellers_to_parquet(str(json_file), output_dir)
+
+    assert os.path.isdir(os.path.join(output_dir, "year=2023", "week=2", "category=Hardcover%20Fiction"))
+    df = read_parquet_table(output_dir, columns=['title', 'rank'], filters=[('category', '=', 'Picture Books')])
+    assert df.to_dict('records') == [{"title": "Book 2", "rank": 2}]
+
+
+# Test that the book table, with its list columns, is stored and read back.
+def test_book_to_parquet_round_trip(tmpdir):
+    data = [{"id": 1, "url": "https://www.amazon.com/1", "title": "Book 1", "price": ["0.00", "$7.85"], "genre": "Fiction"},
+            {"id": 2, "url": "https://www.amazon.com/2", "title": "Book 2", "price": ["$9.99"], "genre": None}]
+    json_file = tmpdir.join("book.json")
+    json_file.write(json.dumps(data))
+    output_file = str(tmpdir.join("book.parquet"))
+
+    book_to_parquet(str(json_file), output_file)
+
+    df = read_parquet_table(output_file, columns=['id', 'price'])
+    assert list(df.columns) == ['id', 'price']
+    assert [list(prices) for prices in df['price']] == [["0.00", "$7.85"], ["$9.99"]]
+
+
+# Test that the rank table is read back with its original columns and types, without the technical partition columns.
+def test_rank_to_parquet_round_trip(tmpdir):
+    rank_csv = tmpdir.join("rank.csv")
+    rank_csv.write(rank_csv_data)
+    output_dir = str(tmpdir.join("rank"))
+
+    rank_to_parquet(str(rank_csv), output_dir)
+    df = read_parquet_table(output_dir).sort_values(['date', 'id_book']).reset_index(drop=True)
+
+    assert set(df.columns) == {'id_book', 'date', 'category', 'rank', 'rank_last_week', 'weeks_on_list'}
+    assert df['category'].dtype == object
+    assert df[['id_book', 'date', 'category', 'rank']].values.tolist() == [
+        [1, '2023-01-09', 'Hardcover Fiction', 1], [2, '2023-01-09', 'Picture Books', 3], [1, '2023-01-16', 'Hardcover Fiction', 2]]
+
+
+# Test that only the partitions of the requested week are read.
+def test_read_parquet_table_partition_filter(tmpdir):
+    rank_csv = tmpdir.join("rank.csv")
+    rank_csv.write(rank_csv_data)
+    output_dir = str(tmpdir.join("rank"))
+
+    rank_to_parquet(str(rank_csv), output_dir)
+    df = read_parquet_table(output_dir, columns=['id_book', 'week'], filters=[('year', '=', 2023), ('week', '=', 3)])
+
+    assert df.to_dict('records') == [{'id_book': 1, 'week': 3}]
+
+
+# Test that the reviews of a book are read from its partition only.
+def test_read_reviews_parquet_by_book(tmpdir):
+    review_csv = tmpdir.join("review.csv")
+    review_csv.write(review_csv_data)
+    output_dir = str(tmpdir.join("review"))
+
+    review_to_parquet(str(review_csv), output_dir)
+    df = read_reviews_parquet(output_dir, id_books=[1500], columns=['id_book', 'id_review', 'stars'])
+
+    assert sorted(os.listdir(output_dir)) == ['book_bucket=0', 'book_bucket=1']
+    assert df.to_dict('records') == [{'id_book': 1500, 'id_review': 1, 'stars': 3.0}]
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 2026-10-19
+
+@author: Roland
+
+@abstract: create for the 'records.py' source file,
+    2 unit tests for the 'Book' class,
+    2 unit tests for the 'Rank' class,
+    1 unit test for the 'Review' class,
+    1 unit test for the 'parse_stars' function,
+    2 unit tests for the 'merge_book_data' function.
+"""
+
+import os
+import sys
+import pytest
+
+# Getting the absolute path of the current script file
+current_script_path = os.path.abspath(__file__)
+# Getting the directory of the current script file
+current_script_dir = os.path.dirname(current_script_path)
+# Constructing the absolute path of the project root
+root_dir = os.path.join(current_script_dir, '../..')
+sys.path.append(root_dir)
+from src.data_ingestion.records import Book, Rank, Review, merge_book_data, parse_stars
+
+
+# Test that a book is serialized with the keys of the book table, in order, and has no instance dictionary.
+def test_book_to_dict():
+    book = Book(1, "https://www.amazon.com/1", "Title", "Author", ["1"], ["978"], ["nyt://book/1"], "by Author", ["Description"],
+                "Publisher", ["0.00"], 0, [0], "Fiction", reviews_count=10)
+
+    assert list(book.to_dict())[:4] == ["id", "url", "title", "author"]
+    assert book.to_dict()["reviews_count"] == 10
+    assert book.to_dict()["language"] is None
+    assert not hasattr(book, "__dict__")
+
+
+# Test that a book id must be an integer.
+def test_book_wrong_id_type():
+    with pytest.raises(TypeError, match="id must be an integer"):
+        Book("1", "https://www.amazon.com/1", "Title", "Author", [], [], [], "", [], "", [], 0, [], "")
+
+
+# Test that a rank is serialized as a CSV row in the order of its columns.
+def test_rank_to_row():
+    rank = Rank(1, "2023-07-17", "Fiction", 1, 2, 12)
+
+    assert dict(zip(Rank.COLUMNS, rank.to_row())) == {"id_book": 1, "date": "2023-07-17", "category": "Fiction", "rank": 1,
+                                                      "rank_last_week": 2, "weeks_on_list": 12}
+
+
+# Test that the field types of a rank are validated at construction.
+def test_rank_wrong_type():
+    with pytest.raises(TypeError, match="rank must be an integer"):
+        Rank(1, "2023-07-17", "Fiction", "1", 2, 12)
+    with pytest.raises(TypeError, match="bestsellers_date must be a string"):
+        Rank(1, None, "Fiction", 1, 2, 12)
+
+
+# Test that a review is serialized as a CSV row in the order of its columns.
+def test_review_to_row():
+    review = Review(1, 2, "5.0", "Title", "Text", None)
+
+    assert review.to_row() == [1, 2, "5.0", "Title", "Text", None]
+    assert len(Review.COLUMNS) == len(review.to_row())
+
+
+# Test that the scraped stars are converted into integers, an empty or invalid value into None.
+def test_parse_stars():
+    assert parse_stars("5.0") == 5
+    assert parse_stars("4") == 4
+    assert parse_stars(3.0) == 3
+    assert parse_stars("") is None
+    assert parse_stars(None) is None
+    assert parse_stars("n/a") is None
+
+
+# Test that the list fields of a book accumulate the stored and new values, the new scalars win, and an empty genre keeps the known one.
+def test_merge_book_data():
+    stored = {"title": "Old", "isbn13": ["978"], "price": ["0.00", "$7.85"], "genre": "Kids", "reviews_count": 10}
+    new = {"title": "New", "isbn13": ["979", "978"], "price": ["9.99"], "genre": ""}
+
+    assert merge_book_data(stored, new) == {"title": "New", "isbn13": ["978", "979"], "price": ["0.00", "$7.85", "9.99"], "genre": "Kids", "reviews_count": 10}
+    assert merge_book_data(stored, {"genre": "Fiction"})["genre"] == "Fiction"
+
+
+# Test that every Amazon URL of a book is kept when a new page of it is merged, the new URL being the current one.
+def test_merge_book_data_urls():
+    merged = merge_book_data({"url": "https://www.amazon.com/1"}, {"url": "https://www.amazon.com/2"})
+    merged = merge_book_data(merged, {"url": "https://www.amazon.com/3"})
+
+    assert merged == {"url": "https://www.amazon.com/3", "urls": ["https://www.amazon.com/1", "https://www.amazon.com/2", "https://www.amazon.com/3"]}
+    assert "urls" not in merge_book_data({"url": "https://www.amazon.com/1"}, {"url": "https://www.amazon.com/1"})
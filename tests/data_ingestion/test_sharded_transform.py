@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 2026-10-19
+
+@author: Roland
+
+@abstract: create for the 'sharded_transform.py' source file,
+    1 unit test for the 'assign_book_ids' function,
+    1 unit test for the 'partition_inputs' function,
+    2 unit tests for the 'sharded_transform' function.
+"""
+
+import os
+import sys
+import json
+import pytest
+
+# Getting the absolute path of the current script file
+current_script_path = os.path.abspath(__file__)
+# Getting the directory of the current script file
+current_script_dir = os.path.dirname(current_script_path)
+# Constructing the absolute path of the project root
+root_dir = os.path.join(current_script_dir, '../..')
+sys.path.append(root_dir)
+from src.data_ingestion.extract_transform import combine_book_data, write_rank, write_reviews
+from src.data_ingestion.sharded_transform import assign_book_ids, partition_inputs, shard_of, sharded_transform
+
+
+def best_seller_record(number, date, rank):
+    return {"amazon_product_url": f"https://www.amazon.com/dp/{number}" if number else None,
+            "title": f"BOOK {number}", "author": f"Author {number}", "contributor": f"by Author {number}",
+            "publisher": "Compendium", "dagger": 0, "asterisk": 0, "price": "0.00", "description": f"Description {number}",
+            "isbns": [{"isbn10": f"{number}000000000", "isbn13": f"978{number}000000000"}], "book_uri": f"nyt://book/{number}",
+            "buy_links": [{"name": "Apple Books", "url": f"https://goto.applebooks.apple/{number}"}],
+            "category": "Picture Books", "bestsellers_date": date, "rank": rank, "rank_last_week": 0, "weeks_on_list": 1}
+
+
+# Raw data of 8 books over 2 weeks, half of them with Amazon data and reviews
+@pytest.fixture
+def raw_files(tmpdir):
+    best_sellers = [best_seller_record(number, date, rank) for date in ["2023-1-9", "2023-1-16"] for rank, number in enumerate([5, 3, 0, 8, 1, 7, 2, 6, 4], start=1)]
+    amazon = [{"url": f"https://www.amazon.com/dp/{number}", "rating": "1,000", "number_of_stars": "4.5", "price": "$7.85",
+               "number_of_pages": "40", "language": "English", "publication_date": "2017-03-01", "reviews_count": 10, "random_pages_count": 0,
+               "reviews": [{"stars": "5.0", "title": f"title {number}", "text": "text", "date": f"Reviewed in the United States on April {number}, 2023"}]}
+              for number in [2, 4, 6, 8, 9]]
+    tmpdir.join("best_sellers.json").write(json.dumps(best_sellers))
+    tmpdir.join("amazon.json").write(json.dumps(amazon))
+    tmpdir.join("apple.csv").write("url,genre\nhttps://goto.applebooks.apple/2,Kids\n")
+    return {name: str(tmpdir.join(name)) for name in ["best_sellers.json", "amazon.json", "apple.csv"]}
+
+
+# Test that the ids follow the order of first appearance, after the ids already assigned.
+def test_assign_book_ids(raw_files):
+    url_to_id = assign_book_ids(raw_files["best_sellers.json"], {"https://www.amazon.com/dp/3": 1}, next_id=2)
+
+    assert list(url_to_id.items())[:3] == [("https://www.amazon.com/dp/3", 1), ("https://www.amazon.com/dp/5", 2), ("https://www.amazon.com/dp/8", 3)]
+    assert len(url_to_id) == 8
+
+
+# Test that all the records of a book are in the shard of its URL.
+def test_partition_inputs(raw_files, tmpdir):
+    paths = partition_inputs(raw_files["best_sellers.json"], raw_files["amazon.json"], str(tmpdir), 3)
+
+    count = 0
+    for shard, (best_sellers_jsonl, amazon_jsonl) in enumerate(paths):
+        with open(best_sellers_jsonl, encoding='utf-8') as f:
+            records = [json.loads(line) for line in f]
+        assert all(shard_of(record["amazon_product_url"], 3) == shard for _, record in records)
+        count += len(records)
+
+    assert count == 16
+
+
+# Test that the sharded transform gives the same files as the serial functions.
+def test_sharded_transform_same_as_serial(raw_files, tmpdir):
+    combine_book_data(raw_files["best_sellers.json"], raw_files["amazon.json"], raw_files["apple.csv"], str(tmpdir.join("book.json")))
+    write_rank(raw_files["best_sellers.json"], str(tmpdir.join("book.json")), str(tmpdir.join("rank.csv")))
+    write_reviews(raw_files["amazon.json"], str(tmpdir.join("book.json")), str(tmpdir.join("review.csv")))
+
+    sharded_transform(raw_files["best_sellers.json"], raw_files["amazon.json"], raw_files["apple.csv"], str(tmpdir.join("sharded_book.json")),
+                      str(tmpdir.join("sharded_rank.csv")), str(tmpdir.join("sharded_review.csv")), shards=3, max_workers=2, work_dir=str(tmpdir))
+
+    for name in ["book.json", "rank.csv", "review.csv"]:
+        assert tmpdir.join(f"sharded_{name}").read() == tmpdir.join(name).read()
+
+
+# Test that the reviews of an Amazon URL present twice in the merged file are numbered after each other, as by the serial functions.
+def test_sharded_transform_duplicate_url_same_as_serial(raw_files, tmpdir):
+    with open(raw_files["amazon.json"], encoding='utf-8') as f:
+        amazon = json.load(f)
+    amazon.append(dict(amazon[0], reviews=[{"stars": "4.0", "title": "title 2 bis", "text": "text", "date": "Reviewed in the United States on May 2, 2023"},
+                                            {"stars": "3.0", "title": "title 2 ter", "text": "text", "date": "Reviewed in the United States on May 3, 2023"}]))
+    tmpdir.join("amazon.json").write(json.dumps(amazon))
+
+    combine_book_data(raw_files["best_sellers.json"], raw_files["amazon.json"], raw_files["apple.csv"], str(tmpdir.join("book.json")))
+    write_reviews(raw_files["amazon.json"], str(tmpdir.join("book.json")), str(tmpdir.join("review.csv")))
+    sharded_transform(raw_files["best_sellers.json"], raw_files["amazon.json"], raw_files["apple.csv"], str(tmpdir.join("sharded_book.json")),
+                      str(tmpdir.join("sharded_rank.csv")), str(tmpdir.join("sharded_review.csv")), shards=3, max_workers=2, work_dir=str(tmpdir))
+
+    reviews = tmpdir.join("sharded_review.csv").read().splitlines()[1:]
+    assert tmpdir.join("sharded_review.csv").read() == tmpdir.join("review.csv").read()
+    assert [review.split(",")[1] for review in reviews if review.split(",")[3].startswith("title 2")] == ["1", "2", "3"]
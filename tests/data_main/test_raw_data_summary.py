@@ -6,8 +6,8 @@ Created on 2023-07-25
 @author: Roland
 
 @abstract: create for the 'raw_data_summary.py' source file,
-    4 unit tests for the 'checking_for_a_new_bestseller' function
-    3 unit tests for the 'data_collection' function
+    8 unit tests for the 'checking_for_a_new_bestseller' function
+    4 unit tests for the 'data_collection' function
 """
 
 import os
@@ -30,6 +30,8 @@ src_dir = os.path.join(root_dir, 'src', 'data_main')
 # Adding the absolute path to system path
 sys.path.append(src_dir)
 from raw_data_summary import checking_for_a_new_bestseller, data_collection
+import json_tools as jt
+from src.data_ingestion.identity_index import IdentityIndex
 
 
 # Pre-existing bestsellers in the database.
@@ -79,14 +81,16 @@ def test_empty_nyt_file(setup_db, tmpdir_factory):
     nyt_file = tmpdir_factory.mktemp("data").join("empty_nyt_bestsellers.json")
     nyt_file.write(json.dumps([]))
 
-    with pytest.raises(IndexError):
-        checking_for_a_new_bestseller(str(nyt_file), setup_db)
+    new_id, new_url = checking_for_a_new_bestseller(str(nyt_file), setup_db)
+
+    # There is nothing to scrape
+    assert new_url is None
 
 
 # Test the function when all bestsellers in the New York Times file have already been scraped.
 def test_all_bestsellers_already_scraped(setup_nyt_file, setup_db):
     # Overwrite the database to include all bestsellers in the New York Times file.
-    with setup_db.connect() as connection:
+    with setup_db.begin() as connection:
         connection.execute(text("DELETE FROM book;"))
         with open(setup_nyt_file, 'r') as file:
             nyt_data = json.load(file)
@@ -94,6 +98,8 @@ def test_all_bestsellers_already_scraped(setup_nyt_file, setup_db):
                 connection.execute(text("INSERT INTO book (id, data) VALUES (:id, :data);"),
                                    {"id": i, "data": json.dumps({"url": data['amazon_product_url']})})
 
+    assert checking_for_a_new_bestseller(setup_nyt_file, setup_db) == (len(nyt_data) + 1, None)
+
 
 # Test the function when the database is empty.
 def test_empty_database(setup_nyt_file, tmpdir_factory):
@@ -112,6 +118,61 @@ def test_empty_database(setup_nyt_file, tmpdir_factory):
     assert new_url in [data['amazon_product_url'] for data in nyt_data]
 
 
+# Test that the URLs are looked up by batches, and that the first URL not yet scraped is found in a later batch.
+def test_new_bestseller_in_later_batch(tmpdir_factory):
+    engine = create_engine("sqlite:///:memory:")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE book (id INTEGER PRIMARY KEY, data JSON);"))
+        for id_book, url in [(1, "https://amazon.com/a"), (7, "https://amazon.com/b")]:
+            connection.execute(text("INSERT INTO book (id, data) VALUES (:id, :data);"), {"id": id_book, "data": json.dumps({"url": url})})
+    nyt_file = tmpdir_factory.mktemp("data").join("nyt_bestsellers.json")
+    nyt_file.write(json.dumps([{"amazon_product_url": url} for url in ["https://amazon.com/a", "https://amazon.com/b", "https://amazon.com/c", "https://amazon.com/d"]]))
+
+    with patch('raw_data_summary.URL_BATCH_SIZE', 2):
+        new_id, new_url = checking_for_a_new_bestseller(str(nyt_file), engine)
+
+    assert (new_id, new_url) == (8, "https://amazon.com/c")
+
+
+# Test that the bestsellers without Amazon URL are skipped, rather than looked up or returned.
+def test_bestsellers_without_amazon_url(tmpdir_factory):
+    engine = create_engine("sqlite:///:memory:")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE book (id INTEGER PRIMARY KEY, data JSON);"))
+        connection.execute(text("INSERT INTO book (id, data) VALUES (1, :data);"), {"data": json.dumps({"url": "https://amazon.com/a"})})
+    nyt_file = tmpdir_factory.mktemp("data").join("nyt_bestsellers.json")
+    nyt_file.write(json.dumps([{"amazon_product_url": None}, {"amazon_product_url": "https://amazon.com/a"}, {}]))
+
+    assert checking_for_a_new_bestseller(str(nyt_file), engine) == (2, None)
+
+
+# Test that the URLs known to the identity index are not scraped again, whatever their tracking parameters.
+def test_bestsellers_known_to_identity_index(tmpdir_factory):
+    engine = create_engine("sqlite:///:memory:")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE book (id INTEGER PRIMARY KEY, data JSON);"))
+        connection.execute(text("INSERT INTO book (id, data) VALUES (1, :data);"), {"data": json.dumps({"url": "https://amazon.com/dp/0000000001"})})
+    nyt_file = tmpdir_factory.mktemp("data").join("nyt_bestsellers.json")
+    nyt_file.write(json.dumps([{"amazon_product_url": url} for url in ["https://amazon.com/dp/0000000002?tag=NYT", "https://amazon.com/dp/0000000003"]]))
+    identity_index = IdentityIndex()
+    identity_index.book_id({"amazon_product_url": "https://amazon.com/dp/0000000002"})
+
+    assert checking_for_a_new_bestseller(str(nyt_file), engine, identity_index) == (2, "https://amazon.com/dp/0000000003")
+
+
+# Test that the earlier Amazon URLs of a book merged from several pages are not scraped again.
+def test_bestsellers_earlier_url_of_merged_book(tmpdir_factory):
+    engine = create_engine("sqlite:///:memory:")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE book (id INTEGER PRIMARY KEY, data JSON);"))
+        connection.execute(text("INSERT INTO book (id, data) VALUES (1, :data);"),
+                           {"data": json.dumps({"url": "https://amazon.com/b", "urls": ["https://amazon.com/a", "https://amazon.com/b"]})})
+    nyt_file = tmpdir_factory.mktemp("data").join("nyt_bestsellers.json")
+    nyt_file.write(json.dumps([{"amazon_product_url": url} for url in ["https://amazon.com/a", "https://amazon.com/b", "https://amazon.com/c"]]))
+
+    assert checking_for_a_new_bestseller(str(nyt_file), engine) == (2, "https://amazon.com/c")
+
+
 # This test is checking the functionality of the data_collection function when it is used normally
 def get_nyt_file_name(year, month, day):
     return RAW_DATA_ABS_PATH + f'best_sellers_{year}_{month}_{day}.json'
@@ -208,8 +269,35 @@ def test_data_collection_no_amazon_url(mock_scrape_apple_store_book, mock_scrape
     # Ensure the directory exists.
     os.makedirs(RAW_DATA_ABS_PATH, exist_ok=True)
 
-    data_collection(year, month, day, setup_db)
+    assert data_collection(year, month, day, setup_db) is False
 
     assert os.path.isfile(get_nyt_file_name(year, month, day))  # this will now check that the NYT file is created
     assert not os.path.isfile(RAW_DATA_ABS_PATH + 'raw_data.json')  # this will check that raw_data.json is not created
 
+
+# Test that the NYT file is read once, for the Amazon URLs, the selected item and its Apple Books URL
+@patch('raw_data_summary.checking_for_a_new_bestseller')
+@patch('raw_data_summary.amazon.scrape_amazon_books')
+@patch('raw_data_summary.apple.scrape_apple_store_book')
+def test_data_collection_reads_nyt_file_once(mock_scrape_apple_store_book, mock_scrape_amazon_books, mock_checking_for_a_new_bestseller, setup_db):
+    year, month, day = 2023, 6, 26
+    mock_checking_for_a_new_bestseller.return_value = (1, "amazon_url_2")
+    mock_scrape_amazon_books.return_value = "amazon_data"
+    mock_scrape_apple_store_book.return_value = "apple_data"
+    os.makedirs(RAW_DATA_ABS_PATH, exist_ok=True)
+    data = [{'amazon_product_url': 'amazon_url_1', 'buy_links': [{'name': 'Apple Books', 'url': 'apple_url_1'}]},
+            {'amazon_product_url': 'amazon_url_2', 'buy_links': [{'name': 'Apple Books', 'url': 'apple_url_2'}]}]
+    with open(get_nyt_file_name(year, month, day), 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+
+    with patch('raw_data_summary.jt.iter_json_array', wraps=jt.iter_json_array) as mock_iter_json_array:
+        assert data_collection(year, month, day, setup_db) is True
+
+    mock_iter_json_array.assert_called_once()
+    assert list(mock_checking_for_a_new_bestseller.call_args.kwargs['amazon_urls']) == ['amazon_url_1', 'amazon_url_2']
+    mock_scrape_apple_store_book.assert_called_once_with('apple_url_2')
+    with open(RAW_DATA_ABS_PATH + 'raw_data.json', encoding='utf-8') as f:
+        assert json.load(f)['nyt_data'] == data[1]
+
+    # Clean up after test
+    os.remove(RAW_DATA_ABS_PATH + 'raw_data.json')
@@ -7,7 +7,7 @@ Created on 2023-07-25
 
 @abstract: create for the 'raw_data_transformation .py' source file,
     3 unit tests for the 'save_to_file' function
-    1 unit test for the 'extract_transform' function
+    3 unit tests for the 'extract_transform' function
     
 """
 
@@ -26,6 +26,7 @@ src_dir = os.path.join(current_script_dir, '../..')
 sys.path.append(src_dir)
 from src.data_main.raw_data_transformation import save_to_file, extract_transform
 from src.data_ingestion.extract_transform import create_a_book_table_item, create_a_rank_table_item, create_of_review_table_items
+from src.data_ingestion.identity_index import IdentityIndex
 from config import PROC_DATA_ABS_PATH
 
 
@@ -155,3 +156,35 @@ def test_extract_transform_success():
         assert mock_save.call_args_list[1] == call([['id_book', 'date', 'category', 'rank', 'rank_last_week', 'weeks_on_list'], [[[5832, 2012, 'Picture Books', 3, 7, 15]]]], PROC_DATA_ABS_PATH + 'rank.csv', 'csv')
         
         assert mock_save.call_args_list[2] == call([['id_book', 'id_review', 'stars', 'title', 'text', 'date'], [[5832,99,5.0,"the title of review 1","the text of review 1",'2023-04-24'], [5832,100,4.0,"the title of review 2","the text of review 2",'2023-04-25']]], PROC_DATA_ABS_PATH + 'review.csv', 'csv')
+
+
+# This test checks that the extract_transform function returns the table items for a direct load, without saving files when asked to
+def test_extract_transform_without_files():
+    with patch('src.data_main.raw_data_transformation.save_to_file') as mock_save:
+        book, ranks, reviews = extract_transform(5832, dict(nyt_data, isbns=[{"isbn10": "1943200084", "isbn13": "9781943200085"}]),
+                                                 amazon_data, apple_data, save_files=False)
+
+    mock_save.assert_not_called()
+    assert book == book_data
+    assert ranks == [[5832, '2023-6-5', 'Picture Books', 3, 7, 15]]
+    assert [review[-1] for review in reviews] == ['2023-04-24', '2023-04-25']
+    # The scraped stars ("5.0") are converted into the integers of the review table
+    assert [review[2] for review in reviews] == [5, 4]
+
+
+# This test checks that with an identity index, a new Amazon page of a known book keeps the id of that book, and a new book gets an id not below new_id
+def test_extract_transform_with_identity_index():
+    identity_index = IdentityIndex()
+    known_id = identity_index.book_id({"isbns": [{"isbn10": "1943200084", "isbn13": "9781943200085"}]})
+    record = dict(nyt_data, isbns=[{"isbn10": "1943200084", "isbn13": "9781943200085"}])
+
+    book, ranks, reviews = extract_transform(5832, record, amazon_data, apple_data, save_files=False, identity_index=identity_index)
+
+    assert book["id"] == known_id
+    assert {rank[0] for rank in ranks} | {review[0] for review in reviews} == {known_id}
+
+    other_record = dict(nyt_data, isbns=[], primary_isbn10="0000000000", primary_isbn13="9780000000000", book_uri="nyt://book/other",
+                        amazon_product_url="https://www.amazon.com/dp/0000000000")
+    book, _, _ = extract_transform(5832, other_record, amazon_data, apple_data, save_files=False, identity_index=identity_index)
+
+    assert book["id"] == 5832
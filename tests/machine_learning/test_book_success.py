@@ -7,7 +7,8 @@ Created on 2023-08-13
 
 @abstract: create for the 'book_success.py' source file,
     2 unit tests for the 'sql_query_to_create_dataset' function
-    8 unit tests for the 'dataset_cleaning' function
+    1 unit test for the 'parquet_to_create_dataset' function
+    9 unit tests for the 'dataset_cleaning' function
     3 unit tests for the 'target_combination' function
     9 unit tests for the variable previews (3 functions)
     5 unit tests for the 'preprocessing' function
@@ -31,11 +32,14 @@ import plotly.graph_objs as go
 current_script_path = os.path.abspath(__file__)
 # Getting the directory of the current script file
 current_script_dir = os.path.dirname(current_script_path)
+# Constructing the absolute path of the project root
+root_dir = os.path.join(current_script_dir, '../..')
+sys.path.append(root_dir)
 # Constructing the absolute path of the src/01_data_collection directory
 src_dir = os.path.join(current_script_dir, '../..', 'src', 'machine_learning')
 # Adding the absolute path to system path
 sys.path.append(src_dir)
-from book_success import sql_query_to_create_dataset, dataset_cleaning, target_combination, create_heatmap, create_3D_scatter, create_box_plot, preprocessing, regression_model, plot_actual_vs_predicted_values, plot_feature_importances, plot_predicted_values_vs_residual
+from book_success import sql_query_to_create_dataset, parquet_to_create_dataset, dataset_cleaning, target_combination, create_heatmap, create_3D_scatter, create_box_plot, preprocessing, regression_model, plot_actual_vs_predicted_values, plot_feature_importances, plot_predicted_values_vs_residual
 
 
 def test_sql_query_to_create_dataset_valid_output(mocker):
@@ -84,6 +88,27 @@ def test_sql_query_to_create_dataset_empty_output(mocker):
     assert result_df.empty
 
 
+# Test that the dataset built from the Parquet storage layer has the columns of the SQL dataset and the right aggregates.
+def test_parquet_to_create_dataset(tmpdir):
+    pytest.importorskip("pyarrow")
+    books = pd.DataFrame([{"id": 1, "title": "Book 1", "author": "Author 1", "genre": "Fiction", "price": ["0.00", "$7.85"],
+                           "dagger": 0, "asterisk": [0], "rating": "4,373", "number_of_stars": "4.9", "number_of_pages": "40",
+                           "reviews_count": 497, "language": "English"}])
+    books.to_parquet(str(tmpdir.join("book.parquet")), index=False)
+    pd.DataFrame({"id_book": [1, 1], "date": ["2023-01-09", "2023-01-16"], "category": ["Fiction", "Fiction"],
+                  "rank": [3, 1], "rank_last_week": [0, 3], "weeks_on_list": [1, 2]}).to_parquet(str(tmpdir.join("rank.parquet")), index=False)
+    pd.DataFrame({"id_book": [1] * 12, "id_review": list(range(1, 13)), "stars": [4.0] * 10 + [1.0] * 2}).to_parquet(str(tmpdir.join("review.parquet")), index=False)
+
+    df = parquet_to_create_dataset(str(tmpdir.join("book.parquet")), str(tmpdir.join("rank.parquet")), str(tmpdir.join("review.parquet")))
+
+    assert list(df.columns) == ['id', 'title', 'author', 'genre', 'price', 'dagger', 'asterisk', 'rating', 'number_of_stars',
+                                'number_of_pages', 'reviews_count', 'mean_first_stars', 'best_ranking', 'max_weeks']
+    assert df.loc[0, 'price'] == '["0.00","$7.85"]'
+    assert df.loc[0, 'mean_first_stars'] == 4.0
+    assert df.loc[0, 'best_ranking'] == 1
+    assert df.loc[0, 'max_weeks'] == 2
+
+
 # Sample Data
 sample_data = {
     'rating': [',45', '45,', '67'],
@@ -175,6 +200,23 @@ def test_dataset_cleaning_unnecessary_columns(sample_dataframe):
     assert 'price' not in df.columns
 
 
+# Test that the typed columns of the database (numeric rating, stars and review count, max_price) are used as they are, without parsing the prices.
+def test_dataset_cleaning_typed_columns(sample_dataframe):
+    df = sample_dataframe.copy()
+    df['rating'] = [np.nan, 45.0, 67.0]
+    df['number_of_stars'] = [np.nan, 4.0, 5.0]
+    df['reviews_count'] = [np.nan, 23.0, 45.0]
+    df['price'] = None
+    df['max_price'] = [15.89, 10.5, 5.67]
+
+    cleaned_df = dataset_cleaning(df)
+
+    assert list(cleaned_df.columns) == list(dataset_cleaning(sample_dataframe.copy()).columns)
+    assert cleaned_df['max_price'].tolist() == [5.67, 10.5]
+    assert cleaned_df['rating'].tolist() == [67, 45]
+
+
+
 def test_combined_target_column():
     df = pd.DataFrame({
         'best_ranking': [1, 2, 3, 4],